@@ -0,0 +1,72 @@
+import functools
+from typing import Any
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from users.models import UserAccount
+from stores.models import Store
+from products.models import Product
+from products.signals import products_imported
+from sales.models import Sale, Checkout
+from .utils import invalidate_dashboard_summary
+
+
+
+def _get_owner_pk(instance: Store | Product | Sale | Checkout) -> Any:
+    """Returns the primary key of the owner of the store the instance belongs to."""
+    if isinstance(instance, Store):
+        return instance.owner_id
+    if type(instance).store.is_cached(instance):
+        return instance.store.owner_id
+    return Store.objects.filter(pk=instance.store_id).values_list("owner_id", flat=True).first()
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Sale)
+@receiver(post_save, sender=Checkout) # Sales recorded at checkout are bulk created, without signals
+@receiver(post_delete, sender=Store)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Sale)
+def invalidate_owner_dashboard_summary(sender, instance, origin=None, **kwargs) -> None:
+    """Invalidates the dashboard summary of the store owner once changes to stores, products or sales are committed."""
+    if origin is not None and origin is not instance and isinstance(origin, (Store, Product)):
+        # Deleted in cascade. The deletion of the origin invalidates the summary.
+        return None
+    owner_pk = _get_owner_pk(instance)
+    if owner_pk is not None:
+        transaction.on_commit(functools.partial(invalidate_dashboard_summary, owner_pk))
+    return None
+
+
+@receiver(products_imported)
+def invalidate_owner_dashboard_summary_on_import(sender, store: Store, **kwargs) -> None:
+    """Invalidates the dashboard summary of the store owner once imported products are committed."""
+    transaction.on_commit(functools.partial(invalidate_dashboard_summary, store.owner_id))
+    return None
+
+
+# Fields of the user that the dashboard summary depends on
+USER_SUMMARY_FIELDS = ("timezone", "preferred_currency")
+
+
+@receiver(pre_save, sender=UserAccount)
+def check_user_summary_fields_change(sender, instance: UserAccount, update_fields=None, **kwargs) -> None:
+    """Notes whether any of the user's fields that the dashboard summary depends on are being changed."""
+    if instance._state.adding or (update_fields is not None and not set(USER_SUMMARY_FIELDS) & set(update_fields)):
+        instance._summary_fields_changed = False
+        return None
+    old_values = UserAccount.objects.filter(pk=instance.pk).values_list(*USER_SUMMARY_FIELDS).first()
+    new_values = tuple(getattr(instance, field) for field in USER_SUMMARY_FIELDS)
+    instance._summary_fields_changed = old_values is not None and tuple(map(str, old_values)) != tuple(map(str, new_values))
+    return None
+
+
+@receiver(post_save, sender=UserAccount)
+def invalidate_user_dashboard_summary(sender, instance, **kwargs) -> None:
+    """Invalidates the user's dashboard summary once changes to the user's timezone or preferred currency are committed."""
+    if not getattr(instance, "_summary_fields_changed", False):
+        return None
+    transaction.on_commit(functools.partial(invalidate_dashboard_summary, instance.pk))
+    return None
@@ -52,7 +52,7 @@ filtersCardForm.addEventListener("change", () => {
  * @param {string} processURL The url to send the form data to for processing
  * @param {object} formData The form data to send to the server
  * @param {function} callback The callback function to run after processing the form
- * @returns {object} result
+ * @returns {object} results
  */
 function processFormData(processURL, formData, callback){
     const options = {
@@ -74,9 +74,9 @@ function processFormData(processURL, formData, callback){
 
         }else{
             response.json().then((data) => {
-                const result  = data.data.result ?? null;
-                if(result === null) return;
-                callback(result);
+                const results  = data.data.results ?? null;
+                if(results === null) return;
+                callback(results);
             });
         }
     });
@@ -84,32 +84,35 @@ function processFormData(processURL, formData, callback){
 
 
 /**
- * Processes filters selected in the filters form and returns the result
+ * Processes filters selected in the filters form and returns the results.
+ * The sales and revenue statistics for the filters are requested together, in one batched request.
  * @param {string} processURL The url to send the form data to for processing
  * @param {HTMLFormElement} filtersForm The filters form to process
- * @param {function} callback The callback function to pass the result of the form processing to
- * @returns {object} result 
+ * @param {function} callback The callback function to pass the results of the form processing to
+ * @returns {object} results 
  */
 function processFilters(processURL, filtersForm, callback){
-    const formData = filtersForm.getData();
-
-    if (filtersForm.dataset.stattype === 'sales'){
-        formData['statType'] = "sales";
-    }else{
-        formData['statType'] = "revenue";
-    }
+    const filters = filtersForm.getData();
+    const formData = {
+        stats: [
+            {id: 'sales-card', statType: 'sales', filters: filters},
+            {id: 'revenue-card', statType: 'revenue', filters: filters},
+        ]
+    };
     return processFormData(processURL, formData, callback);
 }
 
 
 /**
- * Makes a result callback function that updates the result element with the result
- * @param {HTMLElement} resultElement The element whose text content will be updated with the result
+ * Makes a results callback function that updates the stat cards with the results
  * @returns callback function
  */
-function makeResultCallback(resultElement){
-    return (result) => {
-        resultElement.textContent = result;
+function makeResultsCallback(){
+    return (results) => {
+        for (const [cardId, result] of Object.entries(results)) {
+            const resultElement = document.querySelector(`.stat-card#${cardId} .stat-value`);
+            if (resultElement) resultElement.textContent = result;
+        }
     };
 }
 
@@ -118,17 +121,7 @@ filtersCardApplyBtn.addEventListener('click', () => {
     filtersCardForm.reportValidity();
     if (!filtersCardForm.checkValidity()) return;
 
-    let resultElement;
-    if(filtersCard.getTitle().includes("sales")){
-        filtersCardForm.dataset.stattype = "sales";
-        resultElement = document.querySelector('.stat-card#sales-card .stat-value');
-    }else{
-        filtersCardForm.dataset.stattype = "revenue";
-        resultElement = document.querySelector('.stat-card#revenue-card .stat-value');
-    }
-
-    const callback = makeResultCallback(resultElement);
+    const callback = makeResultsCallback();
     processFilters(filtersProcessURL, filtersCardForm, callback);
     filtersCard.close();
 });
-
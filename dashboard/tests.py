@@ -1,3 +1,166 @@
-from django.test import TestCase
+import json
+import uuid
+from unittest import mock
+from django.test import TestCase, RequestFactory
+from django.utils import timezone
+from djmoney.money import Money
 
-# Create your tests here.
+from users.models import UserAccount
+from stores.models import Store
+from products.models import Product
+from sales.models import Sale
+from .utils import get_dashboard_summary, get_dashboard_summary_version
+from .views import dashboard_stats_view, dashboard_time_series_view
+from . import views
+
+
+class DashboardStatisticsViewTestCase(TestCase):
+    """Checks that batched dashboard statistics are aggregated together, for the user's stores only."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.other_store = Store.objects.create(name="Other Store", owner=cls.user)
+        product = Product.objects.create(name="Test Product", price=Money(100, "NGN"), quantity=20, store=cls.store)
+        other_product = Product.objects.create(name="Other Product", price=Money(50, "NGN"), quantity=20, store=cls.other_store)
+        Sale.objects.create(store=cls.store, product=product, quantity=2)
+        Sale.objects.create(store=cls.other_store, product=other_product, quantity=1)
+
+        cls.stranger = UserAccount.objects.create_user("stranger@example.com", "password", firstname="Some", lastname="Stranger")
+        cls.foreign_store = Store.objects.create(name="Foreign Store", owner=cls.stranger)
+
+
+    def get_statistics(self, stats):
+        request = RequestFactory().post("/", json.dumps({"stats": stats}), content_type="application/json")
+        request.user = self.user
+        return dashboard_stats_view(request)
+
+
+    def test_stats_with_the_same_filters_are_aggregated_together(self):
+        filters = {"store_pks": [str(self.store.pk)]}
+        with mock.patch.object(views, "aggregate_sales_statistics", wraps=views.aggregate_sales_statistics) as aggregate:
+            response = self.get_statistics([
+                {"id": "sales", "statType": "sales", "filters": filters},
+                {"id": "revenue", "statType": "revenue", "filters": filters},
+                {"id": "all-sales", "statType": "sales"},
+            ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aggregate.call_count, 2)
+        results = json.loads(response.content)["data"]["results"]
+        self.assertEqual(results["sales"], 1)
+        self.assertEqual(results["all-sales"], 2)
+        self.assertTrue(results["revenue"].endswith("200.00"))
+
+
+    def test_foreign_or_unknown_stores_are_rejected(self):
+        for store_pks in ([str(self.foreign_store.pk)], [str(self.store.pk), str(uuid.uuid4())], ["not-a-store"]):
+            with self.subTest(store_pks=store_pks):
+                response = self.get_statistics([{"statType": "sales", "filters": {"store_pks": store_pks}}])
+                self.assertEqual(response.status_code, 400)
+
+
+    def test_malformed_stats_are_rejected(self):
+        for stats in ("notalist", ["sales"], [{"statType": "sales", "filters": "notadict"}]):
+            with self.subTest(stats=stats):
+                self.assertEqual(self.get_statistics(stats).status_code, 400)
+
+
+    def test_malformed_filters_are_rejected(self):
+        for stat_type in ("sales", "revenue", "products"):
+            for filters in (
+                {"date": "bad"},
+                {"from_date": "2024-13-01"},
+                {"to_date": 20240101},
+                {"from_time": "noon"},
+                {"categories": "food"},
+                {"categories": [1]},
+                {"store_pks": str(self.store.pk)},
+            ):
+                with self.subTest(stat_type=stat_type, filters=filters):
+                    response = self.get_statistics([{"statType": stat_type, "filters": filters}])
+                    self.assertEqual(response.status_code, 400)
+
+
+
+class DashboardTimeSeriesViewTestCase(TestCase):
+    """Checks that the time series of the dashboard charts are only returned for valid requests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        product = Product.objects.create(name="Test Product", price=Money(100, "NGN"), quantity=20, store=cls.store)
+        Sale.objects.create(store=cls.store, product=product, quantity=2)
+
+        cls.stranger = UserAccount.objects.create_user("stranger@example.com", "password", firstname="Some", lastname="Stranger")
+        cls.foreign_store = Store.objects.create(name="Foreign Store", owner=cls.stranger)
+
+
+    def get_time_series(self, **data):
+        request = RequestFactory().post("/", json.dumps(data), content_type="application/json")
+        request.user = self.user
+        return dashboard_time_series_view(request)
+
+
+    def test_time_series_of_the_user_stores(self):
+        response = self.get_time_series(store_pks=[str(self.store.pk)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["data"]["result"][0]["count"], 1)
+
+
+    def test_invalid_requests_are_rejected(self):
+        for data in (
+            {"store_pks": ["x"]},
+            {"store_pks": [str(self.foreign_store.pk)]},
+            {"store_pks": str(self.store.pk)},
+            {"categories": "food"},
+            {"from_date": "bad"},
+            {"timezone": 1},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.get_time_series(**data).status_code, 400)
+
+
+
+class DashboardSummaryCacheTestCase(TestCase):
+    """Checks that the cached dashboard summary is invalidated when, and only when, what it shows changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(name="Test Product", price=Money(100, "NGN"), quantity=20, store=cls.store)
+
+
+    def assertInvalidates(self, invalidates, change):
+        get_dashboard_summary(self.user)
+        version = get_dashboard_summary_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(get_dashboard_summary_version(self.user.pk) != version, invalidates)
+
+
+    def test_sales_and_products_invalidate_the_summary(self):
+        self.assertInvalidates(True, lambda: Sale.objects.create(store=self.store, product=self.product, quantity=1))
+        self.assertInvalidates(True, lambda: Product.objects.create(name="Other", price=Money(5, "NGN"), store=self.store))
+        self.assertEqual(get_dashboard_summary(self.user)["sales_count_today"], 1)
+
+
+    def test_user_changes_invalidate_the_summary_only_if_it_depends_on_them(self):
+        def login():
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=["last_login"])
+
+        def rename():
+            self.user.firstname = "Renamed"
+            self.user.save()
+
+        def change_currency():
+            self.user.preferred_currency = "USD"
+            self.user.save()
+
+        self.assertInvalidates(False, login)
+        self.assertInvalidates(False, rename)
+        self.assertInvalidates(True, change_currency)
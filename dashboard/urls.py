@@ -8,4 +8,6 @@ app_name = "dashboard"
 urlpatterns = [
     path("", views.dashboard_view, name="dashboard"),
     path("stats/advanced-options/", views.dashboard_stats_view, name="dashboard_stats"),
+    path("stats/time-series/", views.dashboard_time_series_view, name="dashboard_time_series"),
+    path("stats/analytics/", views.dashboard_analytics_view, name="dashboard_analytics"),
 ]
@@ -0,0 +1,67 @@
+import time
+from typing import Any, Dict
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from users.models import UserAccount
+from stores.models import Store
+from products.utils import get_products_count
+from sales.utils import aggregate_sales_count, aggregate_revenue_from_sales
+
+
+
+def _get_summary_version_key(user_pk: Any) -> str:
+    return f"dashboard-summary-version:{user_pk}"
+
+
+def get_dashboard_summary_version(user_pk: Any) -> int:
+    """Returns the current version of the cached dashboard summary of the user with the given primary key."""
+    key = _get_summary_version_key(user_pk)
+    version = cache.get(key)
+    if version is None:
+        # Start from the current time, not 1, so that a summary cached before the
+        # version was evicted from the cache is never mistaken for the current one.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_dashboard_summary(user_pk: Any) -> None:
+    """Invalidates the cached dashboard summary of the user with the given primary key, by bumping its version."""
+    key = _get_summary_version_key(user_pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The version is not in the cache. Any new version will do.
+        cache.add(key, time.time_ns(), timeout=None)
+    return None
+
+
+def get_dashboard_summary(user: UserAccount) -> Dict[str, Any]:
+    """
+    Returns the summary of the user's account shown on the dashboard.
+
+    The summary is cached per user, and the cache is invalidated whenever
+    any of the user's stores, products or sales change.
+    """
+    if not isinstance(user, UserAccount):
+        raise TypeError("user must be an instance of UserAccount")
+    
+    todays_date_for_user = user.to_local_timezone(timezone.now()).date()
+    key = f"dashboard-summary:{user.pk}:{todays_date_for_user.isoformat()}"
+    version = get_dashboard_summary_version(user.pk)
+    summary = cache.get(key, version=version)
+    if summary is not None:
+        return summary
+
+    stores = list(Store.objects.filter(owner=user).values("pk", "name"))
+    summary = {
+        "stores": stores,
+        "stores_count": len(stores),
+        "products_count": get_products_count(user),
+        "sales_count_today": aggregate_sales_count(user, date=todays_date_for_user),
+        "revenue_from_sales_today": aggregate_revenue_from_sales(user, date=todays_date_for_user),
+    }
+    cache.set(key, summary, timeout=settings.DASHBOARD_SUMMARY_CACHE_TTL, version=version)
+    return summary
@@ -1,15 +1,40 @@
 from django.views import generic
 from django.http import HttpRequest, JsonResponse
 from django.contrib.auth.mixins import LoginRequiredMixin
-from typing import Any, Dict
+from typing import Any, Dict, List
 import json
+import uuid
+import datetime
+import zoneinfo
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 
 
-from stores.utils import get_stores_count
-from products.utils import get_products_count
-from sales.utils import aggregate_sales_count, aggregate_revenue_from_sales
-from products.models import ProductCategories
+from stores.utils import filter_store_pks_for_user
+from sales.utils import (
+    aggregate_sales_count, aggregate_revenue_from_sales, aggregate_sales_time_series,
+    aggregate_sales_statistics, SALES_STATISTICS
+)
+from products.models import Product, ProductCategories
+from sales import analytics, columnar
+from .utils import get_dashboard_summary
+
+
+
+def clean_store_pks(store_pks: Any, user_store_pks: Dict[str, uuid.UUID]) -> List[uuid.UUID]:
+    """
+    Returns the primary keys of the given stores, sorted, if they are all stores of the user.
+
+    Stores that are not the user's are not left out, as sales of the other stores 
+    would then be returned in place of those of the stores asked for.
+
+    :param store_pks: The primary keys of the stores, as sent by the client.
+    :param user_store_pks: The primary keys of the user's stores, mapped by their string values.
+    :raises ValueError: If the primary keys are not a list, or if any of them is not one of the user's stores.
+    """
+    if not isinstance(store_pks, list) or any(str(store_pk) not in user_store_pks for store_pk in store_pks):
+        raise ValueError("some of the stores do not exist.")
+    return sorted(user_store_pks[str(store_pk)] for store_pk in store_pks)
 
 
 
@@ -20,11 +45,7 @@ class DashboardView(LoginRequiredMixin, generic.TemplateView):
 
     def get_context_data(self, **kwargs: Any) -> dict:
         context = super().get_context_data(**kwargs)
-        context["stores_count"] = get_stores_count(self.request.user)
-        context["products_count"] = get_products_count(self.request.user)
-        todays_date_for_user = self.request.user.to_local_timezone(timezone.now()).date()
-        context["sales_count_today"] = aggregate_sales_count(self.request.user, date=todays_date_for_user)
-        context["revenue_from_sales_today"] = aggregate_revenue_from_sales(self.request.user, date=todays_date_for_user)
+        context.update(get_dashboard_summary(self.request.user))
         context["product_categories"] = ProductCategories.labels
         return context
     
@@ -35,8 +56,32 @@ class DashboardStatisticsView(LoginRequiredMixin, generic.View):
     http_method_names = ["post"]
 
     def post(self, request: HttpRequest, *args: str, **kwargs: Any) -> JsonResponse:
-        """Handles dashboard statistics AJAX/Fetch POST request"""
+        """
+        Handles dashboard statistics AJAX/Fetch POST request.
+
+        Several statistics can be requested at once by sending a list of stat specs:
+        ```json
+        {
+            "stats": [
+                {"id": "sales-today", "statType": "sales", "filters": {"date": "2024-01-01"}},
+                {"id": "revenue-today", "statType": "revenue", "filters": {"date": "2024-01-01"}},
+                {"id": "products-sold", "statType": "products", "filters": {"from_date": "2024-01-01"}}
+            ]
+        }
+        ```
+        """
         data: Dict = json.loads(request.body)
+        if "stats" in data:
+            stat_specs = data["stats"]
+            if not isinstance(stat_specs, list) or not all(isinstance(spec, dict) for spec in stat_specs):
+                return JsonResponse(
+                    data={
+                        "status": "error",
+                        "detail": "Invalid statistics: stats should be a list of stat specs."
+                    },
+                    status=400
+                )
+            return self.get_statistics(stat_specs)
         stat_type = data.pop("statType", None)
 
         if stat_type == "sales":
@@ -51,7 +96,7 @@ class DashboardStatisticsView(LoginRequiredMixin, generic.View):
                 },
                 status=200
             )
-        
+
         elif stat_type == "revenue":
             result = aggregate_revenue_from_sales(self.request.user, **data)
             return JsonResponse(
@@ -64,7 +109,7 @@ class DashboardStatisticsView(LoginRequiredMixin, generic.View):
                 },
                 status=200
             )
-        
+
         return JsonResponse(
             data={
                 "status": "error",
@@ -74,6 +119,274 @@ class DashboardStatisticsView(LoginRequiredMixin, generic.View):
         )
 
 
+    def get_statistics(self, stat_specs: List[Dict[str, Any]]) -> JsonResponse:
+        """
+        Returns the results of a list of stat specs.
+
+        Specs that share the same filters are answered together, with one aggregation.
+        """
+        user = self.request.user
+        user_store_pks = { str(store_pk): store_pk for store_pk in filter_store_pks_for_user(user) }
+        filter_sets: Dict[str, tuple[Dict[str, Any], List[tuple[str, str]]]] = {}
+        for index, spec in enumerate(stat_specs):
+            stat_type = spec.get("statType")
+            if stat_type not in SALES_STATISTICS:
+                return JsonResponse(
+                    data={
+                        "status": "error",
+                        "detail": f"Invalid statistics type: {stat_type}"
+                    },
+                    status=400
+                )
+            
+            try:
+                filters = self.clean_statistics_filters(spec.get("filters") or {})
+            except (TypeError, ValueError) as exc:
+                return JsonResponse(
+                    data={
+                        "status": "error",
+                        "detail": f"Invalid statistics filters: {exc}"
+                    },
+                    status=400
+                )
+            
+            if filters.get("store_pks"):
+                try:
+                    filters["store_pks"] = clean_store_pks(filters["store_pks"], user_store_pks)
+                except ValueError as exc:
+                    return JsonResponse(
+                        data={
+                            "status": "error",
+                            "detail": f"Invalid statistics filters: {exc}"
+                        },
+                        status=400
+                    )
+            filter_set_key = json.dumps(filters, sort_keys=True, default=str)
+            filter_sets.setdefault(filter_set_key, (filters, []))[1].append((str(spec.get("id", index)), stat_type))
+
+        results = {}
+        for filters, specs in filter_sets.values():
+            try:
+                statistics = aggregate_sales_statistics(user, list({ stat_type for _, stat_type in specs }), **filters)
+            except (TypeError, ValueError, ValidationError) as exc:
+                return JsonResponse(
+                    data={
+                        "status": "error",
+                        "detail": f"Invalid statistics filters: {exc}"
+                    },
+                    status=400
+                )
+            
+            for spec_id, stat_type in specs:
+                result = statistics[stat_type]
+                results[spec_id] = f'{result.currency}{result.amount:,}' if stat_type == "revenue" else result
+
+        return JsonResponse(
+            data={
+                "status": "success",
+                "detail": "Statistics retrieved successfully!",
+                "data": {
+                    "results": results
+                }
+            },
+            status=200
+        )
+
+
+
+    @staticmethod
+    def clean_statistics_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Returns a copy of the filters of a stat spec, with the dates and times parsed.
+
+        :param filters: The filters of a stat spec.
+        :raises ValueError: If the filters are not a dictionary, if the stores or categories are not lists,
+        or if any of the dates or times is not in ISO format.
+        """
+        if not isinstance(filters, dict):
+            raise ValueError("filters should be an object.")
+        filters = dict(filters)
+        for key in ("store_pks", "categories"):
+            if filters.get(key) is not None and not isinstance(filters[key], list):
+                raise ValueError(f"{key} should be a list.")
+        if filters.get("categories") and not all(isinstance(category, str) for category in filters["categories"]):
+            raise ValueError("categories should be a list of category names.")
+        for key in ("date", "from_date", "to_date"):
+            if filters.get(key):
+                filters[key] = datetime.date.fromisoformat(filters[key])
+        for key in ("from_time", "to_time"):
+            if filters.get(key):
+                filters[key] = datetime.time.fromisoformat(filters[key])
+        return filters
+
+
+
+class DashboardTimeSeriesView(LoginRequiredMixin, generic.View):
+    """View for retrieving bucketed sales statistics for dashboard charts."""
+    http_method_names = ["post"]
+
+    def post(self, request: HttpRequest, *args: str, **kwargs: Any) -> JsonResponse:
+        """
+        Handles dashboard time series AJAX/Fetch POST request.
+
+        Expects a JSON body of the form:
+        ```json
+        {
+            "bucket": "day",
+            "from_date": "2024-01-01",
+            "to_date": "2024-01-31",
+            "timezone": "Africa/Lagos",
+            "store_pks": [...],
+            "categories": [...]
+        }
+        ```
+        All keys are optional. The range defaults to today, and the timezone to the user's timezone.
+        """
+        data: Dict = json.loads(request.body)
+        user = self.request.user
+        try:
+            store_pks = data.get("store_pks")
+            if store_pks:
+                store_pks = clean_store_pks(store_pks, { str(store_pk): store_pk for store_pk in filter_store_pks_for_user(user) })
+            categories = data.get("categories")
+            if categories and (not isinstance(categories, list) or not all(isinstance(category, str) for category in categories)):
+                raise ValueError("categories should be a list of category names.")
+            tz = zoneinfo.ZoneInfo(data["timezone"]) if data.get("timezone") else user.timezone
+            to_date = data.get("to_date") or timezone.now().astimezone(tz).date()
+            series = aggregate_sales_time_series(
+                user,
+                from_date=data.get("from_date") or to_date,
+                to_date=to_date,
+                bucket=data.get("bucket", "day"),
+                tz=tz,
+                store_pks=store_pks,
+                categories=categories,
+            )
+        except (TypeError, ValueError, ValidationError, zoneinfo.ZoneInfoNotFoundError) as exc:
+            return JsonResponse(
+                data={
+                    "status": "error",
+                    "detail": str(exc)
+                },
+                status=400
+            )
+
+        return JsonResponse(
+            data={
+                "status": "success",
+                "detail": "Sales time series retrieved successfully!",
+                "data": {
+                    "currency": str(user.preferred_currency),
+                    "result": [
+                        {
+                            "bucket": point["bucket"].isoformat(),
+                            "count": point["count"],
+                            "quantity": point["quantity"],
+                            "revenue": str(point["revenue"].amount),
+                        }
+                        for point in series
+                    ]
+                }
+            },
+            status=200
+        )
+
+
+
+class DashboardAnalyticsView(LoginRequiredMixin, generic.View):
+    """
+    View for retrieving sales analytics computed over the columnar mirror of the user's sales.
+    Only available when the sales columnar store is enabled.
+    """
+    http_method_names = ["post"]
+
+    def post(self, request: HttpRequest, *args: str, **kwargs: Any) -> JsonResponse:
+        """
+        Handles dashboard analytics AJAX/Fetch POST request.
+
+        Expects a JSON body of the form:
+        ```json
+        {
+            "analysis": "rolling_average",
+            "value": "revenue",
+            "store_pks": [...],
+            "window": 7,
+            "percentiles": [50, 90, 99],
+            "limit": 10
+        }
+        ```
+        Where "analysis" is one of "rolling_average", "percentiles", "top_products" or "hour_of_week".
+        All other keys are optional.
+        """
+        if not columnar.is_enabled():
+            return JsonResponse(
+                data={
+                    "status": "error",
+                    "detail": "Sales analytics are not enabled"
+                },
+                status=404
+            )
+        
+        data: Dict = json.loads(request.body)
+        user = self.request.user
+        analysis = data.get("analysis")
+        value = data.get("value", "revenue")
+        currency = str(user.preferred_currency)
+        try:
+            if value not in analytics.ANALYTICS_VALUES:
+                raise ValueError(f"Invalid analytics value: {value}")
+            
+            columns = columnar.load_sales_columns(filter_store_pks_for_user(user, data.get("store_pks")))
+            if analysis == "rolling_average":
+                result = [
+                    { **point, "date": point["date"].isoformat() }
+                    for point in analytics.get_rolling_average(
+                        columns, user.timezone, window=int(data.get("window", 7)), value=value, currency=currency
+                    )
+                ]
+            elif analysis == "percentiles":
+                result = analytics.get_percentiles(
+                    columns, [ float(percentile) for percentile in data.get("percentiles", [50, 90, 99]) ], value=value, currency=currency
+                )
+            elif analysis == "top_products":
+                top_products = analytics.get_top_products(columns, limit=int(data.get("limit", 10)), value=value, currency=currency)
+                product_names = {
+                    str(product_pk): name 
+                    for product_pk, name in Product.objects.filter(
+                        pk__in=[ product_pk for product_pk, _ in top_products ]
+                    ).values_list("pk", "name")
+                }
+                result = [
+                    { "product": product_names.get(product_pk), "product_pk": product_pk, "total": total } 
+                    for product_pk, total in top_products
+                ]
+            elif analysis == "hour_of_week":
+                result = analytics.get_hour_of_week_profile(columns, user.timezone, value=value, currency=currency)
+            else:
+                raise ValueError(f"Invalid analysis: {analysis}")
+        except (ValueError, TypeError) as exc:
+            return JsonResponse(
+                data={
+                    "status": "error",
+                    "detail": str(exc)
+                },
+                status=400
+            )
+
+        return JsonResponse(
+            data={
+                "status": "success",
+                "detail": "Sales analytics retrieved successfully!",
+                "data": {
+                    "currency": currency,
+                    "result": result
+                }
+            },
+            status=200
+        )
+
 
 dashboard_view = DashboardView.as_view()
 dashboard_stats_view = DashboardStatisticsView.as_view()
+dashboard_time_series_view = DashboardTimeSeriesView.as_view()
+dashboard_analytics_view = DashboardAnalyticsView.as_view()
@@ -151,6 +151,9 @@ LOGIN_URL = 'users:signin'
 
 STORE_AUTHORIZATION_VIEW = 'stores:store_auth'
 
+# Store authorizations are kept in signed cookies, one per store, named with this prefix
+STORE_AUTHORIZATION_COOKIE_PREFIX = 'store_authorization_'
+
 PASSWORD_VERIFICATION_VIEW = "users:password_verification"
 
 PASSWORD_VERIFICATION_VALIDITY_PERIOD = 180.0 # in seconds
@@ -162,3 +165,41 @@ BASE_URL = "https://graphi.pythonanywhere.com"
 EXCHANGE_BACKEND = 'djmoney.contrib.exchange.backends.OpenExchangeRatesBackend'
 
 OPEN_EXCHANGE_RATES_APP_ID = djsm_manager.get_secret("openexchangerates_app_id")
+
+EXCHANGE_RATES_CACHE_TTL = 60 * 60 # in seconds
+
+DASHBOARD_SUMMARY_CACHE_TTL = 60 * 15 # in seconds
+
+# STORE REPRICING
+# The prices of stores with more products than the threshold are converted in the background,
+# when the store's default currency changes
+STORE_REPRICING_JOB_THRESHOLD = 5_000
+
+# PURGES
+# Deleted stores and products are purged in the background, deleting this many objects at a time
+PURGE_BATCH_SIZE = 1000
+
+# Running purge jobs that have made no progress for this long are considered lost, and can be resumed
+PURGE_JOB_TIMEOUT = 60 * 10 # in seconds
+
+# REPORT JOBS
+# Exports of more sales than the threshold are generated in the background
+REPORT_JOB_ROW_THRESHOLD = 50_000
+
+REPORT_JOB_WORKERS = 2
+
+REPORT_JOBS_DIR = os.path.join(BASE_DIR, 'report_jobs')
+
+REPORT_JOB_RESULT_TTL = 60 * 60 # in seconds
+
+REPORT_JOB_TIMEOUT = 60 * 30 # in seconds
+
+# SALES COLUMNAR STORE
+# Requires NumPy. Mirrors the sales of each store in memory-mapped column files, for dashboard analytics.
+SALES_COLUMNAR_STORE_ENABLED = False
+
+SALES_COLUMNS_DIR = os.path.join(BASE_DIR, 'sales_columns')
+
+# PRODUCT IMPORTS
+# The number of rows of a product import that are validated and saved at a time
+PRODUCT_IMPORT_BATCH_SIZE = 500
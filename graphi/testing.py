@@ -0,0 +1,53 @@
+import re
+from typing import List
+from django.db import connections
+from django.db.models import QuerySet
+
+
+FULL_TABLE_SCAN_PATTERNS = {
+    # e.g "SCAN sales_sale", and "SCAN sales_sale USING INDEX sale_store_made_at_id_idx", 
+    # which walks the whole index, unlike "SEARCH sales_sale USING INDEX sale_store_made_at_id_idx (store_id=?)"
+    "sqlite": re.compile(r"\bSCAN (?P<table>\w+)"),
+    # e.g "Seq Scan on sales_sale  (cost=0.00..1.01 rows=1 width=8)", and index scans without an "Index Cond" line
+    "postgresql": re.compile(
+        r"\b(?:Seq Scan on (?P<table>\w+)|Index (?:Only )?Scan(?: Backward)? using \w+ on (?P<index_table>\w+)[^\n]*(?=\n|$)(?!\n\s*Index Cond))"
+    ),
+}
+
+
+def get_full_table_scans(queryset: QuerySet) -> List[str]:
+    """
+    Runs EXPLAIN on the query of a queryset and returns the names of the tables
+    that the query plan scans fully, that is, without searching an index for the rows, 
+    either by reading the table or by walking a whole index of it.
+
+    :param queryset: The queryset whose query plan will be checked.
+    """
+    vendor = connections[queryset.db].vendor
+    pattern = FULL_TABLE_SCAN_PATTERNS.get(vendor)
+    if pattern is None:
+        raise NotImplementedError(f"Query plan checks are not supported for the '{vendor}' database backend")
+    return [ match.group("table") or match.group("index_table") for match in pattern.finditer(queryset.explain()) ]
+
+
+
+class QueryPlanTestMixin:
+    """
+    Mixin for test cases that need to check that the queries of querysets use indexes.
+
+    #### For example:
+    ```python
+    class SaleListViewTestCase(QueryPlanTestMixin, TestCase):
+        def test_queryset_uses_indexes(self):
+            ...
+            self.assertNoFullTableScans(view.get_queryset())
+    ```
+    """
+    def assertNoFullTableScans(self, queryset: QuerySet, msg: str = None) -> None:
+        """Fails if the query plan of the queryset scans any table fully."""
+        tables = get_full_table_scans(queryset)
+        if tables:
+            standard_msg = (
+                f"Query scans {', '.join(tables)} fully:\n{queryset.query}\n\nQuery plan:\n{queryset.explain()}"
+            )
+            self.fail(self._formatMessage(msg, standard_msg))
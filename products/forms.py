@@ -1,3 +1,4 @@
+import functools
 from django import forms
 
 from .models import Product, ProductBrand, ProductGroup
@@ -9,6 +10,39 @@ class ProductForm(forms.ModelForm):
         model = Product
         exclude = ("added_at", "updated_at")
 
+    def validate_unique(self) -> None:
+        super().validate_unique()
+        # New copies of a product are added to its quantity instead, 
+        # but an existing product cannot be changed into a copy of another
+        product = self.instance
+        if product._state.adding or not product.store_id or self.errors:
+            return None
+        copies = Product.objects.filter(store_id=product.store_id, fingerprint=product.get_fingerprint())
+        if copies.exclude(pk=product.pk).exists():
+            self.add_error(None, "A product with the same details already exists in this store.")
+        return None
+
+
+class ProductImportForm(ProductForm):
+    """
+    Form for validating imported products. 
+    
+    The store, brand and group of the product are set on its instance, 
+    so that they are not fetched from the database for each product.
+    """
+    class Meta(ProductForm.Meta):
+        exclude = ProductForm.Meta.exclude + ("store", "brand", "group")
+
+    def _post_clean(self) -> None:
+        # Checking the product's constraints in the database costs a query per product. The quantity 
+        # constraint is already checked by the field's validators, and copies of products are merged on import.
+        self.instance.full_clean = functools.partial(self.instance.full_clean, validate_constraints=False)
+        try:
+            super()._post_clean()
+        finally:
+            del self.instance.full_clean
+        return None
+
 
 class ProductBrandForm(forms.ModelForm):
     """Form for creating and updating products."""
@@ -0,0 +1,224 @@
+import csv
+import io
+import json
+from typing import Any, Dict, IO, Iterable, Iterator, List, Tuple
+from django.db import transaction, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from djmoney.money import Money
+
+from stores.models import Store
+from .models import Product, ProductBrand, ProductGroup, ProductCategories
+from .forms import ProductImportForm
+from .signals import products_imported
+from .search import index_products
+
+
+PRODUCT_IMPORT_FORMATS = ("csv", "jsonl")
+
+# The columns of a product import. `brand` and `group` are names, and are created if they don't exist.
+PRODUCT_IMPORT_COLUMNS = (
+    "name", "description", "price", "quantity", "color", "size", "weight", "category", "brand", "group"
+)
+
+
+def iter_product_import_rows(file: IO[bytes], import_format: str) -> Iterator[Tuple[int, Dict[str, Any] | None]]:
+    """
+    Yields the rows of a product import file, with their row numbers, reading the file a line at a time.
+
+    A row that cannot be parsed is yielded as None.
+
+    :param file: The import file, opened in binary mode.
+    :param import_format: The format of the file. One of `PRODUCT_IMPORT_FORMATS`.
+    """
+    if import_format not in PRODUCT_IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format: {import_format}")
+
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        if import_format == "csv":
+            # Row 1 is the header
+            for row_number, row in enumerate(csv.DictReader(text), start=2):
+                yield row_number, row
+            return None
+
+        for row_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row_number, row if isinstance(row, dict) else None
+    finally:
+        # Do not close the underlying file with the wrapper
+        text.detach()
+
+
+def _get_or_create_by_names(model: type[ProductBrand | ProductGroup], store: Store, names: Iterable[str]) -> Dict[str, Any]:
+    """Returns the brands or groups of the store with the given names, mapped by name, creating the missing ones."""
+    names = set(names)
+    if not names:
+        return {}
+    objects = { obj.name: obj for obj in model.objects.filter(store=store, name__in=names) }
+    missing_names = names - objects.keys()
+    if missing_names:
+        # Conflicts are brands or groups created concurrently. They are fetched below.
+        model.objects.bulk_create([ model(name=name, store=store) for name in missing_names ], ignore_conflicts=True)
+        objects.update({ obj.name: obj for obj in model.objects.filter(store=store, name__in=missing_names) })
+    return objects
+
+
+def _clean_import_row(row: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+    """
+    Returns the product import row with its empty values removed, its values as strings and whitespace stripped,
+    and the errors of its values that are not strings, numbers or booleans.
+    """
+    cleaned_row = {}
+    errors = {}
+    for column in PRODUCT_IMPORT_COLUMNS:
+        value = row.get(column)
+        if value is None:
+            continue
+        if not isinstance(value, (str, int, float, bool)):
+            errors[column] = ["Enter a single value."]
+            continue
+        value = str(value).strip()
+        if value:
+            cleaned_row[column] = value
+    return cleaned_row, errors
+
+
+def _import_products_batch(store: Store, batch: List[Tuple[int, Dict[str, Any] | None]]) -> Dict[str, Any]:
+    """
+    Internal function that validates and saves a batch of product import rows.
+
+    :return: A dictionary with the numbers of created and updated products, and the errors of invalid rows.
+    """
+    result = {"created": 0, "updated": 0, "errors": []}
+    # Validate the rows first, so that brands and groups are only created for valid rows
+    valid_rows: List[Tuple[Dict[str, Any], Product]] = []
+    for row_number, row in batch:
+        if row is None:
+            result["errors"].append({"row": row_number, "errors": {"__all__": ["Row could not be parsed."]}})
+            continue
+
+        row, errors = _clean_import_row(row)
+        for column, model in (("brand", ProductBrand), ("group", ProductGroup)):
+            max_length = model._meta.get_field("name").max_length
+            if len(row.get(column, "")) > max_length:
+                errors[column] = [f"Ensure this value has at most {max_length} characters."]
+        if errors:
+            result["errors"].append({"row": row_number, "errors": errors})
+            continue
+
+        data = {
+            "quantity": 0,
+            "category": ProductCategories.OTHERS,
+            **row,
+            "price_0": row.get("price", 0),
+            "price_1": store.default_currency,
+        }
+        form = ProductImportForm(data=data, instance=Product(store=store))
+        if not form.is_valid():
+            errors = { field: list(field_errors) for field, field_errors in form.errors.items() }
+            result["errors"].append({"row": row_number, "errors": errors})
+            continue
+        valid_rows.append((row, form.instance))
+
+    brands = _get_or_create_by_names(ProductBrand, store, (row["brand"] for row, _ in valid_rows if "brand" in row))
+    groups = _get_or_create_by_names(ProductGroup, store, (row["group"] for row, _ in valid_rows if "group" in row))
+
+    # Merge copies of the same product in the batch
+    products: Dict[str, Product] = {}
+    tz = store.owner.timezone
+    for row, product in valid_rows:
+        product.brand = brands.get(row.get("brand"))
+        product.group = groups.get(row.get("group"))
+        # Set what `Product.save` sets, as the products are bulk created
+        product.fingerprint = product.get_fingerprint()
+        product.local_time = product.get_local_time(tz)
+        product.lifetime_revenue = Money(0, product.price.currency)
+        if product.fingerprint in products:
+            products[product.fingerprint].quantity += product.quantity
+        else:
+            products[product.fingerprint] = product
+
+    if not products:
+        return result
+
+    existing_products = Product.objects.filter(store=store, fingerprint__in=products.keys()).only("pk", "fingerprint")
+    updated_products = []
+    now = timezone.now()
+    for existing_product in existing_products:
+        product = products.pop(existing_product.fingerprint)
+        existing_product.quantity = F("quantity") + product.quantity
+        existing_product.updated_at = now
+        updated_products.append(existing_product)
+
+    Product.objects.bulk_update(updated_products, ["quantity", "updated_at"])
+    Product.objects.bulk_create(products.values())
+    index_products(Product.objects.filter(pk__in=[ product.pk for product in products.values() ]))
+    result["created"] = len(products)
+    result["updated"] = len(updated_products)
+    return result
+
+
+def import_products(store: Store, rows: Iterable[Tuple[int, Dict[str, Any] | None]], batch_size: int = 500) -> Dict[str, Any]:
+    """
+    Imports products into a store, in batches.
+
+    Each batch is validated with `ProductForm` semantics and saved in its own transaction, with a constant
+    number of queries. Products with the same identifying attributes as an existing product, or as another
+    row, are merged into that product by adding to its quantity. Invalid rows are skipped and reported,
+    as is the row from which the rest of the file cannot be read, if the file is not UTF-8 or CSV.
+
+    :param store: The store to import the products into.
+    :param rows: The rows to import, with their row numbers, as yielded by `iter_product_import_rows`.
+    :param batch_size: The number of rows validated and saved at a time.
+    :return: A dictionary with the numbers of created and updated products, and the errors of invalid rows.
+    """
+    result = {"created": 0, "updated": 0, "errors": []}
+
+    def import_batch(batch):
+        # Retry once if a copy of a product in the batch is created concurrently
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    batch_result = _import_products_batch(store, batch)
+                break
+            except IntegrityError:
+                if attempt:
+                    raise
+        for key in ("created", "updated", "errors"):
+            result[key] += batch_result[key]
+        return None
+
+    batch = []
+    file_error = None
+    rows = iter(rows)
+    row_number = 0
+    while True:
+        try:
+            row = next(rows)
+        except StopIteration:
+            break
+        except (UnicodeDecodeError, csv.Error) as exc:
+            # The rest of the file cannot be read, but the rows read so far are still imported
+            reason = "the file is not UTF-8 encoded" if isinstance(exc, UnicodeDecodeError) else str(exc)
+            file_error = {"row": row_number + 1, "errors": {"__all__": [f"The rest of the file could not be read: {reason}."]}}
+            break
+
+        row_number = row[0]
+        batch.append(row)
+        if len(batch) == batch_size:
+            import_batch(batch)
+            batch = []
+    if batch:
+        import_batch(batch)
+    if file_error:
+        result["errors"].append(file_error)
+
+    if result["created"] or result["updated"]:
+        products_imported.send(sender=Product, store=store)
+    return result
@@ -0,0 +1,53 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from stores.models import Store
+from products.imports import PRODUCT_IMPORT_FORMATS, iter_product_import_rows, import_products
+
+
+class Command(BaseCommand):
+    help = "Imports products into a store from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("store", help="Slug of the store to import the products into.")
+        parser.add_argument("path", help="Path to the CSV or JSONL file to import.")
+        parser.add_argument(
+            "--format",
+            choices=PRODUCT_IMPORT_FORMATS,
+            default=None,
+            help="Format of the file. Defaults to the extension of the file.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.PRODUCT_IMPORT_BATCH_SIZE,
+            help="Number of rows validated and saved at a time.",
+        )
+
+    def handle(self, *args, **options):
+        store = Store.objects.filter(slug=options["store"]).first()
+        if store is None:
+            raise CommandError(f"Store '{options['store']}' does not exist")
+
+        import_format = options["format"] or os.path.splitext(options["path"])[1].lstrip(".").lower()
+        if import_format not in PRODUCT_IMPORT_FORMATS:
+            raise CommandError(f"Unsupported file format '{import_format}'. Use --format to specify it.")
+
+        try:
+            with open(options["path"], "rb") as file:
+                result = import_products(
+                    store, iter_product_import_rows(file, import_format), batch_size=options["batch_size"]
+                )
+        except OSError as exc:
+            raise CommandError(f"Could not read '{options['path']}': {exc}")
+        
+        for row_error in result["errors"]:
+            errors = "; ".join(
+                f"{field}: {' '.join(field_errors)}" for field, field_errors in row_error["errors"].items()
+            )
+            self.stderr.write(f"Row {row_error['row']}: {errors}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {result['created']} products and updated {result['updated']} products of {store.name}, "
+            f"with {len(result['errors'])} invalid rows"
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the sales statistics (units sold, lifetime revenue and last sale) of products from their sales."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--store",
+            action="append",
+            dest="stores",
+            default=None,
+            help="Slug of a store whose products' sales statistics should be rebuilt. Can be repeated. Defaults to all stores.",
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options["stores"]:
+            products = products.filter(store__slug__in=options["stores"])
+        updated = Product.rebuild_sales_stats(products)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the sales statistics of {updated} products"))
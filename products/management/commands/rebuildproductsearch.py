@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.search import is_fts_enabled, rebuild_search_table
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search table of products. Only used on SQLite."
+
+    def handle(self, *args, **options):
+        if not is_fts_enabled():
+            raise CommandError("The product search table is not available. It is only used on SQLite.")
+        rebuild_search_table()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the product search table"))
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('products', '0001_initial'),
+        ('stores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='products', to='stores.store'),
+        ),
+        migrations.AddField(
+            model_name='productbrand',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_brands', to='stores.store'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='brand',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='products.productbrand'),
+        ),
+        migrations.AddField(
+            model_name='productgroup',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_groups', to='stores.store'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='products.productgroup'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productbrand',
+            unique_together={('name', 'store')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='productgroup',
+            unique_together={('name', 'store')},
+        ),
+    ]
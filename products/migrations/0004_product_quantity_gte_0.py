@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:51
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def clamp_negative_product_quantities(apps, schema_editor):
+    """Sets the quantity of products with a negative quantity to zero, so the check constraint can be added."""
+    Product = apps.get_model("products", "Product")
+    Product.objects.filter(quantity__lt=0).update(quantity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_add_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='quantity',
+            field=models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.RunPython(clamp_negative_product_quantities, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(check=models.Q(('quantity__gte', 0)), name='product_quantity_gte_0'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+from products.models import get_product_fingerprint
+
+
+def set_product_fingerprints(apps, schema_editor):
+    """
+    Sets the fingerprints of existing products. 
+    
+    Products that are copies of an older product in the same store are left without a fingerprint,
+    so the unique constraint can be added.
+    """
+    Product = apps.get_model("products", "Product")
+    products = Product.objects.order_by("added_at", "id").values_list(
+        "id", "store_id", "name", "price", "price_currency", "color", 
+        "size", "weight", "category", "brand_id", "group_id"
+    )
+    seen = set()
+    updates = []
+    for pk, store_id, *attributes in products.iterator(chunk_size=2000):
+        fingerprint = get_product_fingerprint(store_id, *attributes)
+        if (store_id, fingerprint) in seen:
+            continue
+        seen.add((store_id, fingerprint))
+        updates.append(Product(pk=pk, fingerprint=fingerprint))
+        if len(updates) == 2000:
+            Product.objects.bulk_update(updates, ["fingerprint"])
+            updates = []
+    Product.objects.bulk_update(updates, ["fingerprint"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_quantity_gte_0'),
+        ('stores', '0003_add_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='fingerprint',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(set_product_fingerprints, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('store', 'fingerprint'), name='product_store_fingerprint_uniq'),
+        ),
+    ]
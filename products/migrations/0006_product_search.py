@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from products.search import create_search_table, drop_search_table, index_products
+
+
+def create_product_search_table(apps, schema_editor):
+    """Creates the FTS5 search table of products, on SQLite, and indexes the existing products."""
+    Product = apps.get_model("products", "Product")
+    create_search_table(schema_editor)
+    index_products(Product.objects.all())
+
+
+def drop_product_search_table(apps, schema_editor):
+    drop_search_table(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_product_search_table, drop_product_search_table),
+    ]
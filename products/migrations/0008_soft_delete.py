@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_sales_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the product was deleted. Deleted products are hidden, and purged in the background.', null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:41
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def set_product_local_times(apps, schema_editor):
+    """Sets the local time of existing products, in the timezone of the owner of the product's store."""
+    Product = apps.get_model("products", "Product")
+    Store = apps.get_model("stores", "Store")
+    for store in Store.objects.select_related("owner").iterator():
+        tz = store.owner.timezone
+        products = []
+        for product in Product.objects.filter(store=store).only("pk", "added_at").iterator(chunk_size=2000):
+            product.local_time = timezone.localtime(product.added_at, tz).time()
+            products.append(product)
+            if len(products) == 2000:
+                Product.objects.bulk_update(products, ["local_time"])
+                products = []
+        Product.objects.bulk_update(products, ["local_time"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_soft_delete'),
+        ('stores', '0004_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='local_time',
+            field=models.TimeField(blank=True, editable=False, help_text="Time of the day the product was added, in the timezone of the store's owner. Used for time of day filters.", null=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='added_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(set_product_local_times, migrations.RunPython.noop),
+    ]
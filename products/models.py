@@ -1,12 +1,25 @@
 from __future__ import annotations
 
+from typing import Any, Dict, Iterable
+from django.apps import apps
 from django.db import models
+from django.db.models import F, Max, Sum
+from django.db.models.functions import Coalesce, Greatest
 import uuid
+import hashlib
+import datetime
+import zoneinfo
+from djmoney.money import Money
 from djmoney.models.fields import MoneyField
 from djmoney.models.validators import MinMoneyValidator
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_utz.decorators import model
 from decimal import Decimal
+from django.core.validators import MinValueValidator
+
+from stores.exchange import convert_money
+from stores.models import NotDeletedManager
 
 
 class ProductCategories(models.TextChoices):
@@ -24,6 +37,31 @@ class ProductCategories(models.TextChoices):
 
 
 
+def get_product_fingerprint(
+        store_id, name, price_amount, price_currency, color="", 
+        size="", weight=None, category=ProductCategories.OTHERS, brand_id=None, group_id=None
+    ) -> str:
+    """
+    Returns the fingerprint of a product with the given identifying attributes.
+
+    Products with the same fingerprint are copies of each other. Names, colors and sizes 
+    are compared case-insensitively and regardless of extra whitespace.
+    """
+    def normalize(value) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, (Decimal, int, float)):
+            return str(Decimal(value).quantize(Decimal("0.01")))
+        return " ".join(str(value).split()).casefold()
+
+    values = (store_id, name, price_amount, price_currency, color, size, weight, category, brand_id, group_id)
+    return hashlib.sha256("\x1f".join(map(normalize, values)).encode()).hexdigest()
+
+
+# The fields of `Product` that summarize its sales. They are only updated by the sales of the product.
+PRODUCT_SALES_STATS_FIELDS = ("units_sold", "lifetime_revenue", "lifetime_revenue_currency", "last_sold_at")
+
+
 @model
 class Product(models.Model):
     """Model representing a product in a store."""
@@ -37,7 +75,7 @@ class Product(models.Model):
         default=Decimal("0.00"),
         validators=[MinMoneyValidator(Decimal("0.00"))]
     )
-    quantity = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     color = models.CharField(max_length=50, blank=True)
     size = models.CharField(max_length=50, blank=True)
     weight = models.DecimalField(_("Weight in grams"), max_digits=10, decimal_places=2, blank=True, null=True)
@@ -45,13 +83,51 @@ class Product(models.Model):
     group = models.ForeignKey("ProductGroup", blank=True, null=True, on_delete=models.SET_NULL, related_name="products")
     brand = models.ForeignKey("ProductBrand", blank=True, null=True, on_delete=models.SET_NULL, related_name="products")
     store = models.ForeignKey("stores.Store", on_delete=models.CASCADE, related_name="products")
-    added_at = models.DateTimeField(auto_now_add=True)
+    # Products whose fingerprint is null are copies of an older product, added before fingerprints were stored
+    fingerprint = models.CharField(max_length=64, null=True, editable=False)
+    units_sold = models.PositiveIntegerField(default=0, editable=False)
+    lifetime_revenue = MoneyField(
+        max_digits=18, 
+        decimal_places=2, 
+        default_currency="NGN", 
+        default=Decimal("0.00"),
+        editable=False,
+        help_text="Total amount made from the sales of the product, in the currency of the product's price."
+    )
+    last_sold_at = models.DateTimeField(null=True, blank=True, editable=False)
+    added_at = models.DateTimeField(default=timezone.now, editable=False)
+    local_time = models.TimeField(
+        null=True, 
+        blank=True, 
+        editable=False, 
+        help_text="Time of the day the product was added, in the timezone of the store's owner. Used for time of day filters."
+    )
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(
+        null=True, blank=True, editable=False, 
+        help_text="When the product was deleted. Deleted products are hidden, and purged in the background."
+    )
+
+    objects = NotDeletedManager()
+    all_objects = models.Manager()
 
     class Meta:
         verbose_name = "product"
         verbose_name_plural = "products"
         ordering = ("name", "-added_at")
+        indexes = [
+            models.Index(fields=("store", "name", "added_at"), name="product_store_name_idx"),
+            models.Index(fields=("store", "added_at"), name="product_store_added_at_idx"),
+            models.Index(fields=("store", "category"), name="product_store_category_idx"),
+            models.Index(fields=("store", "price"), name="product_store_price_idx"),
+            models.Index(fields=("store", "quantity"), name="product_store_quantity_idx"),
+            models.Index(fields=("store", "units_sold"), name="product_store_units_sold_idx"),
+            models.Index(fields=("store", "last_sold_at"), name="product_store_last_sold_at_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(quantity__gte=0), name="product_quantity_gte_0"),
+            models.UniqueConstraint(fields=("store", "fingerprint"), name="product_store_fingerprint_uniq"),
+        ]
     
     class UTZMeta:
         datetime_fields = "__all__"
@@ -60,11 +136,181 @@ class Product(models.Model):
     def __str__(self):
         return self.name
     
-    @property
-    def last_sold_at(self):
-        """The last date the product was sold"""
-        latest_sale = self.sales.latest("made_at")
-        return latest_sale.made_at if latest_sale else None
+
+    def save(self, *args, **kwargs):
+        """
+        Saves this product to the database, updating its fingerprint.
+
+        The sales statistics of an existing product are not saved, as they are updated
+        in the database by its sales, and this product's values may be out of date.
+        """
+        if self._state.adding or self.fingerprint is not None:
+            self.fingerprint = self.get_fingerprint()
+        if self.local_time is None:
+            self.local_time = self.get_local_time()
+        if self._state.adding:
+            self.lifetime_revenue = Money(self.lifetime_revenue.amount, self.price.currency)
+            return super().save(*args, **kwargs)
+        
+        if kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields 
+                if not field.primary_key and field.name not in PRODUCT_SALES_STATS_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        if str(self.lifetime_revenue.currency) != str(self.price.currency):
+            # The price is now in another currency, for example, after the store's currency changed
+            self.convert_lifetime_revenue(self.price.currency)
+        return None
+    
+
+    def get_local_time(self, tz: zoneinfo.ZoneInfo = None) -> datetime.time:
+        """
+        Returns the time of the day the product was added, in the given timezone.
+        
+        :param tz: The timezone. Defaults to the timezone of the owner of the product's store.
+        """
+        return timezone.localtime(self.added_at, tz or self.store.owner.timezone).time()
+    
+
+    @classmethod
+    def update_local_times(cls, stores: Iterable[Any], chunk_size: int = 2000) -> int:
+        """
+        Recomputes the local times of the products of the given stores, for example, after the timezone of their owner changes.
+
+        :param stores: The stores, or a queryset of the stores, whose products should be updated.
+        :param chunk_size: The number of products updated at a time.
+        :return: The number of products updated.
+        """
+        updated = 0
+        for store in stores:
+            tz = store.owner.timezone
+            products = []
+            for product in cls.all_objects.filter(store=store).only("pk", "added_at", "local_time").iterator(chunk_size=chunk_size):
+                product.local_time = product.get_local_time(tz)
+                products.append(product)
+                if len(products) == chunk_size:
+                    updated += cls.all_objects.bulk_update(products, ["local_time"])
+                    products = []
+            updated += cls.all_objects.bulk_update(products, ["local_time"])
+        return updated
+    
+
+    def get_fingerprint(self) -> str:
+        """Returns the fingerprint of this product, computed from its identifying attributes."""
+        return get_product_fingerprint(
+            store_id=self.store_id, name=self.name, 
+            price_amount=self.price.amount, price_currency=self.price.currency,
+            color=self.color, size=self.size, weight=self.weight, category=self.category,
+            brand_id=self.brand_id, group_id=self.group_id
+        )
+    
+    def convert_lifetime_revenue(self, currency: str) -> None:
+        """Converts the lifetime revenue of this product to the given currency, in the database."""
+        rate = convert_money(Money(1, self.lifetime_revenue.currency), currency).amount
+        Product.objects.filter(pk=self.pk, lifetime_revenue_currency=self.lifetime_revenue.currency).update(
+            lifetime_revenue=F("lifetime_revenue") * rate, lifetime_revenue_currency=str(currency)
+        )
+        self.refresh_from_db(fields=["lifetime_revenue", "lifetime_revenue_currency"])
+        return None
+
+
+    @classmethod
+    def record_sales(cls, sales: Iterable[Any], sign: int = 1) -> None:
+        """
+        Adds sales to (or removes sales from) the sales statistics of their products.
+
+        Sales of the same product are combined, so each product is updated once. The statistics are 
+        updated with `F()` expressions, so they are safe to update in the same transaction as the sales.
+
+        :param sales: The sales to record. Their products must be loaded, or be loadable.
+        :param sign: 1 to add the sales to the statistics, -1 to remove the sales from the statistics.
+        """
+        totals: Dict[Any, Dict[str, Any]] = {}
+        for sale in sales:
+            product = sale.product
+            total = totals.setdefault(
+                product.pk, 
+                {"units": 0, "revenue": Money(0, product.lifetime_revenue.currency), "last_sold_at": sale.made_at}
+            )
+            revenue = sale.amount
+            if str(revenue.currency) != str(total["revenue"].currency):
+                revenue = convert_money(revenue, total["revenue"].currency)
+            total["units"] += sale.quantity
+            total["revenue"] += revenue
+            total["last_sold_at"] = max(total["last_sold_at"], sale.made_at)
+
+        for product_pk, total in totals.items():
+            updates = {
+                "units_sold": F("units_sold") + sign * total["units"],
+                "lifetime_revenue": F("lifetime_revenue") + sign * total["revenue"].amount,
+            }
+            if sign > 0:
+                updates["last_sold_at"] = Greatest(Coalesce(F("last_sold_at"), total["last_sold_at"]), total["last_sold_at"])
+            cls.objects.filter(pk=product_pk).update(**updates)
+
+        if sign < 0 and totals:
+            # The removed sales may have been the last sales of their products
+            cls.update_last_sold_at(totals.keys())
+        return None
+    
+
+    @classmethod
+    def update_last_sold_at(cls, product_pks: Iterable[Any]) -> None:
+        """Sets the `last_sold_at` of the products with the given primary keys from their latest sales."""
+        product_pks = list(product_pks)
+        Sale = apps.get_model("sales", "Sale")
+        last_sold_at = dict(
+            Sale.objects.filter(product_id__in=product_pks)
+            .order_by()
+            .values("product_id")
+            .annotate(last_sold_at=Max("made_at"))
+            .values_list("product_id", "last_sold_at")
+        )
+        for product_pk in product_pks:
+            cls.objects.filter(pk=product_pk).update(last_sold_at=last_sold_at.get(product_pk))
+        return None
+
+
+    @classmethod
+    def rebuild_sales_stats(cls, products: models.QuerySet = None, chunk_size: int = 500) -> int:
+        """
+        Recomputes the sales statistics of the given products from their sales.
+
+        :param products: The products whose statistics will be rebuilt. Defaults to all products.
+        :param chunk_size: The number of products updated at a time.
+        :return: The number of products updated.
+        """
+        Sale = apps.get_model("sales", "Sale")
+        products = cls.objects.all() if products is None else products
+        product_pks = list(products.order_by().values_list("pk", flat=True))
+        updated = 0
+        for index in range(0, len(product_pks), chunk_size):
+            chunk = cls.objects.filter(pk__in=product_pks[index:index + chunk_size])
+            chunk = { product.pk: product for product in chunk.only("pk", "lifetime_revenue", "lifetime_revenue_currency") }
+            for product in chunk.values():
+                product.units_sold = 0
+                product.lifetime_revenue = Money(0, product.lifetime_revenue.currency)
+                product.last_sold_at = None
+
+            summaries = (
+                Sale.objects.filter(product_id__in=chunk.keys())
+                .order_by()
+                .values("product_id", "amount_currency")
+                .annotate(units=Sum("quantity"), revenue=Sum("amount"), last_sold_at=Max("made_at"))
+            )
+            for summary in summaries:
+                product = chunk[summary["product_id"]]
+                revenue = Money(summary["revenue"], summary["amount_currency"])
+                if str(revenue.currency) != str(product.lifetime_revenue.currency):
+                    revenue = convert_money(revenue, product.lifetime_revenue.currency)
+                product.units_sold += summary["units"]
+                product.lifetime_revenue += revenue
+                product.last_sold_at = max(filter(None, (product.last_sold_at, summary["last_sold_at"])))
+            updated += cls.objects.bulk_update(
+                chunk.values(), ["units_sold", "lifetime_revenue", "lifetime_revenue_currency", "last_sold_at"]
+            )
+        return updated
     
 
 @model
@@ -0,0 +1,201 @@
+import re
+import uuid
+import functools
+from typing import Any, Iterable, List
+from django.db import connection, models
+from django.db.models import Case, When, Value, Q, QuerySet
+
+
+PRODUCT_SEARCH_TABLE = "products_product_fts"
+
+# The columns of the search table, mapped to their weights in the ranking of results.
+# Unindexed columns are not searched, and have no weight.
+PRODUCT_SEARCH_COLUMNS = {
+    "product_id": 0.0, # Unindexed
+    "store_id": 0.0, # Unindexed
+    "name": 10.0,
+    "description": 1.0,
+    "brand": 4.0,
+    "product_group": 3.0,
+    "color": 2.0,
+    "size": 2.0,
+}
+
+# The maximum number of matching products that are ranked in a search
+MAX_SEARCH_RESULTS = 1000
+
+_search_terms_pattern = re.compile(r"\w+", re.UNICODE)
+
+
+
+def get_search_terms(query: str) -> List[str]:
+    """Returns the words of a search query, lowercased."""
+    return _search_terms_pattern.findall(query.casefold())[:20]
+
+
+@functools.lru_cache
+def _has_search_table(database_name: str) -> bool:
+    return PRODUCT_SEARCH_TABLE in connection.introspection.table_names()
+
+
+def is_fts_enabled() -> bool:
+    """Returns whether products are searched with the SQLite FTS5 search table, rather than with LIKE queries."""
+    return connection.vendor == "sqlite" and _has_search_table(str(connection.settings_dict["NAME"]))
+
+
+def _get_rowid(product_pk: uuid.UUID | str) -> int:
+    """Returns the row ID of a product in the search table, derived from its primary key."""
+    return int(uuid.UUID(str(product_pk)).hex[:15], 16)
+
+
+def create_search_table(schema_editor: Any = None) -> None:
+    """Creates the FTS5 search table of products. Does nothing if the database is not SQLite."""
+    if connection.vendor != "sqlite":
+        return None
+    columns = ", ".join(
+        f"{column} UNINDEXED" if weight == 0 else column for column, weight in PRODUCT_SEARCH_COLUMNS.items()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {PRODUCT_SEARCH_TABLE} "
+            f"USING fts5({columns}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+    _has_search_table.cache_clear()
+    return None
+
+
+def drop_search_table(schema_editor: Any = None) -> None:
+    """Drops the FTS5 search table of products."""
+    if connection.vendor != "sqlite":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {PRODUCT_SEARCH_TABLE}")
+    _has_search_table.cache_clear()
+    return None
+
+
+def remove_products_from_search(product_pks: Iterable[Any]) -> None:
+    """Removes the products with the given primary keys from the search table."""
+    rowids = [ _get_rowid(product_pk) for product_pk in product_pks ]
+    if not rowids or not is_fts_enabled():
+        return None
+    with connection.cursor() as cursor:
+        for index in range(0, len(rowids), 500):
+            chunk = rowids[index:index + 500]
+            cursor.execute(
+                f"DELETE FROM {PRODUCT_SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk
+            )
+    return None
+
+
+def index_products(products: QuerySet, chunk_size: int = 500) -> None:
+    """
+    Adds the products of the queryset to the search table, replacing their existing entries.
+
+    :param products: The products to index.
+    :param chunk_size: The number of products read from the database and indexed at a time.
+    """
+    if not is_fts_enabled():
+        return None
+
+    rows = (
+        products.order_by()
+        .values_list("pk", "store_id", "name", "description", "brand__name", "group__name", "color", "size")
+        .iterator(chunk_size=chunk_size)
+    )
+    sql = (
+        f"INSERT OR REPLACE INTO {PRODUCT_SEARCH_TABLE} (rowid, {', '.join(PRODUCT_SEARCH_COLUMNS)}) "
+        f"VALUES ({', '.join(['%s'] * (len(PRODUCT_SEARCH_COLUMNS) + 1))})"
+    )
+    with connection.cursor() as cursor:
+        chunk = []
+        for pk, store_id, name, description, brand, group, color, size in rows:
+            chunk.append((_get_rowid(pk), str(pk), str(store_id), name, description, brand or "", group or "", color, size))
+            if len(chunk) == chunk_size:
+                cursor.executemany(sql, chunk)
+                chunk = []
+        if chunk:
+            cursor.executemany(sql, chunk)
+    return None
+
+
+def rebuild_search_table() -> None:
+    """Clears the search table and indexes all products again."""
+    from .models import Product
+
+    if not is_fts_enabled():
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {PRODUCT_SEARCH_TABLE}")
+    index_products(Product.objects.all())
+    return None
+
+
+def _get_fts_query(terms: List[str]) -> str:
+    """Returns an FTS5 query that matches all the terms, each as a prefix of a word."""
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def _search_products_fts(queryset: QuerySet, terms: List[str], store: Any, limit: int) -> QuerySet:
+    weights = ", ".join(str(weight) for weight in PRODUCT_SEARCH_COLUMNS.values())
+    conditions = f"{PRODUCT_SEARCH_TABLE} MATCH %s"
+    params = [_get_fts_query(terms)]
+    if store is not None:
+        conditions += " AND store_id = %s"
+        params.append(str(store.pk))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT product_id FROM {PRODUCT_SEARCH_TABLE} WHERE {conditions} "
+            f"ORDER BY bm25({PRODUCT_SEARCH_TABLE}, {weights}) LIMIT %s",
+            [*params, limit]
+        )
+        product_pks = [ uuid.UUID(product_id) for product_id, in cursor.fetchall() ]
+    ranking = Case(
+        *(When(pk=product_pk, then=Value(rank)) for rank, product_pk in enumerate(product_pks)),
+        default=Value(len(product_pks)),
+        output_field=models.IntegerField(),
+    )
+    return queryset.filter(pk__in=product_pks).annotate(search_rank=ranking).order_by("search_rank")
+
+
+def _search_products_like(queryset: QuerySet, terms: List[str], store: Any) -> QuerySet:
+    if store is not None:
+        queryset = queryset.filter(store=store)
+    for term in terms:
+        queryset = queryset.filter(
+            Q(name__icontains=term) | Q(description__icontains=term) | Q(brand__name__icontains=term) 
+            | Q(group__name__icontains=term) | Q(color__icontains=term) | Q(size__icontains=term)
+        )
+    query = " ".join(terms)
+    ranking = Case(
+        When(name__iexact=query, then=Value(0)),
+        When(name__istartswith=query, then=Value(1)),
+        When(name__icontains=query, then=Value(2)),
+        default=Value(3),
+        output_field=models.IntegerField(),
+    )
+    return queryset.annotate(search_rank=ranking).order_by("search_rank", "name")
+
+
+def search_products(queryset: QuerySet, query: str, store: Any = None, limit: int = MAX_SEARCH_RESULTS) -> QuerySet:
+    """
+    Returns the products of the queryset that match the search query, best matches first,
+    annotated with their `search_rank`.
+
+    Products match if each word of the query is found in their name, description, brand, group, color or size.
+    On SQLite, products are found and ranked with the FTS5 search table, where words of the query match the 
+    start of words, and only the best `limit` matches are returned. On other databases, products are found
+    with LIKE queries and ranked by how well their names match the query.
+
+    :param queryset: The products to search.
+    :param query: The search query.
+    :param store: The store whose products are searched. Narrows the search before the matches are ranked.
+    :param limit: The maximum number of matches ranked with the FTS5 search table.
+    """
+    terms = get_search_terms(query)
+    if not terms:
+        return queryset.none()
+    if is_fts_enabled():
+        return _search_products_fts(queryset, terms, store, limit)
+    return _search_products_like(queryset, terms, store)
@@ -0,0 +1,50 @@
+import functools
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver, Signal
+
+from .models import Product, ProductBrand, ProductGroup
+from .search import index_products, remove_products_from_search
+
+
+# Sent after products are imported into a store, as they are saved in bulk without `post_save` signals.
+# Receives the `store` the products were imported into.
+products_imported = Signal()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance: Product, **kwargs) -> None:
+    """Adds the product to the search table, or updates its entry. Deleted products are removed from the search table."""
+    if instance.deleted_at is not None:
+        remove_products_from_search([instance.pk])
+        return None
+    index_products(Product.objects.filter(pk=instance.pk))
+    return None
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search(sender, instance: Product, **kwargs) -> None:
+    """Removes the product from the search table."""
+    remove_products_from_search([instance.pk])
+    return None
+
+
+@receiver(post_save, sender=ProductBrand)
+@receiver(post_save, sender=ProductGroup)
+def index_brand_or_group_products(sender, instance: ProductBrand | ProductGroup, created: bool, **kwargs) -> None:
+    """Updates the search table entries of the products of the brand or group, as its name may have changed."""
+    if not created:
+        index_products(instance.products.all())
+    return None
+
+
+@receiver(pre_delete, sender=ProductBrand)
+@receiver(pre_delete, sender=ProductGroup)
+def index_brand_or_group_products_on_delete(sender, instance: ProductBrand | ProductGroup, **kwargs) -> None:
+    """
+    Updates the search table entries of the products of the brand or group once it is deleted.
+    The products are updated in bulk when it is deleted, without signals.
+    """
+    products = Product.objects.filter(pk__in=list(instance.products.values_list("pk", flat=True)))
+    transaction.on_commit(functools.partial(index_products, products))
+    return None
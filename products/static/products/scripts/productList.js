@@ -3,6 +3,8 @@ const addProductToggle = document.querySelector('#add-product-toggle');
 const addProductForm = document.querySelector('#add-product-form');
 const addProductFormCard = addProductForm.parentElement;
 const addProductButton = addProductForm.querySelector('.submit-btn');
+const importProductsForm = document.querySelector('#import-products-form');
+const importProductsButton = importProductsForm.querySelector('.submit-btn');
 
 
 productCards.forEach((card) => {
@@ -88,3 +90,43 @@ addProductForm.onsubmit = function(e) {
     });
 };
 
+
+addOnPostAndOnResponseFuncAttr(importProductsButton, 'Importing products...');
+
+
+importProductsForm.onsubmit = function(e) {
+    e.stopImmediatePropagation();
+    e.preventDefault();
+
+    importProductsButton.onPost();
+    const options = {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': getCookie('csrftoken'),
+        },
+        mode: 'same-origin',
+        body: new FormData(this),
+    }
+
+    fetch(this.action, options).then((response) => {
+        response.json().then((data) => {
+            if (!response.ok) {
+                importProductsButton.onResponse();
+                pushNotification("error", data.detail ?? 'An error occurred!');
+                return;
+            }
+
+            const errors = data.data?.errors ?? [];
+            if (errors.length) {
+                importProductsButton.onResponse();
+                pushNotification("error", `${errors.length} row${errors.length > 1 ? 's were' : ' was'} not imported. The first invalid row is row ${errors[0].row}.`);
+            }
+            pushNotification("success", data.detail ?? 'Products imported successfully!');
+            if (errors.length) return;
+
+            const redirectURL  = data.redirect_url ?? null;
+            if(!redirectURL) return;
+            window.location.href = redirectURL;
+        });
+    });
+};
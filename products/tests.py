@@ -1,3 +1,321 @@
-from django.test import TestCase
+import io
+import json
+from unittest import mock
+from django.test import TestCase, RequestFactory
+from djmoney.money import Money
 
-# Create your tests here.
+from graphi.testing import QueryPlanTestMixin
+from users.models import UserAccount
+from stores.models import Store
+from .models import Product, ProductBrand, ProductGroup
+from sales.models import Sale
+from sales.utils import record_checkout
+from .views import ProductListView, ProductAddView
+from .forms import ProductForm
+from .utils import _add_to_existing_product_copy
+from .imports import iter_product_import_rows, import_products
+from .search import search_products
+from . import search
+
+
+class ProductListViewQueryPlanTestCase(QueryPlanTestMixin, TestCase):
+    """Checks that the queries of the product list view use indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        Product.objects.create(name="Test Product", price=Money(100, "NGN"), quantity=10, store=cls.store)
+
+
+    def get_queryset(self, **params):
+        request = RequestFactory().get("/", params)
+        request.user = self.user
+        view = ProductListView()
+        view.setup(request, store_slug=self.store.slug)
+        return view.get_queryset()
+
+
+    def test_queryset_uses_indexes(self):
+        self.assertNoFullTableScans(self.get_queryset())
+
+
+    def test_filtered_queryset_uses_indexes(self):
+        for params in (
+            {"from_date": "2024-01-01", "to_date": "2024-01-31"},
+            {"categories": "food,books"},
+            {"min_price": 10, "max_price": 500},
+            {"min_quantity": 1, "max_quantity": 5},
+            {"date": "2024-01-01", "from_time": "08:00", "to_time": "17:00"},
+        ):
+            with self.subTest(params=params):
+                self.assertNoFullTableScans(self.get_queryset(**params))
+
+
+    def test_time_filters_use_the_local_time(self):
+        sql = str(self.get_queryset(from_time="08:00", to_time="17:00").query)
+        self.assertNotIn("django_datetime_cast_time", sql)
+        self.assertIn("local_time", sql)
+
+
+
+class ProductFingerprintTestCase(TestCase):
+    """Checks that copies of a product are detected by their fingerprint."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.user.is_verified = True
+        cls.user.save()
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(
+            name="Test Product", price=Money(100, "NGN"), quantity=10, color="Red", store=cls.store
+        )
+
+
+    def add_product(self, **data):
+        request = RequestFactory().post("/", json.dumps(data), content_type="application/json")
+        request.user = self.user
+        return ProductAddView.as_view()(request, store_slug=self.store.slug)
+
+
+    def test_adding_a_copy_increases_quantity(self):
+        response = self.add_product(name="  test   PRODUCT ", price="100.00", quantity=5, color="red", category="others")
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 15)
+        self.assertEqual(Product.objects.count(), 1)
+
+
+    def test_adding_a_copy_takes_one_query(self):
+        copy = Product(name="Test Product", price=Money(100, "NGN"), quantity=5, color="Red", store=self.store)
+        with self.assertNumQueries(1):
+            self.assertTrue(_add_to_existing_product_copy(copy))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 15)
+
+
+    def test_adding_a_different_product(self):
+        response = self.add_product(name="Test Product", price="150", quantity=5, color="Red", category="others")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Product.objects.count(), 2)
+
+
+    def test_changing_a_product_into_a_copy(self):
+        other = Product.objects.create(name="Other Product", price=Money(100, "NGN"), color="Red", store=self.store)
+        data = {
+            "name": "Test Product", "price_0": "100", "price_1": "NGN", "quantity": 1, 
+            "color": "Red", "category": "others", "store": self.store.pk,
+        }
+        self.assertFalse(ProductForm(data=data, instance=other).is_valid())
+        self.assertTrue(ProductForm(data=data, instance=self.product).is_valid())
+
+
+
+class ProductImportTestCase(TestCase):
+    """Checks that product imports create, merge and report products."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=10, store=cls.store)
+
+
+    def import_file(self, content, import_format, batch_size=2):
+        rows = iter_product_import_rows(io.BytesIO(content.encode()), import_format)
+        return import_products(self.store, rows, batch_size=batch_size)
+
+
+    def test_csv_import(self):
+        result = self.import_file(
+            "name,price,quantity,brand,category\n"
+            "Rice,100,5,,\n"
+            "Beans,50,3,Farm Co,food\n"
+            "beans ,50,2,Farm Co,food\n"
+            "Yam,-1,1,,\n"
+            "Garri,20,4,Farm Co,unknown\n",
+            "csv"
+        )
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(result["updated"], 2) # Rice, and Beans in the second batch
+        self.assertEqual([error["row"] for error in result["errors"]], [5, 6])
+        self.assertIn("price", result["errors"][0]["errors"])
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 15)
+        beans = Product.objects.get(name="Beans")
+        self.assertEqual(beans.quantity, 5)
+        self.assertEqual(beans.brand, ProductBrand.objects.get(store=self.store, name="Farm Co"))
+
+
+    def test_jsonl_import(self):
+        result = self.import_file(
+            '{"name": "Beans", "price": 50, "quantity": 3, "group": "Grains"}\n'
+            'not json\n'
+            '\n'
+            '{"name": "Rice", "price": "100.00", "quantity": 1}\n',
+            "jsonl"
+        )
+        self.assertEqual((result["created"], result["updated"]), (1, 1))
+        self.assertEqual(result["errors"], [{"row": 2, "errors": {"__all__": ["Row could not be parsed."]}}])
+        self.assertEqual(Product.objects.get(name="Beans").group.name, "Grains")
+
+
+    def test_unreadable_files_are_reported_with_the_rows_imported_so_far(self):
+        # The file is decoded in chunks, so the undecodable row must be a chunk or more after the first row
+        description = "x" * 10000
+        content = f"name,price,quantity,description\nBeans,50,3,{description}\nYam,20,1,{description}\n".encode()
+        content += "Gàrri,20,4,\n".encode("latin-1")
+        result = import_products(self.store, iter_product_import_rows(io.BytesIO(content), "csv"), batch_size=1)
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(result["errors"][-1]["row"], 3)
+        self.assertIn("UTF-8", result["errors"][-1]["errors"]["__all__"][0])
+
+        # Longer than the field size limit of the CSV reader
+        result = self.import_file(f"name,price,description\nYam,20,\nGarri,20,{'x' * 200000}\n", "csv")
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(result["errors"][-1]["row"], 3)
+
+
+    def test_batches_are_imported_with_a_constant_number_of_queries(self):
+        content = "name,price,quantity,brand\n" + "".join(f"Product {index},{index + 1},1,Farm Co\n" for index in range(10))
+        with self.assertNumQueries(9):
+            result = self.import_file(content, "csv", batch_size=100)
+        self.assertEqual(result["created"], 10)
+
+
+    def test_invalid_rows_are_reported_without_creating_brands_or_groups(self):
+        result = self.import_file(
+            '{"name": "Beans", "price": 50, "quantity": 3, "brand": 7, "group": ["Grains"]}\n'
+            '{"name": "Yam", "price": -1, "quantity": 1, "brand": "Farm Co", "group": "Tubers"}\n'
+            '{"name": "Garri", "price": 20, "quantity": 4, "brand": {"name": "Farm Co"}}\n',
+            "jsonl"
+        )
+        self.assertEqual((result["created"], result["updated"]), (0, 0))
+        self.assertEqual([error["row"] for error in result["errors"]], [1, 2, 3])
+        self.assertIn("group", result["errors"][0]["errors"])
+        self.assertIn("price", result["errors"][1]["errors"])
+        self.assertIn("brand", result["errors"][2]["errors"])
+        self.assertFalse(ProductBrand.objects.filter(store=self.store).exists())
+        self.assertFalse(ProductGroup.objects.filter(store=self.store).exists())
+
+
+
+class ProductSearchTestCase(TestCase):
+    """Checks that product searches find and rank products, and that the search table follows the products."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.other_store = Store.objects.create(name="Other Store", owner=cls.user)
+        cls.brand = ProductBrand.objects.create(name="Golden Farms", store=cls.store)
+        cls.rice = Product.objects.create(name="Basmati Rice", price=Money(100, "NGN"), store=cls.store, brand=cls.brand)
+        cls.bag = Product.objects.create(
+            name="Jute Bag", description="Holds 50kg of rice", price=Money(100, "NGN"), color="Brown", store=cls.store
+        )
+        Product.objects.create(name="Basmati Rice", price=Money(100, "NGN"), store=cls.other_store)
+
+
+    def search(self, query):
+        return list(search_products(Product.objects.filter(store=self.store), query, store=self.store))
+
+
+    def test_search_ranks_matches(self):
+        self.assertTrue(search.is_fts_enabled())
+        self.assertEqual(self.search("rice"), [self.rice, self.bag])
+        self.assertEqual(self.search("basm"), [self.rice])
+        self.assertEqual(self.search("golden rice"), [self.rice])
+        self.assertEqual(self.search("brown"), [self.bag])
+        self.assertEqual(self.search("\"*:"), [])
+
+
+    def test_search_table_follows_products(self):
+        self.rice.name = "Jasmine Rice"
+        self.rice.save()
+        self.assertEqual(self.search("basmati"), [])
+        self.assertEqual(self.search("jasmine"), [self.rice])
+
+        self.brand.name = "Silver Farms"
+        self.brand.save()
+        self.assertEqual(self.search("silver"), [self.rice])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brand.delete()
+        self.assertEqual(self.search("silver"), [])
+
+        self.bag.delete()
+        self.assertEqual(self.search("jute"), [])
+
+        import_products(self.store, [(1, {"name": "Jute Sack", "price": "20"})])
+        self.assertEqual([product.name for product in self.search("jute")], ["Jute Sack"])
+
+
+    def test_like_search(self):
+        with mock.patch.object(search, "is_fts_enabled", return_value=False):
+            self.assertEqual(self.search("rice"), [self.rice, self.bag])
+            self.assertEqual(self.search("golden rice"), [self.rice])
+
+
+
+class ProductSalesStatsTestCase(TestCase):
+    """Checks that the sales statistics of products follow their sales."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.rice = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=20, store=cls.store)
+        cls.beans = Product.objects.create(name="Beans", price=Money(50, "NGN"), quantity=20, store=cls.store)
+
+
+    def assertSalesStats(self, product, units_sold, lifetime_revenue, last_sold_at):
+        product.refresh_from_db()
+        self.assertEqual(product.units_sold, units_sold)
+        self.assertEqual(product.lifetime_revenue, Money(lifetime_revenue, "NGN"))
+        self.assertEqual(product.last_sold_at, last_sold_at)
+
+
+    def test_stats_follow_sales(self):
+        self.assertSalesStats(self.rice, 0, 0, None)
+        first_sale = Sale.objects.create(store=self.store, product=self.rice, quantity=2)
+        second_sale = Sale.objects.create(store=self.store, product=self.rice, quantity=1)
+        self.assertSalesStats(self.rice, 3, 300, second_sale.made_at)
+
+        second_sale.quantity = 4
+        second_sale.save()
+        self.assertSalesStats(self.rice, 6, 600, second_sale.made_at)
+
+        second_sale.product = self.beans
+        second_sale.save()
+        self.assertSalesStats(self.rice, 2, 200, first_sale.made_at)
+        self.assertSalesStats(self.beans, 4, 200, second_sale.made_at)
+
+        first_sale.delete()
+        self.assertSalesStats(self.rice, 0, 0, None)
+
+        checkout, _ = record_checkout(self.store, [{"product": str(self.rice.pk), "quantity": 5}], idempotency_key="key")
+        self.assertSalesStats(self.rice, 5, 500, checkout.sales.get().made_at)
+
+        Product.objects.update(units_sold=0)
+        Product.rebuild_sales_stats()
+        self.assertSalesStats(self.rice, 5, 500, checkout.sales.get().made_at)
+        self.assertSalesStats(self.beans, 4, 200, second_sale.made_at)
+
+
+    def test_saving_a_product_keeps_its_stats(self):
+        product = Product.objects.get(pk=self.rice.pk)
+        Sale.objects.create(store=self.store, product=self.rice, quantity=2)
+        product.name = "Ofada Rice"
+        product.save()
+        self.assertSalesStats(product, 2, 200, Sale.objects.get().made_at)
+
+
+    def test_sort_by_units_sold(self):
+        Sale.objects.create(store=self.store, product=self.beans, quantity=2)
+        request = RequestFactory().get("/", {"sort": "best_selling"})
+        request.user = self.user
+        view = ProductListView()
+        view.setup(request, store_slug=self.store.slug)
+        self.assertEqual(list(view.get_queryset()), [self.beans, self.rice])
@@ -7,7 +7,9 @@ app_name = "products"
 
 urlpatterns = [
     path("", views.product_list_view, name="product_list"),
+    path("search/", views.product_search_view, name="product_search"),
     path("new/", views.product_add_view, name="product_add"),
+    path("import/", views.product_import_view, name="product_import"),
     path("<uuid:product_id>/update/", views.product_update_view, name="product_update"),
     path("<uuid:product_id>/delete/", views.product_delete_view, name="product_delete"),
 ]
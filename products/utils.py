@@ -1,4 +1,5 @@
 from typing import Any, Dict
+from django.db.models import F
 
 from users.models import UserAccount
 from .models import Product
@@ -14,28 +15,19 @@ def get_products_count(user: UserAccount) -> int:
     return Product.objects.filter(store__owner=user).count()
 
 
-def _fetch_existing_product_copy(product_data: Dict[str, Any]) -> Product | None:
+def _add_to_existing_product_copy(product: Product) -> bool:
     """
-    Internal function that fetches an existing product that is very similar in attributes to the new product being added.
-    (excluding the product's id, quantity, added_at and updated_at attributes)
+    Internal function that adds the quantity of a new, unsaved product to an existing product in the same store 
+    whose identifying attributes (name, price, color, size, weight, category, brand and group) are the same.
 
-    :param product_data: A dictionary containing the new product's data.
-    """
-    excluded_fields = ("id", "quantity", "added_at", "updated_at")
-    fieldnames = [ field.name for field in Product._meta.get_fields() if field.name not in excluded_fields ]
-    # Ensure's that only fields that exist in the product model are included in the query
-    product_data = { fieldname: product_data.get(fieldname) for fieldname in fieldnames if fieldname in product_data }
+    The existing product is looked up by its fingerprint and updated in a single indexed query,
+    without overwriting concurrent changes to its quantity.
 
-    form = ProductForm(data=product_data)
-    form.full_clean()
-    product_data = form.cleaned_data
-    # Ensure's that excluded fields are not included in the query
-    for fieldname in excluded_fields:
-        product_data.pop(fieldname, None)
-    
-    # Remove empty/null values
-    product_data = dict(filter(lambda item: bool(item[1]), product_data.items()))
-    return Product.objects.filter(**product_data).first()
+    :param product: The new product, built from a valid product form.
+    :return: True if an existing copy of the product was updated, False otherwise.
+    """
+    copies = Product.objects.filter(store_id=product.store_id, fingerprint=product.get_fingerprint())
+    return copies.update(quantity=F("quantity") + product.quantity) > 0
 
 
 def _update_product_data_with_new_brand_and_group(product_data: Dict[str, Any]) -> tuple[Dict[str, Any], Dict[str, Any]]:
@@ -1,7 +1,9 @@
 from re import S
 from typing import Any, Dict
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import QuerySet
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, QuerySet
 from django.http import HttpRequest, HttpResponse
 from django.views import generic
 from django.http import JsonResponse
@@ -12,12 +14,15 @@ from decimal import Decimal
 
 from .models import Product, ProductCategories
 from stores.models import Store
-from stores.mixins import StoreQuerySetMixin, SupportsQuerySetFiltering
+from stores.mixins import RequestStoreMixin, StoreQuerySetMixin, SupportsQuerySetFiltering
 from users.mixins import RequestUserQuerySetMixin
 from stores.decorators import requires_store_authorization, to_JsonResponse
+from stores.purge import delete_product
 from users.decorators import requires_password_verification, requires_account_verification
 from .forms import ProductForm
-from .utils import _fetch_existing_product_copy, _update_product_data_with_new_brand_and_group
+from .imports import PRODUCT_IMPORT_FORMATS, iter_product_import_rows, import_products
+from .search import search_products
+from .utils import _add_to_existing_product_copy, _update_product_data_with_new_brand_and_group
 
 product_queryset = Product.objects.all().select_related("store", "brand", "group")
 
@@ -58,12 +63,24 @@ class ProductListView(
         "date": "added_at__date",
         "from_date": "added_at__date__gte",
         "to_date": "added_at__date__lte",
-        "from_time": "added_at__time__gte",
-        "to_time": "added_at__time__lte",
+        "from_time": "local_time__gte",
+        "to_time": "local_time__lte",
     }
 
-    def get_store(self) -> Any:
-        return Store.objects.get(slug=self.kwargs.get("store_slug"))
+    # Sort options, mapped to their labels and the ordering of the products
+    sort_options = {
+        "name": ("Name", ("name", "-added_at")),
+        "newest": ("Newest", ("-added_at",)),
+        "best_selling": ("Best selling", ("-units_sold", "name")),
+        "least_selling": ("Least selling", ("units_sold", "name")),
+        "recently_sold": ("Recently sold", (F("last_sold_at").desc(nulls_last=True), "name")),
+        "highest_revenue": ("Highest revenue", ("-lifetime_revenue", "name")),
+    }
+
+    def get_sort(self) -> str | None:
+        """Returns the selected sort option, if it is valid."""
+        sort = self.request.GET.get("sort")
+        return sort if sort in self.sort_options else None
     
 
     def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
@@ -71,6 +88,9 @@ class ProductListView(
         context["store"] = self.get_store()
         context["product_categories"] = ProductCategories.choices
         context["has_any_product"] = Product.objects.filter(store=context["store"]).exists()
+        context["search_query"] = self.request.GET.get("q", "").strip()
+        context["sort_options"] = [ (sort, label) for sort, (label, _) in self.sort_options.items() ]
+        context["selected_sort"] = self.get_sort()
         return context
     
 
@@ -79,6 +99,14 @@ class ProductListView(
         product_pk = self.request.GET.get("product")
         if product_pk:
             qs = qs.filter(pk=product_pk)
+
+        search_query = self.request.GET.get("q", "").strip()
+        if search_query:
+            qs = search_products(qs, search_query, store=self.get_store())
+
+        sort = self.get_sort()
+        if sort:
+            qs = qs.order_by(*self.sort_options[sort][1])
         return qs
 
 
@@ -88,46 +116,99 @@ class ProductListView(
 
 
 
-class ProductAddView(LoginRequiredMixin, generic.CreateView):
+class ProductSearchView(RequestStoreMixin, LoginRequiredMixin, generic.View):
+    """Handles AJAX/Fetch requests to search the products of a store."""
+    http_method_names = ["get"]
+    max_results = 20
+
+    # For the RequestStoreMixin
+    store_identifier = "slug"
+    store_url_kwarg = "store_slug"
+
+    @requires_store_authorization(identifier="slug", url_kwarg="store_slug")
+    @to_JsonResponse
+    def get(self, request, *args, **kwargs) -> JsonResponse:
+        store: Store = request.store
+        try:
+            limit = min(int(request.GET.get("limit", self.max_results)), self.max_results)
+        except ValueError:
+            limit = self.max_results
+
+        products = search_products(
+            product_queryset.filter(store=store), request.GET.get("q", ""), store=store, limit=limit
+        )[:limit]
+        return JsonResponse(
+            data={
+                "status": "success",
+                "detail": f"{len(products)} product{'s' if len(products) != 1 else ''} found",
+                "data": [
+                    {
+                        "id": str(product.pk),
+                        "name": product.name,
+                        "price": str(product.price.amount),
+                        "currency": str(product.price.currency),
+                        "quantity": product.quantity,
+                        "brand": product.brand.name if product.brand else None,
+                        "group": product.group.name if product.group else None,
+                    }
+                    for product in products
+                ]
+            },
+            status=200
+        )
+
+
+
+class ProductAddView(RequestStoreMixin, LoginRequiredMixin, generic.CreateView):
     """Handles AJAX/Fetch requests to add a product to a store."""
     model = Product
     form_class = ProductForm
     http_method_names = ["post"]
 
+    # For the RequestStoreMixin
+    store_identifier = "slug"
+    store_url_kwarg = "store_slug"
+
     @to_JsonResponse
     @requires_account_verification
     def post(self, request, *args, **kwargs) -> JsonResponse:
-        store = Store.objects.get(slug=kwargs.get("store_slug"))
+        store: Store = request.store
         data: Dict = json.loads(request.body)
         data["price_0"] = Decimal(data.pop("price", 0))
         data["price_1"] = store.default_currency
         data["store"] = store.pk
 
-        # Check if product already exists and update its quantity instead
-        existing_copy = _fetch_existing_product_copy(data)
-        if existing_copy:
-            existing_copy.quantity += int(data.get("quantity", 0))
-            existing_copy.save()
-            return JsonResponse(
-                data={
-                    "status": "success",
-                    "detail": "Product already exists but its quantity has been updated!",
-                    "redirect_url": reverse("stores:products:product_list", kwargs={"store_slug": existing_copy.store.slug})
-                },
-                status=200
-            )
-
         # Update product data with new brand and group
         data, errors = _update_product_data_with_new_brand_and_group(data)
 
         form = self.get_form_class()(data=data)
         if form.is_valid() and not errors:
-            product: Product = form.save(commit=True)
+            # Add to the quantity of an existing copy of the product instead, if there is one
+            added_to_copy = _add_to_existing_product_copy(form.instance)
+            if not added_to_copy:
+                try:
+                    with transaction.atomic():
+                        form.save(commit=True)
+                except IntegrityError:
+                    # A copy of the product was added concurrently
+                    added_to_copy = _add_to_existing_product_copy(form.instance)
+                    if not added_to_copy:
+                        raise
+
+            if added_to_copy:
+                return JsonResponse(
+                    data={
+                        "status": "success",
+                        "detail": "Product already exists but its quantity has been updated!",
+                        "redirect_url": reverse("stores:products:product_list", kwargs={"store_slug": store.slug})
+                    },
+                    status=200
+                )
             return JsonResponse(
                 data={
                     "status": "success",
                     "detail": "Product added successfully!",
-                    "redirect_url": reverse("stores:products:product_list", kwargs={"store_slug": product.store.slug})
+                    "redirect_url": reverse("stores:products:product_list", kwargs={"store_slug": store.slug})
                 },
                 status=201
             )
@@ -143,6 +224,56 @@ class ProductAddView(LoginRequiredMixin, generic.CreateView):
     
 
 
+class ProductImportView(RequestStoreMixin, LoginRequiredMixin, generic.View):
+    """Handles AJAX/Fetch requests to import products into a store from a CSV or JSONL file."""
+    http_method_names = ["post"]
+
+    # For the RequestStoreMixin
+    store_identifier = "slug"
+    store_url_kwarg = "store_slug"
+
+    @requires_store_authorization(identifier="slug", url_kwarg="store_slug")
+    @to_JsonResponse
+    @requires_account_verification
+    def post(self, request, *args, **kwargs) -> JsonResponse:
+        store: Store = request.store
+        file = request.FILES.get("file")
+        if not file:
+            return JsonResponse(
+                data={
+                    "status": "error",
+                    "detail": "No file was uploaded!",
+                },
+                status=400
+            )
+        
+        import_format = request.POST.get("format") or file.name.rsplit(".", maxsplit=1)[-1].lower()
+        if import_format not in PRODUCT_IMPORT_FORMATS:
+            return JsonResponse(
+                data={
+                    "status": "error",
+                    "detail": f"Unsupported file format! Upload a {' or '.join(PRODUCT_IMPORT_FORMATS).upper()} file.",
+                },
+                status=400
+            )
+
+        result = import_products(
+            store, 
+            iter_product_import_rows(file, import_format), 
+            batch_size=settings.PRODUCT_IMPORT_BATCH_SIZE
+        )
+        return JsonResponse(
+            data={
+                "status": "success",
+                "detail": f"{result['created']} products added and {result['updated']} products updated!",
+                "data": result,
+                "redirect_url": reverse("stores:products:product_list", kwargs={"store_slug": store.slug})
+            },
+            status=200
+        )
+
+
+
 class ProductUpdateView(StoreQuerySetMixin, LoginRequiredMixin, generic.UpdateView):
     """Handles AJAX/Fetch requests to update a product in a store."""
     model = Product
@@ -217,13 +348,16 @@ class ProductDeleteView(StoreQuerySetMixin, LoginRequiredMixin, generic.DetailVi
     @requires_password_verification
     def get(self, request, *args, **kwargs):
         product = self.get_object()
-        product.delete()
+        # The product is hidden at once, and purged in the background
+        delete_product(product)
         return redirect("stores:products:product_list", store_slug=self.kwargs.get("store_slug"))
 
 
 
 
 product_list_view = ProductListView.as_view()
+product_search_view = ProductSearchView.as_view()
 product_add_view = ProductAddView.as_view()
+product_import_view = ProductImportView.as_view()
 product_update_view = ProductUpdateView.as_view()
 product_delete_view = ProductDeleteView.as_view()
@@ -0,0 +1,160 @@
+import csv
+import io
+import re
+import zipfile
+import zoneinfo
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, Sequence
+from xml.sax.saxutils import escape
+from django.db.models import QuerySet
+from django.utils import timezone
+
+
+SALES_EXPORT_HEADER = (
+    "Transaction ID", "Product", "Quantity", "Amount", "Currency", "Payment Method", "Date", "Time"
+)
+
+
+def iter_sales_export_rows(sales: QuerySet, tz: zoneinfo.ZoneInfo, chunk_size: int = 2000) -> Iterator[tuple]:
+    """
+    Yields the rows of a sales export, fetching the sales from the database in chunks.
+
+    :param sales: The sales queryset to export.
+    :param tz: The timezone in which the date and time of the sales are exported.
+    :param chunk_size: The number of sales fetched from the database at a time.
+    """
+    rows = sales.values_list(
+        "transaction_id", "product__name", "quantity", "amount",
+        "amount_currency", "payment_method", "made_at"
+    ).iterator(chunk_size=chunk_size)
+    for transaction_id, product_name, quantity, amount, currency, payment_method, made_at in rows:
+        made_at = timezone.localtime(made_at, tz)
+        yield (
+            transaction_id, product_name, quantity, amount, currency,
+            payment_method.title(), made_at.date().isoformat(), made_at.strftime("%H:%M")
+        )
+
+
+class _Echo:
+    """File-like object that returns what is written to it, instead of storing it."""
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_csv(header: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[str]:
+    """Yields the lines of a CSV file with the given header and rows, one line at a time."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Unseekable file-like object that keeps what is written to it until it is drained."""
+    def __init__(self) -> None:
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, value: bytes) -> int:
+        self._chunks.append(bytes(value))
+        return len(value)
+
+    def drain(self) -> bytes:
+        """Returns and clears what has been written so far."""
+        value = b"".join(self._chunks)
+        self._chunks.clear()
+        return value
+
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+_XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+
+_XLSX_SHEET_END = '</sheetData></worksheet>'
+
+# Characters that are not allowed in XML documents
+_ILLEGAL_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _get_xlsx_row(row: Sequence[Any]) -> str:
+    cells = []
+    for value in row:
+        if value is None:
+            cells.append("<c/>")
+        elif isinstance(value, (int, float, Decimal)):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            value = escape(_ILLEGAL_XML_CHARS.sub("", str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{value}</t></is></c>')
+    return f"<row>{''.join(cells)}</row>"
+
+
+def stream_xlsx(
+        header: Sequence[str],
+        rows: Iterable[Sequence[Any]],
+        sheet_name: str = "Sheet1",
+        rows_per_chunk: int = 500
+    ) -> Iterator[bytes]:
+    """
+    Yields the bytes of an XLSX workbook with a single sheet, with the given header and rows,
+    as the rows are written to the workbook.
+
+    The workbook is zipped as it is written, so only `rows_per_chunk` rows are held in memory at a time.
+
+    :param header: The header row of the sheet.
+    :param rows: The rows of the sheet.
+    :param sheet_name: The name of the sheet.
+    :param rows_per_chunk: The number of rows written between yields.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr("[Content_Types].xml", _XLSX_CONTENT_TYPES)
+        workbook.writestr("_rels/.rels", _XLSX_RELS)
+        workbook.writestr("xl/workbook.xml", _XLSX_WORKBOOK.format(sheet_name=escape(sheet_name, {'"': "&quot;"})))
+        workbook.writestr("xl/_rels/workbook.xml.rels", _XLSX_WORKBOOK_RELS)
+        yield buffer.drain()
+
+        # The size of the sheet is not known in advance, so allow it to grow past 2 GiB
+        with workbook.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as sheet:
+            sheet.write((_XLSX_SHEET_START + _get_xlsx_row(header)).encode())
+            for count, row in enumerate(rows, start=1):
+                sheet.write(_get_xlsx_row(row).encode())
+                if count % rows_per_chunk == 0:
+                    yield buffer.drain()
+            sheet.write(_XLSX_SHEET_END.encode())
+    yield buffer.drain()
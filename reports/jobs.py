@@ -0,0 +1,192 @@
+import os
+import threading
+import functools
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from users.models import UserAccount
+from stores.models import Store
+from sales.models import Sale
+from .exports import SALES_EXPORT_HEADER, iter_sales_export_rows, stream_csv, stream_xlsx
+from .models import ReportJob, ReportJobStatus
+
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Returns the worker pool that report jobs are run in. The pool is created on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.REPORT_JOB_WORKERS, thread_name_prefix="report-job"
+                )
+    return _executor
+
+
+def get_or_queue_report_job(
+        store: Store, 
+        user: UserAccount, 
+        export_format: str, 
+        filters: Dict[str, str]
+    ) -> tuple[ReportJob, bool]:
+    """
+    Returns the report job for a sales report of the store with the given export format and filters.
+
+    A recent job for the same report is reused, whether it is still running or completed, 
+    so the same report is not generated twice. Otherwise, a new job is queued once
+    the current transaction is committed.
+
+    :param store: The store whose sales are reported.
+    :param user: The user requesting the report.
+    :param export_format: The format of the report file. "csv" or "xlsx".
+    :param filters: The report filter params.
+    :return: A tuple containing the job and a boolean indicating whether a new job was queued.
+    """
+    filters_hash = ReportJob.get_filters_hash(store.pk, export_format, filters)
+    recent_jobs = ReportJob.objects.filter(
+        store=store, 
+        requested_by=user, 
+        filters_hash=filters_hash, 
+        created_at__gte=timezone.now() - timedelta(seconds=settings.REPORT_JOB_RESULT_TTL),
+    )
+    fail_lost_report_jobs(recent_jobs)
+    for job in recent_jobs[:5]:
+        if job.has_result or not job.is_finished:
+            return job, False
+
+    job = ReportJob.objects.create(
+        store=store, 
+        requested_by=user, 
+        export_format=export_format, 
+        filters=filters, 
+        filters_hash=filters_hash,
+    )
+    transaction.on_commit(functools.partial(get_executor().submit, _run_report_job_in_worker, job.pk))
+    return job, True
+
+
+def fail_lost_report_jobs(jobs: QuerySet[ReportJob] = None) -> int:
+    """
+    Marks the report jobs that have not finished within the `REPORT_JOB_TIMEOUT` setting as failed.
+    Such jobs were most likely lost, for example when the worker process was restarted.
+
+    :param jobs: The jobs to check. Defaults to all report jobs.
+    :return: The number of jobs marked as failed.
+    """
+    jobs = ReportJob.objects.all() if jobs is None else jobs
+    now = timezone.now()
+    deadline = now - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+    return jobs.filter(
+        Q(started_at__lt=deadline) | Q(started_at__isnull=True, created_at__lt=deadline),
+        status__in=(ReportJobStatus.PENDING, ReportJobStatus.RUNNING),
+    ).update(status=ReportJobStatus.FAILED, error="The report took too long to generate.", completed_at=now)
+
+
+def delete_expired_report_jobs() -> int:
+    """
+    Deletes the report jobs older than the `REPORT_JOB_RESULT_TTL` setting, along with their report files.
+
+    :return: The number of jobs deleted.
+    """
+    expired_jobs = ReportJob.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=settings.REPORT_JOB_RESULT_TTL)
+    )
+    deleted = 0
+    for job_pk, result_path in expired_jobs.values_list("pk", "result_path").iterator():
+        # The file is deleted first, so that no file is left without a job if the deletion is interrupted
+        if result_path and os.path.exists(result_path):
+            os.remove(result_path)
+        deleted += ReportJob.objects.filter(pk=job_pk).delete()[0]
+    return deleted
+
+
+def _track_progress(job: ReportJob, rows: Iterable[tuple], total: int, every: int = 2000) -> Iterator[tuple]:
+    """Yields the rows, updating the progress of the job every `every` rows."""
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        if count % every == 0:
+            ReportJob.objects.filter(pk=job.pk).update(
+                rows_count=count, progress=min(99, count * 100 // max(total, 1))
+            )
+        yield row
+    job.rows_count = count
+
+
+def run_report_job(job_pk: str) -> None:
+    """
+    Generates the report of a report job, and writes it to a file in the `REPORT_JOBS_DIR` directory.
+    """
+    # Imported here as the views module queues report jobs
+    from .views import SalesReportView
+
+    job = ReportJob.objects.select_related("store", "requested_by").get(pk=job_pk)
+    if job.is_finished:
+        # The job was marked as failed, as it waited in the queue for longer than the timeout
+        return None
+    job.status = ReportJobStatus.RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=["status", "started_at"])
+
+    try:
+        view = SalesReportView(kwargs={"store_slug": job.store.slug}, filter_timezone=job.requested_by.timezone)
+        sales = Sale.objects.filter(
+            store=job.store, product__deleted_at__isnull=True, **view.process_filter_params(job.filters)
+        )
+        total = sales.count()
+        rows = _track_progress(
+            job, iter_sales_export_rows(sales, job.requested_by.timezone), total
+        )
+        if job.export_format == "csv":
+            content = (line.encode() for line in stream_csv(SALES_EXPORT_HEADER, rows))
+        else:
+            content = stream_xlsx(SALES_EXPORT_HEADER, rows, sheet_name="Sales")
+        
+        os.makedirs(settings.REPORT_JOBS_DIR, exist_ok=True)
+        # Write to a temporary file first, so a partially written report is never served
+        with tempfile.NamedTemporaryFile(dir=settings.REPORT_JOBS_DIR, delete=False) as file:
+            try:
+                for chunk in content:
+                    file.write(chunk)
+            except Exception:
+                file.close()
+                os.remove(file.name)
+                raise
+        result_path = os.path.join(settings.REPORT_JOBS_DIR, f"{job.pk}.{job.export_format}")
+        os.replace(file.name, result_path)
+
+        job.status = ReportJobStatus.COMPLETED
+        job.progress = 100
+        job.result_path = result_path
+    except Exception as exc:
+        logger.exception("Report job %s failed", job.pk)
+        job.status = ReportJobStatus.FAILED
+        job.error = str(exc)
+    
+    job.completed_at = timezone.now()
+    job.save(update_fields=["status", "progress", "rows_count", "result_path", "error", "completed_at"])
+    return None
+
+
+def _run_report_job_in_worker(job_pk: str) -> None:
+    try:
+        run_report_job(job_pk)
+        delete_expired_report_jobs()
+    except Exception:
+        logger.exception("Report job %s could not be run", job_pk)
+    finally:
+        # Worker threads do not go through the request cycle that closes connections
+        connection.close()
+    return None
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reports.jobs import fail_lost_report_jobs, delete_expired_report_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Marks report jobs that have not finished within the REPORT_JOB_TIMEOUT setting as failed, "
+        "and deletes report jobs older than the REPORT_JOB_RESULT_TTL setting, along with their report files."
+    )
+
+    def handle(self, *args, **options):
+        failed = fail_lost_report_jobs()
+        deleted = delete_expired_report_jobs()
+        self.stdout.write(self.style.SUCCESS(f"Marked {failed} lost report jobs as failed, and deleted {deleted} expired report jobs"))
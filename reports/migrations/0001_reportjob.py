@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:03
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('stores', '0003_add_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('export_format', models.CharField(max_length=10)),
+                ('filters', models.JSONField(blank=True, default=dict, help_text='The report filter params the job was requested with.')),
+                ('filters_hash', models.CharField(help_text='Hash of the store, export format and normalized filters of the job. Jobs with the same hash produce the same report.', max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('progress', models.PositiveSmallIntegerField(default=0, help_text='Percentage of the report that has been written.')),
+                ('rows_count', models.PositiveIntegerField(default=0)),
+                ('result_path', models.CharField(blank=True, max_length=500)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_jobs', to=settings.AUTH_USER_MODEL)),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_jobs', to='stores.store')),
+            ],
+            options={
+                'verbose_name': 'report job',
+                'verbose_name_plural': 'report jobs',
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['store', 'filters_hash', 'created_at'], name='report_job_filters_hash_idx')],
+            },
+        ),
+    ]
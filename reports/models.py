@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import uuid
+from typing import Any, Dict
+from django.db import models
+from django.conf import settings
+from django_utz.decorators import model
+
+
+
+class ReportJobStatus(models.TextChoices):
+    """Choices for the status of a report job."""
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    COMPLETED = "completed", "Completed"
+    FAILED = "failed", "Failed"
+
+
+
+@model
+class ReportJob(models.Model):
+    """
+    Model for a sales report export that is generated in the background, 
+    and written to a file in the `REPORT_JOBS_DIR` directory.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    store = models.ForeignKey("stores.Store", on_delete=models.CASCADE, related_name="report_jobs")
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="report_jobs")
+    export_format = models.CharField(max_length=10)
+    filters = models.JSONField(default=dict, blank=True, help_text="The report filter params the job was requested with.")
+    filters_hash = models.CharField(
+        max_length=64, 
+        help_text="Hash of the store, export format and normalized filters of the job. Jobs with the same hash produce the same report."
+    )
+    status = models.CharField(max_length=20, choices=ReportJobStatus.choices, default=ReportJobStatus.PENDING)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percentage of the report that has been written.")
+    rows_count = models.PositiveIntegerField(default=0)
+    result_path = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "report job"
+        verbose_name_plural = "report jobs"
+        ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=("store", "filters_hash", "created_at"), name="report_job_filters_hash_idx"),
+        ]
+
+    class UTZMeta:
+        datetime_fields = "__all__"
+
+
+    def __str__(self) -> str:
+        return f"{self.store.name} - {self.export_format} report ({self.status})"
+    
+
+    @staticmethod
+    def get_filters_hash(store_pk: Any, export_format: str, filters: Dict[str, str]) -> str:
+        """
+        Returns the hash of the store, export format and filters of a report.
+
+        Filters with empty values are ignored, and list filters are sorted, 
+        such that equivalent filters have the same hash.
+        """
+        normalized_filters = {}
+        for param, value in filters.items():
+            if not value:
+                continue
+            if "," in value:
+                value = ",".join(sorted(value.split(",")))
+            normalized_filters[param] = value
+        
+        key = json.dumps([str(store_pk), export_format, normalized_filters], sort_keys=True)
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (ReportJobStatus.COMPLETED, ReportJobStatus.FAILED)
+    
+
+    @property
+    def has_result(self) -> bool:
+        return self.status == ReportJobStatus.COMPLETED and bool(self.result_path) and os.path.exists(self.result_path)
+    
+
+    @property
+    def filename(self) -> str:
+        return f"{self.store.slug}-sales-report-{self.created_at.strftime('%Y%m%d%H%M%S')}.{self.export_format}"
@@ -1,3 +1,302 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import zipfile
+from datetime import timedelta
+from django.conf import settings
+from django.http import Http404
+from django.test import TestCase, RequestFactory
+from django.utils import timezone
+from djmoney.money import Money
 
-# Create your tests here.
+from graphi.testing import QueryPlanTestMixin
+from users.models import UserAccount
+from stores.models import Store
+from stores.exchange import exchange_rates
+from products.models import Product
+from sales.models import Sale
+from sales.utils import record_checkout
+from .views import SalesReportView, SalesReportExportView
+from .exports import SALES_EXPORT_HEADER
+from .utils import get_sales_pivot, get_sales_totals
+from .jobs import get_or_queue_report_job, run_report_job, fail_lost_report_jobs, delete_expired_report_jobs
+from .models import ReportJob, ReportJobStatus
+
+
+class SalesReportViewQueryPlanTestCase(QueryPlanTestMixin, TestCase):
+    """Checks that the queries of the sales report view use indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(name="Test Product", price=Money(100, "NGN"), quantity=10, store=cls.store)
+        Sale.objects.create(store=cls.store, product=cls.product, quantity=1)
+
+
+    def get_queryset(self, **params):
+        request = RequestFactory().get("/", params)
+        request.user = self.user
+        view = SalesReportView()
+        view.setup(request, store_slug=self.store.slug)
+        return view.get_queryset()
+
+
+    def test_queryset_uses_indexes(self):
+        self.assertNoFullTableScans(self.get_queryset())
+
+
+    def test_filtered_queryset_uses_indexes(self):
+        for params in (
+            {"date": "2024-01-01"},
+            {"from_date": "2024-01-01", "to_date": "2024-01-31"},
+            {"categories": "food,books"},
+            {"min_price": 10, "max_price": 500},
+            {"from_time": "08:00", "to_time": "17:00"},
+        ):
+            with self.subTest(params=params):
+                self.assertNoFullTableScans(self.get_queryset(**params))
+
+
+
+class SalesReportExportViewTestCase(TestCase):
+    """Checks that the sales report export view streams the filtered sales."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(name="Test Product", price=Money(100, "NGN"), quantity=10, store=cls.store)
+        Sale.objects.create(store=cls.store, product=cls.product, quantity=1)
+        Sale.objects.create(store=cls.store, product=cls.product, quantity=3)
+
+
+    def export(self, export_format, **params):
+        request = RequestFactory().get("/", params)
+        request.user = self.user
+        return SalesReportExportView.as_view()(request, store_slug=self.store.slug, export_format=export_format)
+
+
+    def test_csv_export(self):
+        response = self.export("csv", min_quantity=2)
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], list(SALES_EXPORT_HEADER))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][1:5], ["Test Product", "3", "300.00", "NGN"])
+
+
+    def test_xlsx_export(self):
+        response = self.export("xlsx")
+        self.assertTrue(response.streaming)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as workbook:
+            sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), 3)
+        self.assertIn("Test Product", sheet)
+
+
+    def test_unsupported_export_format(self):
+        with self.assertRaises(Http404):
+            self.export("pdf")
+
+
+
+class SalesReportViewPaginationTestCase(TestCase):
+    """Checks that the sales report view pages through all the sales, with totals for all of them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(name="Test Product", price=Money(100, "NGN"), quantity=20, store=cls.store)
+        for _ in range(5):
+            Sale.objects.create(store=cls.store, product=cls.product, quantity=2)
+
+
+    def get_context_data(self, **params):
+        request = RequestFactory().get("/", params)
+        request.user = self.user
+        view = SalesReportView(keyset_page_size=2)
+        view.setup(request, store_slug=self.store.slug)
+        view.object_list = view.get_queryset()
+        return view.get_context_data()
+
+
+    def test_pages_cover_all_sales(self):
+        sale_pks = []
+        params = {}
+        while True:
+            context = self.get_context_data(**params)
+            self.assertEqual(context["page_start_index"], len(sale_pks) + 1)
+            self.assertEqual(context["sales_count"], 5)
+            self.assertEqual(context["total_quantity_sold"], 10)
+            self.assertEqual(context["total_revenue"], Money(1000, "NGN"))
+            sale_pks.extend(sale.pk for sale in context["sales"])
+            if not context["next_cursor"]:
+                break
+            params = {"cursor": context["next_cursor"]}
+
+        expected_pks = list(Sale.objects.order_by("-made_at", "-id").values_list("pk", flat=True))
+        self.assertEqual(sale_pks, expected_pks)
+
+
+    def test_pages_cover_sales_made_at_the_same_time(self):
+        # The sales of a checkout are made at the same time, to the microsecond
+        products = [
+            Product.objects.create(name=f"Product {index}", price=Money(10, "NGN"), quantity=5, store=self.store)
+            for index in range(5)
+        ]
+        record_checkout(
+            self.store, [{"product": str(product.pk), "quantity": 1} for product in products], idempotency_key="checkout"
+        )
+        Sale.objects.filter(checkout__isnull=True).delete()
+
+        sale_pks = []
+        params = {}
+        while True:
+            context = self.get_context_data(**params)
+            sale_pks.extend(sale.pk for sale in context["sales"])
+            if not context["next_cursor"]:
+                break
+            params = {"cursor": context["next_cursor"]}
+
+        self.assertEqual(len(sale_pks), 5)
+        self.assertEqual(set(sale_pks), set(Sale.objects.values_list("pk", flat=True)))
+
+
+
+class SalesPivotTestCase(TestCase):
+    """Checks the grouping, ordering and limiting of sales pivots."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.food = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=20, store=cls.store, category="food")
+        cls.book = Product.objects.create(name="Novel", price=Money(500, "NGN"), quantity=20, store=cls.store, category="books")
+        Sale.objects.create(store=cls.store, product=cls.food, quantity=3, payment_method="cash")
+        Sale.objects.create(store=cls.store, product=cls.food, quantity=2, payment_method="card")
+        Sale.objects.create(store=cls.store, product=cls.book, quantity=1, payment_method="cash")
+
+
+    def test_pivot_by_one_dimension(self):
+        pivot = get_sales_pivot(Sale.objects.all(), ["product"], currency="NGN", order_by="-quantity")
+        self.assertEqual([group["labels"] for group in pivot], [["Rice"], ["Novel"]])
+        self.assertEqual(pivot[0]["count"], 2)
+        self.assertEqual(pivot[0]["quantity"], 5)
+        self.assertEqual(pivot[0]["revenue"], Money(500, "NGN"))
+
+
+    def test_revenue_in_currencies_with_no_rate_is_left_out_and_reported(self):
+        exchange_rates.invalidate()
+        self.addCleanup(exchange_rates.invalidate)
+        euro_product = Product.objects.create(name="Wine", price=Money(10, "EUR"), quantity=5, store=self.store, category="food")
+        Sale.objects.create(store=self.store, product=euro_product, quantity=1)
+
+        pivot = {group["labels"][0]: group for group in get_sales_pivot(Sale.objects.all(), ["category"], currency="NGN")}
+        self.assertEqual(pivot["Food"]["count"], 3)
+        self.assertEqual(pivot["Food"]["revenue"], Money(500, "NGN"))
+
+        totals = get_sales_totals(Sale.objects.all(), currency="NGN")
+        self.assertEqual(totals["count"], 4)
+        self.assertEqual(totals["total_revenue"], Money(1000, "NGN"))
+        self.assertEqual(totals["excluded_currencies"], ["EUR"])
+
+
+    def test_pivot_by_two_dimensions_with_limit(self):
+        pivot = get_sales_pivot(Sale.objects.all(), ["category", "payment_method"], currency="NGN", limit=2)
+        self.assertEqual(len(pivot), 2)
+        self.assertEqual(pivot[0]["labels"], ["Books", "Cash"])
+        self.assertEqual(pivot[0]["revenue"], Money(500, "NGN"))
+
+
+    def test_invalid_pivot(self):
+        for dimensions, order_by in ((["bogus"], "-revenue"), (["product", "product"], "-revenue"), (["product"], "price")):
+            with self.subTest(dimensions=dimensions, order_by=order_by):
+                with self.assertRaises(ValueError):
+                    get_sales_pivot(Sale.objects.all(), dimensions, currency="NGN", order_by=order_by)
+
+
+
+class ReportJobTestCase(TestCase):
+    """Checks that report jobs are reused for the same report, and write the report to a file."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(name="Test Product", price=Money(100, "NGN"), quantity=10, store=cls.store)
+        Sale.objects.create(store=cls.store, product=cls.product, quantity=1)
+        Sale.objects.create(store=cls.store, product=cls.product, quantity=3)
+
+
+    def test_equivalent_filters_have_the_same_hash(self):
+        self.assertEqual(
+            ReportJob.get_filters_hash(self.store.pk, "csv", {"categories": "food,books", "date": ""}),
+            ReportJob.get_filters_hash(self.store.pk, "csv", {"categories": "books,food"}),
+        )
+        self.assertNotEqual(
+            ReportJob.get_filters_hash(self.store.pk, "csv", {"categories": "food"}),
+            ReportJob.get_filters_hash(self.store.pk, "xlsx", {"categories": "food"}),
+        )
+
+
+    def test_report_job(self):
+        with tempfile.TemporaryDirectory() as jobs_dir, self.settings(REPORT_JOBS_DIR=jobs_dir):
+            with self.captureOnCommitCallbacks() as callbacks:
+                job, queued = get_or_queue_report_job(self.store, self.user, "csv", {"min_quantity": "2"})
+            self.assertTrue(queued)
+            self.assertEqual(len(callbacks), 1)
+
+            run_report_job(job.pk)
+            job.refresh_from_db()
+            self.assertEqual(job.status, ReportJobStatus.COMPLETED)
+            self.assertEqual(job.rows_count, 1)
+            with open(job.result_path) as file:
+                self.assertEqual(len(list(csv.reader(file))), 2)
+
+            same_job, queued = get_or_queue_report_job(self.store, self.user, "csv", {"min_quantity": "2"})
+            self.assertFalse(queued)
+            self.assertEqual(same_job, job)
+
+
+    def test_lost_report_job_is_failed_and_replaced(self):
+        with self.captureOnCommitCallbacks():
+            job, _ = get_or_queue_report_job(self.store, self.user, "csv", {})
+        ReportJob.objects.filter(pk=job.pk).update(
+            status=ReportJobStatus.RUNNING, started_at=timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT + 1)
+        )
+
+        with self.captureOnCommitCallbacks():
+            new_job, queued = get_or_queue_report_job(self.store, self.user, "csv", {})
+        self.assertTrue(queued)
+        self.assertNotEqual(new_job, job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJobStatus.FAILED)
+        self.assertTrue(job.error)
+
+        # A job that waited in the queue for longer than the timeout is not run
+        ReportJob.objects.filter(pk=new_job.pk).update(
+            created_at=timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT + 1)
+        )
+        self.assertEqual(fail_lost_report_jobs(), 1)
+        run_report_job(new_job.pk)
+        new_job.refresh_from_db()
+        self.assertEqual(new_job.status, ReportJobStatus.FAILED)
+
+
+    def test_expired_report_jobs_are_deleted_with_their_files(self):
+        with tempfile.TemporaryDirectory() as jobs_dir, self.settings(REPORT_JOBS_DIR=jobs_dir):
+            with self.captureOnCommitCallbacks():
+                expired_job, _ = get_or_queue_report_job(self.store, self.user, "csv", {})
+                job, _ = get_or_queue_report_job(self.store, self.user, "xlsx", {})
+            run_report_job(expired_job.pk)
+            run_report_job(job.pk)
+            ReportJob.objects.filter(pk=expired_job.pk).update(
+                created_at=timezone.now() - timedelta(seconds=settings.REPORT_JOB_RESULT_TTL + 1)
+            )
+            
+            self.assertEqual(delete_expired_report_jobs(), 1)
+            self.assertEqual(os.listdir(jobs_dir), [os.path.basename(ReportJob.objects.get().result_path)])
+            self.assertEqual(ReportJob.objects.get(), job)
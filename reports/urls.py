@@ -7,4 +7,7 @@ app_name = "reports"
 
 urlpatterns = [
     path("sales/", views.sales_report_view, name="sales_report"),
+    path("sales/export/<str:export_format>/", views.sales_report_export_view, name="sales_report_export"),
+    path("jobs/<uuid:job_id>/", views.report_job_detail_view, name="report_job_detail"),
+    path("jobs/<uuid:job_id>/download/", views.report_job_download_view, name="report_job_download"),
 ]
@@ -1,24 +1,145 @@
+import zoneinfo
+from typing import Any, Dict, List
 from djmoney.money import Money
+from djmoney.contrib.exchange.exceptions import MissingRate
 from decimal import Decimal
+from django.db.models import QuerySet, Count, Sum, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 
-from sales.models import Sale
+from products.models import ProductCategories
+from sales.models import PaymentMethod
+from stores.exchange import convert_money, get_conversion_expression
 
 
 
-def get_total_sales_revenue(sales: list[Sale], currency: str = None) -> Money:
+def get_sales_totals(sales: QuerySet, currency: str) -> Dict[str, Any]:
     """
-    Returns the total revenue made from a list of sales.
+    Returns the number of sales, the total quantity sold and the total revenue made from a queryset of sales.
 
-    :param sales: The list of sales to calculate revenue from.
-    :param currency: The currency to return the revenue in. Defaults to the currency of the first sale.
-    :return: The total revenue made from the sales.
+    The totals are aggregated in the database, in one query grouped by the currency of the sales,
+    and the revenue made in each currency is converted to the given currency. Revenue made in 
+    currencies with no exchange rate to the given currency is left out of the total revenue.
+
+    :param sales: The queryset of sales to calculate the totals for.
+    :param currency: The currency to return the total revenue in.
+    :return: A dictionary with the keys `count`, `total_quantity`, `total_revenue`, 
+    and `excluded_currencies`, the currencies whose revenue was left out of the total revenue.
     """
-    if not sales:
-        raise ValueError("No sales to calculate revenue from")
+    totals_per_currency = (
+        sales.order_by() # Clear the ordering so it does not affect the grouping
+        .values("amount_currency")
+        .annotate(count=Count("pk"), total_quantity=Sum("quantity"), total_amount=Sum("amount"))
+    )
+    totals = {
+        "count": 0,
+        "total_quantity": 0,
+        "total_revenue": Money(Decimal(0), currency),
+        "excluded_currencies": [],
+    }
+    for currency_totals in totals_per_currency:
+        totals["count"] += currency_totals["count"]
+        totals["total_quantity"] += currency_totals["total_quantity"] or 0
+        revenue = Money(currency_totals["total_amount"] or Decimal(0), currency_totals["amount_currency"])
+        if str(revenue.currency) != str(currency):
+            try:
+                revenue = convert_money(revenue, currency)
+            except MissingRate:
+                totals["excluded_currencies"].append(str(revenue.currency))
+                continue
+        totals["total_revenue"] += revenue
+    totals["excluded_currencies"].sort()
+    return totals
+
+
+# The dimensions sales can be pivoted by, mapped to the values each dimension is grouped by.
+# The first value of each dimension is used as its label.
+PIVOT_DIMENSIONS = {
+    "product": {"product_name": F("product__name"), "product_pk": F("product")},
+    "category": {"category_value": F("category")},
+    "brand": {"brand_name": F("product__brand__name"), "brand_pk": F("product__brand")},
+    "group": {"group_name": F("product__group__name"), "group_pk": F("product__group")},
+    "payment_method": {"payment_method_value": F("payment_method")},
+    "day": {"day": None}, # Truncated to the date in the timezone of the report
+}
+
+PIVOT_ORDERINGS = ("count", "quantity", "revenue")
+
+MAX_PIVOT_LIMIT = 1000
+
+
+def get_sales_pivot(
+        sales: QuerySet,
+        dimensions: List[str],
+        currency: str,
+        tz: zoneinfo.ZoneInfo = None,
+        order_by: str = "-revenue",
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+    """
+    Groups a queryset of sales by one or two dimensions, and returns the number of sales, 
+    the quantity sold and the revenue made in each group.
+
+    The groups are aggregated, ordered and limited in the database, in one GROUP BY query.
+    The revenue of each sale is converted to the given currency in the query, so that
+    groups can be ordered by revenue even when sales are made in different currencies.
+    Revenue made in currencies with no exchange rate is left out, as it is by `get_sales_totals`,
+    which returns these currencies.
+
+    :param sales: The queryset of sales to pivot.
+    :param dimensions: The dimensions to group the sales by. Any of the keys of `PIVOT_DIMENSIONS`.
+    :param currency: The currency to return the revenue of each group in.
+    :param tz: The timezone in which sales are grouped by day. Defaults to the current timezone.
+    :param order_by: The aggregate to order the groups by. Any of `PIVOT_ORDERINGS`, prefixed with "-" for descending order.
+    :param limit: The maximum number of groups to return. The top groups in the ordering are returned.
+    :return: A list of groups, each of the form `{"labels": [...], "count": ..., "quantity": ..., "revenue": ...}`.
+    :raises ValueError: If any of the dimensions, the ordering or the limit is invalid.
+    """
+    if not 1 <= len(dimensions) <= 2:
+        raise ValueError("Sales can only be pivoted by one or two dimensions")
+    if len(set(dimensions)) != len(dimensions):
+        raise ValueError("Sales cannot be pivoted by the same dimension twice")
+    invalid_dimensions = set(dimensions) - set(PIVOT_DIMENSIONS)
+    if invalid_dimensions:
+        raise ValueError(f"Invalid pivot dimension(s): {', '.join(invalid_dimensions)}")
+    if order_by.lstrip("-") not in PIVOT_ORDERINGS:
+        raise ValueError(f"Invalid pivot ordering: {order_by}")
+    if not 1 <= limit <= MAX_PIVOT_LIMIT:
+        raise ValueError(f"Pivot limit must be between 1 and {MAX_PIVOT_LIMIT}")
     
-    currency = currency or sales[0].store.default_currency
-    t = Money(Decimal(0), currency)
-    for sale in sales:
-        t += sale.revenue
-    return t
+    group_by = {}
+    for dimension in dimensions:
+        if dimension == "day":
+            group_by["day"] = TruncDate("made_at", tzinfo=tz or timezone.get_current_timezone())
+        else:
+            group_by.update(PIVOT_DIMENSIONS[dimension])
+
+    groups = (
+        sales.order_by()
+        .values(**group_by)
+        .annotate(
+            count=Count("pk"),
+            quantity=Sum("quantity"),
+            revenue=Sum(get_conversion_expression("amount", currency)),
+        )
+        .order_by(order_by, *group_by)[:limit]
+    )
+
+    pivot = []
+    for group in groups:
+        labels = []
+        for dimension in dimensions:
+            label = group[next(iter(PIVOT_DIMENSIONS[dimension]))]
+            if dimension == "category" and label:
+                label = ProductCategories(label).label
+            elif dimension == "payment_method" and label:
+                label = PaymentMethod(label).label
+            labels.append(label)
 
+        pivot.append({
+            "labels": labels,
+            "count": group["count"],
+            "quantity": group["quantity"] or 0,
+            "revenue": Money(group["revenue"] or Decimal(0), currency),
+        })
+    return pivot
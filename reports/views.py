@@ -1,16 +1,31 @@
+from typing import Any, List
+from django.db.models import QuerySet
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.conf import settings
+from django.http import (
+    Http404, HttpRequest, HttpResponse, HttpResponseRedirect, 
+    JsonResponse, FileResponse, StreamingHttpResponse
+)
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils import timezone
 from django.views import generic
 
 from sales.models import Sale
-from stores.mixins import StoreQuerySetMixin, SupportsQuerySetFiltering
+from stores.mixins import RequestStoreMixin, StoreQuerySetMixin, SupportsQuerySetFiltering, KeysetPaginationMixin
 from users.mixins import RequestUserQuerySetMixin
-from .utils import get_total_sales_revenue
+from .utils import get_sales_totals, get_sales_pivot, PIVOT_DIMENSIONS, PIVOT_ORDERINGS
+from .exports import SALES_EXPORT_HEADER, iter_sales_export_rows, stream_csv, stream_xlsx
+from .jobs import get_or_queue_report_job, fail_lost_report_jobs
+from .models import ReportJob
 
 
-sale_queryset = Sale.objects.all().select_related("store", "product")
+# The sales of deleted products are hidden until they are purged
+sale_queryset = Sale.objects.filter(product__deleted_at__isnull=True).select_related("store", "product")
 
 
 class SalesReportView(
+    KeysetPaginationMixin,
     SupportsQuerySetFiltering,
     RequestUserQuerySetMixin,
     StoreQuerySetMixin,
@@ -47,21 +62,173 @@ class SalesReportView(
         "date": "made_at__date",
         "from_date": "made_at__date__gte",
         "to_date": "made_at__date__lte",
-        "from_time": "made_at__time__gte",
-        "to_time": "made_at__time__lte",
+        "from_time": "local_time__gte",
+        "to_time": "local_time__lte",
     }
 
+    # For the KeysetPaginationMixin
+    keyset_ordering = ("-made_at", "-id")
+    keyset_page_size = 50
+
+    def get_pivot_dimensions(self) -> List[str]:
+        """
+        Returns the dimensions the report is pivoted by, from the `group_by` query parameter.
+        The report lists the sales if it is not pivoted.
+        """
+        group_by = ",".join(self.request.GET.getlist("group_by"))
+        return [ dimension for dimension in group_by.split(",") if dimension ]
+    
+
+    def paginate_by_keyset(self, queryset: QuerySet) -> tuple[list, str | None, int]:
+        if self.get_pivot_dimensions():
+            # A pivoted report shows the groups of sales, not the sales
+            return [], None, 1
+        return super().paginate_by_keyset(queryset)
+    
+
     def get_context_data(self, *args, **kwargs) -> dict:
         context = super().get_context_data(*args, **kwargs)
-        sales = context["sales"]
-        if sales:
-            context["total_revenue"] = get_total_sales_revenue(sales)
-            context["total_quantity_sold"] = sum(sale.quantity for sale in sales)
+        store = self.get_store()
+        pivot_dimensions = self.get_pivot_dimensions()
+        if pivot_dimensions:
+            try:
+                limit = int(self.request.GET.get("limit") or 50)
+                context["pivot"] = get_sales_pivot(
+                    self.object_list,
+                    pivot_dimensions,
+                    currency=store.default_currency,
+                    tz=self.request.user.timezone,
+                    order_by=self.request.GET.get("order_by") or "-revenue",
+                    limit=limit,
+                )
+            except ValueError as exc:
+                raise Http404(str(exc)) from exc
+            context["pivot_dimensions"] = [ dimension.replace("_", " ") for dimension in pivot_dimensions ]
+        context["selected_pivot_dimensions"] = pivot_dimensions + [""] * (2 - len(pivot_dimensions))
+
+        if context["sales"] or context.get("pivot"):
+            # Totals are for all the sales in the report, not just the sales on the page
+            totals = get_sales_totals(self.object_list, currency=store.default_currency)
+            context["total_revenue"] = totals["total_revenue"]
+            context["total_quantity_sold"] = totals["total_quantity"]
+            context["sales_count"] = totals["count"]
+            context["excluded_currencies"] = totals["excluded_currencies"]
 
-        store = self._get_store()
+        context["filter_params"] = [ 
+            (param, value) for param, value in self.request.GET.items() if param in self.filter_mappings 
+        ]
+        context["pivot_dimension_choices"] = list(PIVOT_DIMENSIONS)
+        context["pivot_ordering_choices"] = PIVOT_ORDERINGS
         context["store"] = store
         context["has_made_sales"] = Sale.objects.filter(store=store).exists()
         return context
 
 
 sales_report_view = SalesReportView.as_view()
+
+
+class SalesReportExportView(SalesReportView):
+    """
+    View for exporting store sales report as a CSV or XLSX file.
+
+    The report is filtered by the same query parameters as the `SalesReportView`, 
+    and is streamed to the client as the sales are read from the database.
+    """
+    queryset = Sale.objects.filter(product__deleted_at__isnull=True)
+    chunk_size = 2000
+    export_formats = {
+        "csv": "text/csv",
+        "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    }
+
+    def get(self, request: HttpRequest, *args: str, **kwargs: Any) -> StreamingHttpResponse | HttpResponseRedirect:
+        export_format = kwargs.get("export_format")
+        if export_format not in self.export_formats:
+            raise Http404(f"Unsupported export format: {export_format}")
+        
+        sales = self.get_queryset()
+        if sales[:settings.REPORT_JOB_ROW_THRESHOLD + 1].count() > settings.REPORT_JOB_ROW_THRESHOLD:
+            # Too many sales to export within a request. Generate the report in the background.
+            filters = { param: value for param, value in request.GET.items() if param in self.filter_mappings }
+            job, _ = get_or_queue_report_job(self.get_store(), request.user, export_format, filters)
+            return redirect("stores:reports:report_job_detail", store_slug=kwargs["store_slug"], job_id=job.pk)
+
+        rows = iter_sales_export_rows(sales, request.user.timezone, chunk_size=self.chunk_size)
+        if export_format == "csv":
+            content = stream_csv(SALES_EXPORT_HEADER, rows)
+        else:
+            content = stream_xlsx(SALES_EXPORT_HEADER, rows, sheet_name="Sales")
+
+        filename = f"{kwargs['store_slug']}-sales-report-{timezone.now().strftime('%Y%m%d%H%M%S')}.{export_format}"
+        response = StreamingHttpResponse(content, content_type=self.export_formats[export_format])
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+sales_report_export_view = SalesReportExportView.as_view()
+
+
+
+class ReportJobDetailView(RequestStoreMixin, LoginRequiredMixin, generic.DetailView):
+    """
+    View for polling the status of a report job. 
+    
+    Returns the status as JSON for AJAX/Fetch requests, otherwise renders a page that refreshes until the job is finished.
+    """
+    model = ReportJob
+    context_object_name = "job"
+    template_name = "reports/report_job.html"
+    http_method_names = ["get"]
+    pk_url_kwarg = "job_id"
+
+    # For the RequestStoreMixin
+    store_identifier = "slug"
+    store_url_kwarg = "store_slug"
+
+    def get_queryset(self) -> QuerySet[ReportJob]:
+        return ReportJob.objects.filter(
+            store=self.get_store(), requested_by=self.request.user
+        ).select_related("store")
+    
+
+    def get(self, request: HttpRequest, *args: str, **kwargs: Any) -> HttpResponse:
+        self.object = job = self.get_object()
+        if not job.is_finished and fail_lost_report_jobs(ReportJob.objects.filter(pk=job.pk)):
+            job.refresh_from_db()
+        if request.headers.get("Accept") == "application/json":
+            download_url = None
+            if job.has_result:
+                download_url = reverse(
+                    "stores:reports:report_job_download", kwargs={"store_slug": job.store.slug, "job_id": job.pk}
+                )
+            return JsonResponse(
+                data={
+                    "status": "success",
+                    "detail": "Report job retrieved successfully!",
+                    "data": {
+                        "id": str(job.pk),
+                        "status": job.status,
+                        "progress": job.progress,
+                        "rows_count": job.rows_count,
+                        "error": job.error or None,
+                        "download_url": download_url,
+                    }
+                },
+                status=200
+            )
+        return self.render_to_response(self.get_context_data(object=job))
+
+
+
+class ReportJobDownloadView(ReportJobDetailView):
+    """View for downloading the report file of a completed report job."""
+
+    def get(self, request: HttpRequest, *args: str, **kwargs: Any) -> FileResponse:
+        job = self.get_object()
+        if not job.has_result:
+            raise Http404("Report is not available")
+        return FileResponse(open(job.result_path, "rb"), as_attachment=True, filename=job.filename)
+
+
+report_job_detail_view = ReportJobDetailView.as_view()
+report_job_download_view = ReportJobDownloadView.as_view()
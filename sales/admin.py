@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from .models import Sale
+from .models import Sale, SalesDailyRollup, Checkout
 
 
 admin.site.register(Sale)
+admin.site.register(SalesDailyRollup)
+admin.site.register(Checkout)
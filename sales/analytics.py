@@ -0,0 +1,175 @@
+import datetime
+import zoneinfo
+from typing import Any, Dict, List, Sequence
+
+from stores.exchange import exchange_rates
+from .columnar import SalesColumns, np
+
+
+ANALYTICS_VALUES = ("count", "quantity", "revenue")
+
+
+def get_values(columns: SalesColumns, value: str = "revenue", currency: str = "NGN") -> "np.ndarray":
+    """
+    Returns the value of each sale in the columns.
+
+    :param columns: The columns of the sales.
+    :param value: The value to return. "count" (1 per sale), "quantity" or "revenue".
+    :param currency: The currency to return revenue in. Revenue in currencies with no exchange rate is NaN.
+    """
+    if value == "count":
+        return np.ones(len(columns), dtype=np.float64)
+    if value == "quantity":
+        return columns.quantity.astype(np.float64)
+    if value != "revenue":
+        raise ValueError(f"Invalid analytics value: {value}")
+    
+    rates = exchange_rates.get_rates_to(currency)
+    # Rates per currency index, scaled from minor units
+    factors = np.array([ float(rates.get(code, np.nan)) / 100 for code in columns.currencies ], dtype=np.float64)
+    if not len(factors):
+        return np.zeros(len(columns), dtype=np.float64)
+    return columns.unit_amount * columns.quantity * factors[columns.currency]
+
+
+def get_local_timestamps(timestamps: "np.ndarray", tz: zoneinfo.ZoneInfo) -> "np.ndarray":
+    """
+    Returns the Unix timestamps shifted by the UTC offset of the timezone at each timestamp, 
+    such that the date and time of a shifted timestamp in UTC are its date and time in the timezone.
+    """
+    if not len(timestamps):
+        return timestamps
+    # Offsets change on the hour at most, so only look up the offset of each hour in the range of the timestamps
+    hours = timestamps // 3600
+    first_hour = int(hours.min())
+    offsets = np.array(
+        [ 
+            datetime.datetime.fromtimestamp(hour * 3600, tz).utcoffset().total_seconds() 
+            for hour in range(first_hour, int(hours.max()) + 1)
+        ],
+        dtype=np.int64,
+    )
+    return timestamps + offsets[hours - first_hour]
+
+
+def get_rolling_average(
+        columns: SalesColumns, 
+        tz: zoneinfo.ZoneInfo, 
+        window: int = 7, 
+        value: str = "revenue", 
+        currency: str = "NGN"
+    ) -> List[Dict[str, Any]]:
+    """
+    Returns the trailing rolling average of the daily totals of a value of the sales, 
+    for each day from the day of the first sale to the day of the last sale.
+
+    :param columns: The columns of the sales.
+    :param tz: The timezone of the days.
+    :param window: The number of days averaged.
+    :param value: The value totalled per day. Any of `ANALYTICS_VALUES`.
+    :param currency: The currency of revenue.
+    :return: A list of the form `[{"date": ..., "total": ..., "average": ...}, ...]`.
+    """
+    if window < 1:
+        raise ValueError("Window must be at least 1 day")
+    if not len(columns):
+        return []
+    
+    days = get_local_timestamps(columns.made_at, tz) // 86400
+    first_day = int(days.min())
+    totals = np.bincount(days - first_day, weights=np.nan_to_num(get_values(columns, value, currency)))
+    cumulative_totals = np.concatenate(([0.0], np.cumsum(totals)))
+    ends = np.arange(1, len(totals) + 1)
+    averages = (cumulative_totals[ends] - cumulative_totals[np.maximum(ends - window, 0)]) / window
+    return [
+        {
+            "date": datetime.date.fromordinal(datetime.date(1970, 1, 1).toordinal() + first_day + index),
+            "total": float(total),
+            "average": float(average),
+        }
+        for index, (total, average) in enumerate(zip(totals, averages))
+    ]
+
+
+def get_percentiles(
+        columns: SalesColumns, 
+        percentiles: Sequence[float] = (50, 90, 99), 
+        value: str = "revenue", 
+        currency: str = "NGN"
+    ) -> Dict[float, float | None]:
+    """
+    Returns the percentiles of a value of the sales, per sale.
+    Sales in currencies with no exchange rate are left out, and the percentiles are None if no sale is left.
+
+    :param columns: The columns of the sales.
+    :param percentiles: The percentiles to return, between 0 and 100.
+    :param value: The value of each sale. Any of `ANALYTICS_VALUES`.
+    :param currency: The currency of revenue.
+    """
+    if any(not 0 <= percentile <= 100 for percentile in percentiles):
+        raise ValueError("Percentiles must be between 0 and 100")
+    values = get_values(columns, value, currency)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return { percentile: None for percentile in percentiles }
+    
+    results = np.percentile(values, percentiles)
+    return { percentile: float(result) for percentile, result in zip(percentiles, results) }
+
+
+def get_top_products(
+        columns: SalesColumns, 
+        limit: int = 10, 
+        value: str = "revenue", 
+        currency: str = "NGN"
+    ) -> List[tuple[str, float]]:
+    """
+    Returns the products with the highest totals of a value of their sales.
+
+    :param columns: The columns of the sales.
+    :param limit: The number of products to return.
+    :param value: The value totalled per product. Any of `ANALYTICS_VALUES`.
+    :param currency: The currency of revenue.
+    :return: A list of `(product pk, total)` tuples, from the highest total.
+    """
+    if limit < 1:
+        raise ValueError("Limit must be at least 1")
+    if not len(columns):
+        return []
+    
+    totals = np.bincount(
+        columns.product, weights=np.nan_to_num(get_values(columns, value, currency)), minlength=len(columns.products)
+    )
+    limit = min(limit, len(totals))
+    # Partition out the top products, then sort only those
+    top = np.argpartition(-totals, limit - 1)[:limit]
+    top = top[np.argsort(-totals[top], kind="stable")]
+    return [ (columns.products[index], float(totals[index])) for index in top ]
+
+
+def get_hour_of_week_profile(
+        columns: SalesColumns, 
+        tz: zoneinfo.ZoneInfo, 
+        value: str = "count", 
+        currency: str = "NGN"
+    ) -> List[List[float]]:
+    """
+    Returns the totals of a value of the sales per hour of the week.
+
+    :param columns: The columns of the sales.
+    :param tz: The timezone of the hours.
+    :param value: The value totalled per hour. Any of `ANALYTICS_VALUES`.
+    :param currency: The currency of revenue.
+    :return: A 7 x 24 list of totals, indexed by weekday (Monday is 0) and hour.
+    """
+    if not len(columns):
+        return [[0.0] * 24 for _ in range(7)]
+    
+    local_timestamps = get_local_timestamps(columns.made_at, tz)
+    # 1970-01-01 was a Thursday, the 4th day of the week
+    weekdays = (local_timestamps // 86400 + 3) % 7
+    hours = (local_timestamps % 86400) // 3600
+    totals = np.bincount(
+        weekdays * 24 + hours, weights=np.nan_to_num(get_values(columns, value, currency)), minlength=7 * 24
+    )
+    return totals.reshape(7, 24).tolist()
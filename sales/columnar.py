@@ -0,0 +1,325 @@
+import contextlib
+import functools
+import json
+import os
+import shutil
+import threading
+from typing import Any, Dict, Iterable, Iterator, List
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+try:
+    import numpy as np
+except ImportError: # NumPy is an optional dependency, only needed when the columnar store is enabled
+    np = None
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows. Only threads of the same process are synchronized there.
+    fcntl = None
+
+
+# The columns of the sales columnar store, mapped to their data types
+SALE_COLUMNS = {
+    "made_at": "<i8", # Unix timestamp, in seconds
+    "product": "<i4", # Index of the product in the store's list of products
+    "quantity": "<i4",
+    "unit_amount": "<i8", # Unit price in minor units (hundredths), as sale prices have 2 decimal places
+    "currency": "<i2", # Index of the currency in the store's list of currencies
+}
+
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    """
+    Returns whether the sales columnar store is enabled, by the `SALES_COLUMNAR_STORE_ENABLED` setting.
+
+    :raises ImproperlyConfigured: If the store is enabled but NumPy is not installed.
+    """
+    enabled = getattr(settings, "SALES_COLUMNAR_STORE_ENABLED", False)
+    if enabled and np is None:
+        raise ImproperlyConfigured("NumPy must be installed to use the sales columnar store")
+    return enabled
+
+
+
+class SalesColumns:
+    """The columns of a set of sales, as NumPy arrays of equal length."""
+    def __init__(self, columns: Dict[str, "np.ndarray"], products: List[str], currencies: List[str]) -> None:
+        """
+        :param columns: A mapping of the names in `SALE_COLUMNS` to the arrays of the columns.
+        :param products: The primary keys of the products indexed by the product column.
+        :param currencies: The currencies indexed by the currency column.
+        """
+        self.made_at = columns["made_at"]
+        self.product = columns["product"]
+        self.quantity = columns["quantity"]
+        self.unit_amount = columns["unit_amount"]
+        self.currency = columns["currency"]
+        self.products = products
+        self.currencies = currencies
+
+    def __len__(self) -> int:
+        return len(self.made_at)
+
+
+    @classmethod
+    def concatenate(cls, columns_list: List["SalesColumns"]) -> "SalesColumns":
+        """Returns the columns of the sales of all the given columns, with their product and currency indices merged."""
+        products, currencies = [], []
+        currency_indices = {}
+        product_columns, currency_columns = [], []
+        for columns in columns_list:
+            product_columns.append(columns.product + len(products))
+            products.extend(columns.products)
+            for currency in columns.currencies:
+                currency_indices.setdefault(currency, len(currency_indices))
+            currency_map = np.array([currency_indices[currency] for currency in columns.currencies], dtype=SALE_COLUMNS["currency"])
+            currency_columns.append(currency_map[columns.currency] if len(currency_map) else columns.currency)
+
+        currencies = list(currency_indices)
+        merged = {
+            name: np.concatenate([getattr(columns, name) for columns in columns_list] or [np.empty(0, dtype)])
+            for name, dtype in SALE_COLUMNS.items()
+        }
+        if columns_list:
+            merged["product"] = np.concatenate(product_columns)
+            merged["currency"] = np.concatenate(currency_columns)
+        return cls(merged, products, currencies)
+
+
+
+class SalesColumnStore:
+    """
+    Append-only columnar mirror of the sales of a store, kept in one file per column
+    in the store's directory under the `SALES_COLUMNS_DIR` directory.
+
+    New sales are appended to the columns as they are recorded. Updating or deleting sales marks
+    the mirror as stale, and a stale mirror is rebuilt from the database the next time it is loaded.
+    The column files are memory-mapped when loaded, so loading does not read the columns into memory.
+    """
+    def __init__(self, store_pk: Any, directory: str = None) -> None:
+        self.store_pk = str(store_pk)
+        self.directory = os.path.join(directory or settings.SALES_COLUMNS_DIR, self.store_pk)
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+
+    def get_column_path(self, name: str, directory: str = None) -> str:
+        return os.path.join(directory or self.directory, f"{name}.col")
+
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[None]:
+        """Locks the store's mirror, against other threads and, where supported, other processes."""
+        with _thread_locks_lock:
+            thread_lock = _thread_locks.setdefault(self.store_pk, threading.Lock())
+
+        with thread_lock:
+            os.makedirs(os.path.dirname(self.directory), exist_ok=True)
+            with open(f"{self.directory}.lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+    def _read_meta(self) -> Dict[str, Any] | None:
+        try:
+            with open(self.meta_path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+    def _write_meta(self, meta: Dict[str, Any], directory: str = None) -> None:
+        path = os.path.join(directory or self.directory, "meta.json")
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(f"{path}.tmp", path)
+        return None
+
+
+    @staticmethod
+    def _get_rows(sales: Iterable[tuple], meta: Dict[str, Any]) -> Dict[str, "np.ndarray"]:
+        """
+        Returns the column arrays of the given `(made_at, product_pk, quantity, unit_price, currency)` rows,
+        adding new products and currencies to the lists in `meta`.
+        """
+        product_indices = { product_pk: index for index, product_pk in enumerate(meta["products"]) }
+        currency_indices = { currency: index for index, currency in enumerate(meta["currencies"]) }
+        rows = { name: [] for name in SALE_COLUMNS }
+        for made_at, product_pk, quantity, unit_price, currency in sales:
+            product_pk, currency = str(product_pk), str(currency)
+            if product_pk not in product_indices:
+                product_indices[product_pk] = len(meta["products"])
+                meta["products"].append(product_pk)
+            if currency not in currency_indices:
+                currency_indices[currency] = len(meta["currencies"])
+                meta["currencies"].append(currency)
+
+            rows["made_at"].append(int(made_at.timestamp()))
+            rows["product"].append(product_indices[product_pk])
+            rows["quantity"].append(quantity)
+            rows["unit_amount"].append(int((unit_price * 100).to_integral_value()))
+            rows["currency"].append(currency_indices[currency])
+        return { name: np.array(values, dtype=SALE_COLUMNS[name]) for name, values in rows.items() }
+
+
+    def _write_rows(self, rows: Dict[str, "np.ndarray"], directory: str = None) -> None:
+        for name, values in rows.items():
+            with open(self.get_column_path(name, directory), "ab") as file:
+                file.write(values.tobytes())
+        return None
+
+
+    def append(self, sales: Iterable[Any]) -> None:
+        """
+        Appends the given sales of the store to the mirror.
+        Nothing is appended if the mirror has not been built or is stale, as it will be rebuilt.
+        """
+        with self.lock():
+            meta = self._read_meta()
+            if meta is None or meta["stale"]:
+                return None
+
+            rows = self._get_rows(
+                (
+                    (sale.made_at, sale.product_id, sale.quantity, sale.unit_price.amount, sale.unit_price.currency)
+                    for sale in sales
+                ),
+                meta,
+            )
+            # Write the new products and currencies before the rows that index them
+            self._write_meta(meta)
+            self._write_rows(rows)
+        return None
+
+
+    def invalidate(self) -> None:
+        """Marks the mirror as stale, so that it is rebuilt the next time it is loaded."""
+        with self.lock():
+            meta = self._read_meta()
+            if meta is not None and not meta["stale"]:
+                meta["stale"] = True
+                self._write_meta(meta)
+        return None
+
+
+    def rebuild(self, chunk_size: int = 10000) -> int:
+        """
+        Rebuilds the mirror from the sales of the store in the database.
+
+        :param chunk_size: The number of sales read from the database at a time.
+        :return: The number of sales in the mirror.
+        """
+        with self.lock():
+            return self._rebuild(chunk_size)
+
+
+    def _rebuild(self, chunk_size: int = 10000) -> int:
+        """Rebuilds the mirror, which must be locked by the caller."""
+        Sale = apps.get_model("sales", "Sale")
+        sales = (
+            Sale.objects.filter(store_id=self.store_pk, product__deleted_at__isnull=True)
+            .order_by("made_at")
+            .values_list("made_at", "product_id", "quantity", "unit_price", "unit_price_currency")
+            .iterator(chunk_size=chunk_size)
+        )
+        # Build the new mirror beside the current one, then swap them
+        build_directory = f"{self.directory}.build"
+        shutil.rmtree(build_directory, ignore_errors=True)
+        os.makedirs(build_directory)
+
+        meta = {"products": [], "currencies": [], "stale": False}
+        count = 0
+        chunk = []
+        for sale in sales:
+            chunk.append(sale)
+            if len(chunk) == chunk_size:
+                self._write_rows(self._get_rows(chunk, meta), build_directory)
+                count += len(chunk)
+                chunk = []
+        self._write_rows(self._get_rows(chunk, meta), build_directory)
+        count += len(chunk)
+        self._write_meta(meta, build_directory)
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(build_directory, self.directory)
+        return count
+
+
+    def load(self) -> SalesColumns:
+        """Returns the memory-mapped columns of the store's sales, rebuilding the mirror first if needed."""
+        # Read the metadata and the columns together, so that they are not swapped or appended to in between
+        with self.lock():
+            meta = self._read_meta()
+            if meta is None or meta["stale"]:
+                self._rebuild()
+                meta = self._read_meta()
+
+            columns = {}
+            for name, dtype in SALE_COLUMNS.items():
+                path = self.get_column_path(name)
+                length = os.path.getsize(path) // np.dtype(dtype).itemsize
+                columns[name] = np.memmap(path, dtype=dtype, mode="r", shape=(length,)) if length else np.empty(0, dtype)
+
+        # A column may be a row ahead of the others while sales are being appended
+        length = min(len(column) for column in columns.values())
+        # Only keep the rows up to the first one indexing a product or currency that is not in the metadata
+        unknown = np.flatnonzero(
+            (columns["product"][:length] >= len(meta["products"])) | (columns["currency"][:length] >= len(meta["currencies"]))
+        )
+        if len(unknown):
+            length = int(unknown[0])
+        return SalesColumns(
+            { name: column[:length] for name, column in columns.items() }, meta["products"], meta["currencies"]
+        )
+
+
+
+def record_sales(sales: List[Any]) -> None:
+    """
+    Appends new sales to the columnar mirrors of their stores, once the current transaction is committed.
+    Does nothing if the columnar store is not enabled.
+    """
+    if not is_enabled() or not sales:
+        return None
+
+    sales_per_store: Dict[Any, List[Any]] = {}
+    for sale in sales:
+        sales_per_store.setdefault(sale.store_id, []).append(sale)
+    for store_pk, store_sales in sales_per_store.items():
+        transaction.on_commit(functools.partial(SalesColumnStore(store_pk).append, store_sales))
+    return None
+
+
+def invalidate_sales(store_pk: Any) -> None:
+    """
+    Marks the columnar mirror of the store as stale, once the current transaction is committed.
+    Does nothing if the columnar store is not enabled.
+    """
+    if not is_enabled():
+        return None
+    transaction.on_commit(SalesColumnStore(store_pk).invalidate)
+    return None
+
+
+def load_sales_columns(store_pks: Iterable[Any]) -> SalesColumns:
+    """
+    Returns the columns of the sales of the given stores.
+
+    :raises ImproperlyConfigured: If the columnar store is not enabled.
+    """
+    if not is_enabled():
+        raise ImproperlyConfigured("The sales columnar store is not enabled")
+    return SalesColumns.concatenate([ SalesColumnStore(store_pk).load() for store_pk in store_pks ])
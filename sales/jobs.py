@@ -0,0 +1,69 @@
+import threading
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, transaction
+
+from users.models import UserAccount
+from products.models import Product
+from .models import Sale, SalesDailyRollup
+
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the worker pool that timezone change updates are run in. The pool is created on first use.
+
+    The pool has a single worker, so that the updates run in the order they were queued.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sales-job")
+    return _executor
+
+
+def queue_timezone_change_update(user: UserAccount) -> None:
+    """
+    Queues the update of the local times and daily rollups of the user's stores for the user's new timezone,
+    once the current transaction is committed.
+    """
+    transaction.on_commit(
+        functools.partial(get_executor().submit, _update_for_timezone_change_in_worker, user.pk, str(user.timezone))
+    )
+    return None
+
+
+def update_for_timezone_change(user_pk: str, new_timezone: str) -> None:
+    """
+    Recomputes the local times of the sales and products, and the daily sales rollups, of the user's stores,
+    if the new timezone is still the timezone of the user.
+    """
+    user = UserAccount.objects.filter(pk=user_pk).first()
+    # The timezone of the user may have changed again since the update was queued
+    if user is None or str(user.timezone) != new_timezone:
+        return None
+
+    stores = user.stores.select_related("owner")
+    Sale.update_local_times(stores)
+    Product.update_local_times(stores)
+    with transaction.atomic():
+        SalesDailyRollup.rebuild(stores)
+    return None
+
+
+def _update_for_timezone_change_in_worker(user_pk: str, new_timezone: str) -> None:
+    try:
+        update_for_timezone_change(user_pk, new_timezone)
+    except Exception:
+        logger.exception("Sales of user %s could not be updated for the timezone %s", user_pk, new_timezone)
+    finally:
+        # Worker threads do not go through the request cycle that closes connections
+        connection.close()
+    return None
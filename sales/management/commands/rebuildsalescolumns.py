@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.columnar import SalesColumnStore, is_enabled
+from stores.models import Store
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the columnar mirrors of the sales of stores, used for dashboard analytics."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--store",
+            action="append",
+            dest="stores",
+            default=None,
+            help="Slug of a store whose sales columns should be rebuilt. Can be repeated. Defaults to all stores.",
+        )
+
+    def handle(self, *args, **options):
+        if not is_enabled():
+            raise CommandError("The sales columnar store is not enabled. Set SALES_COLUMNAR_STORE_ENABLED to True.")
+        
+        stores = Store.objects.all()
+        if options["stores"]:
+            stores = stores.filter(slug__in=options["stores"])
+        count = 0
+        for store_pk in stores.values_list("pk", flat=True):
+            count += SalesColumnStore(store_pk).rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the sales columns of {len(stores)} stores, with {count} sales"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from sales.models import SalesDailyRollup
+from stores.models import Store
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily sales rollups of stores from their sales."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--store",
+            action="append",
+            dest="stores",
+            default=None,
+            help="Slug of a store whose rollups should be rebuilt. Can be repeated. Defaults to all stores.",
+        )
+
+    def handle(self, *args, **options):
+        stores = Store.objects.all()
+        if options["stores"]:
+            stores = stores.filter(slug__in=options["stores"])
+        created = SalesDailyRollup.rebuild(stores)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} daily sales rollups"))
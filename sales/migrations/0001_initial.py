@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:46
+
+import django.db.models.deletion
+import sales.models
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sale',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('transaction_id', models.CharField(default=sales.models.generate_transaction_id, max_length=100, unique=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('bank transfer', 'Bank Transfer')], default='cash', max_length=20)),
+                ('made_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'sale',
+                'verbose_name_plural': 'sales',
+                'ordering': ('-made_at',),
+            },
+        ),
+    ]
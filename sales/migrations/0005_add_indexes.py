@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_add_indexes'),
+        ('sales', '0004_salesdailyrollup'),
+        ('stores', '0003_add_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['store', 'made_at'], name='sale_store_made_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['product', 'made_at'], name='sale_product_made_at_idx'),
+        ),
+    ]
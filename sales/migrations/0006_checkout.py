@@ -0,0 +1,39 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:52
+
+import django.db.models.deletion
+import sales.models
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_add_indexes'),
+        ('stores', '0003_add_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkout',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('receipt_id', models.CharField(default=sales.models.generate_transaction_id, max_length=100, unique=True)),
+                ('idempotency_key', models.CharField(help_text='A key, provided by the client, that identifies the checkout. It prevents the same basket from being recorded twice.', max_length=100)),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('bank transfer', 'Bank Transfer')], default='cash', max_length=20)),
+                ('made_at', models.DateTimeField(auto_now_add=True)),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkouts', to='stores.store')),
+            ],
+            options={
+                'verbose_name': 'checkout',
+                'verbose_name_plural': 'checkouts',
+                'ordering': ('-made_at',),
+                'unique_together': {('store', 'idempotency_key')},
+            },
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='checkout',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='sales.checkout'),
+        ),
+    ]
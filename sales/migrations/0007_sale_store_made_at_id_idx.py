@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_quantity_gte_0'),
+        ('sales', '0006_checkout'),
+        ('stores', '0003_add_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='sale',
+            name='sale_store_made_at_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['store', 'made_at', 'id'], name='sale_store_made_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:08
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def set_sale_local_times(apps, schema_editor):
+    """Sets the local time of existing sales, in the timezone of the owner of the sale's store."""
+    Sale = apps.get_model("sales", "Sale")
+    Store = apps.get_model("stores", "Store")
+    for store in Store.objects.select_related("owner").iterator():
+        tz = store.owner.timezone
+        sales = []
+        for sale in Sale.objects.filter(store=store).only("pk", "made_at").iterator(chunk_size=2000):
+            sale.local_time = timezone.localtime(sale.made_at, tz).time()
+            sales.append(sale)
+            if len(sales) == 2000:
+                Sale.objects.bulk_update(sales, ["local_time"])
+                sales = []
+        Sale.objects.bulk_update(sales, ["local_time"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_sale_store_made_at_id_idx'),
+        ('stores', '0003_add_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='local_time',
+            field=models.TimeField(blank=True, editable=False, help_text="Time of the day the sale was made, in the timezone of the store's owner. Used for time of day filters.", null=True),
+        ),
+        migrations.AlterField(
+            model_name='sale',
+            name='made_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(set_sale_local_times, migrations.RunPython.noop),
+    ]
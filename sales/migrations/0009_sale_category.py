@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:44
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def set_sale_categories(apps, schema_editor):
+    """Sets the category of existing sales to the current category of their products."""
+    Sale = apps.get_model("sales", "Sale")
+    Product = apps.get_model("products", "Product")
+    Sale.objects.update(category=Subquery(Product.objects.filter(pk=OuterRef("product_id")).values("category")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_sale_local_time'),
+        ('products', '0009_product_local_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='category',
+            field=models.CharField(choices=[('fashion', 'Fashion'), ('electronics', 'Electronics'), ('food', 'Food'), ('beauty', 'Beauty'), ('health', 'Health'), ('home', 'Home'), ('books', 'Books'), ('sports', 'Sports'), ('automobile', 'Automobile'), ('others', 'Others')], default='others', editable=False, help_text='Category of the product at the time the sale was made. The daily sales rollups are grouped by it.', max_length=50),
+        ),
+        migrations.RunPython(set_sale_categories, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Dict, Iterable
+from decimal import Decimal
 import uuid
 import random
 import string
-from django.db import models
+import datetime
+import zoneinfo
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Sum, Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 from django_utz.decorators import model
 from djmoney.money import Money
-from djmoney.contrib.exchange.models import convert_money
+from djmoney.models.fields import MoneyField
 from django.core.exceptions import ValidationError
 
+from stores.exchange import convert_money
+from products.models import Product, ProductCategories
+from . import columnar
+
 
 
 def generate_transaction_id() -> str:
@@ -25,6 +35,38 @@ class PaymentMethod(models.TextChoices):
 
 
 
+@model
+class Checkout(models.Model):
+    """Model for a basket of product sales recorded together, under one receipt."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    receipt_id = models.CharField(max_length=100, default=generate_transaction_id, unique=True)
+    store = models.ForeignKey(
+        "stores.Store", on_delete=models.CASCADE, related_name="checkouts"
+    )
+    idempotency_key = models.CharField(
+        max_length=100, 
+        help_text="A key, provided by the client, that identifies the checkout. It prevents the same basket from being recorded twice."
+    )
+    payment_method = models.CharField(
+        max_length=20, choices=PaymentMethod.choices, default=PaymentMethod.CASH
+    )
+    made_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "checkout"
+        verbose_name_plural = "checkouts"
+        ordering = ("-made_at",)
+        unique_together = ("store", "idempotency_key")
+
+    class UTZMeta:
+        datetime_fields = "__all__"
+
+
+    def __str__(self) -> str:
+        return f"{self.store.name} - {self.receipt_id}"
+
+
+
 @model
 class Sale(models.Model):
     """Model for a product sale."""
@@ -40,13 +82,49 @@ class Sale(models.Model):
     payment_method = models.CharField(
         max_length=20, choices=PaymentMethod.choices, default=PaymentMethod.CASH
     )
-    made_at = models.DateTimeField(auto_now_add=True)
+    checkout = models.ForeignKey(
+        Checkout, on_delete=models.SET_NULL, related_name="sales", blank=True, null=True, editable=False
+    )
+    unit_price = MoneyField(
+        max_digits=14, 
+        decimal_places=2, 
+        default_currency="NGN", 
+        default=Decimal("0.00"),
+        editable=False,
+        help_text="Price of the product at the time the sale was made."
+    )
+    amount = MoneyField(
+        max_digits=18, 
+        decimal_places=2, 
+        default_currency="NGN", 
+        default=Decimal("0.00"),
+        editable=False,
+        help_text="Total amount made from the sale, that is, the unit price multiplied by the quantity sold."
+    )
+    category = models.CharField(
+        max_length=50, 
+        choices=ProductCategories.choices, 
+        default=ProductCategories.OTHERS, 
+        editable=False,
+        help_text="Category of the product at the time the sale was made. The daily sales rollups are grouped by it."
+    )
+    made_at = models.DateTimeField(default=timezone.now, editable=False)
+    local_time = models.TimeField(
+        null=True, 
+        blank=True, 
+        editable=False, 
+        help_text="Time of the day the sale was made, in the timezone of the store's owner. Used for time of day filters."
+    )
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "sale"
         verbose_name_plural = "sales"
         ordering = ("-made_at",)
+        indexes = [
+            models.Index(fields=("store", "made_at", "id"), name="sale_store_made_at_id_idx"),
+            models.Index(fields=("product", "made_at"), name="sale_product_made_at_idx"),
+        ]
 
     class UTZMeta:
         datetime_fields = "__all__"
@@ -55,7 +133,7 @@ class Sale(models.Model):
     @property
     def revenue(self) -> Money:
         """Returns the total amount made from the sale."""
-        return self.quantity * self.product.price
+        return self.amount
 
     @property
     def currency(self) -> str:
@@ -75,9 +153,10 @@ class Sale(models.Model):
         """
         if not isinstance(other, Sale):
             raise ValueError("Cannot add a sale to a non-sale object")
-        if other.revenue.currency != self.revenue.currency:
-            other.revenue = convert_money(other.revenue, self.revenue.currency)
-        return self.revenue + other.revenue
+        other_revenue = other.revenue
+        if other_revenue.currency != self.revenue.currency:
+            other_revenue = convert_money(other_revenue, self.revenue.currency)
+        return self.revenue + other_revenue
     
     __iadd__ = __add__
     __radd__ = __add__
@@ -91,41 +170,147 @@ class Sale(models.Model):
         """
         if not isinstance(other, Sale):
             raise ValueError("Cannot subtract a sale from a non-sale object")
-        if other.revenue.currency != self.revenue.currency:
-            other.revenue = convert_money(other.revenue, self.revenue.currency)
-        return self.revenue - other.revenue
+        other_revenue = other.revenue
+        if other_revenue.currency != self.revenue.currency:
+            other_revenue = convert_money(other_revenue, self.revenue.currency)
+        return self.revenue - other_revenue
     
     __isub__ = __sub__
     __rsub__ = __sub__
 
 
     def save(self, *args: str, **kwargs: Any) -> None:
-        """Save the sale."""
+        """
+        Save the sale.
+
+        The quantity sold is taken from the product's stock with a conditional UPDATE,
+        in the same transaction as the sale. So concurrent sales of the same product 
+        can neither lose stock updates nor oversell the product.
+        """
         if self.quantity == 0:
             raise ValidationError("Sale quantity cannot be zero")
         
-        try:
-            # If the sale is being updated, add the old sale quantity back to the product quantity
-            old_sale = Sale.objects.get(pk=self.pk)
-            self.product.quantity += old_sale.quantity
-        except Sale.DoesNotExist:
-            pass
-
-        if self.quantity > self.product.quantity:
-            raise ValidationError(f"Sale quantity cannot be greater than available product quantity ({self.product.quantity})")
-        
-        self.product.quantity -= self.quantity
-        # Save the sale first before saving the product. This is to avoid reducing the product quantity
-        # without a corresponding sale.
-        super().save(*args, **kwargs)
-        self.product.save()
+        with transaction.atomic():
+            old_sale = None if self._state.adding else Sale.objects.filter(pk=self.pk).first()
+            if old_sale is not None and old_sale.product_id == self.product_id:
+                # Only take (or return) the difference in the quantity sold from the product's stock
+                self._take_from_stock(self.quantity - old_sale.quantity)
+            else:
+                if old_sale is not None:
+                    # Return the quantity of the old sale to the stock of the old product
+                    Product.objects.filter(pk=old_sale.product_id).update(quantity=F("quantity") + old_sale.quantity)
+                self._take_from_stock(self.quantity)
 
+            # Record the product's price and category at the time of the sale, so that the sale's 
+            # revenue and rollup are not affected by later changes to the product.
+            if old_sale is None or old_sale.product_id != self.product_id:
+                self.unit_price = self.product.price
+                self.category = self.product.category
+            self.amount = self.unit_price * self.quantity
+            if self.local_time is None:
+                self.local_time = self.get_local_time()
+
+            super().save(*args, **kwargs)
+            # Update the daily sales rollup and the products' sales statistics in the same transaction as the sale
+            if old_sale is not None:
+                SalesDailyRollup.record(old_sale, sign=-1)
+                Product.record_sales([old_sale], sign=-1)
+                columnar.invalidate_sales(old_sale.store_id)
+                if old_sale.store_id != self.store_id:
+                    columnar.invalidate_sales(self.store_id)
+            else:
+                columnar.record_sales([self])
+            SalesDailyRollup.record(self)
+            Product.record_sales([self])
+
+    
+    def get_local_time(self, tz: zoneinfo.ZoneInfo = None) -> datetime.time:
+        """
+        Returns the time of the day the sale was made, in the given timezone.
+        
+        :param tz: The timezone. Defaults to the timezone of the owner of the sale's store.
+        """
+        return timezone.localtime(self.made_at, tz or self.store.owner.timezone).time()
     
+
+    @classmethod
+    def update_local_times(cls, stores: Iterable[Any], chunk_size: int = 2000) -> int:
+        """
+        Recomputes the local times of the sales of the given stores, for example, after the timezone of their owner changes.
+
+        :param stores: The stores, or a queryset of the stores, whose sales should be updated.
+        :param chunk_size: The number of sales updated at a time.
+        :return: The number of sales updated.
+        """
+        updated = 0
+        for store in stores:
+            tz = store.owner.timezone
+            sales = []
+            for sale in cls.objects.filter(store=store).only("pk", "made_at", "local_time").iterator(chunk_size=chunk_size):
+                sale.local_time = sale.get_local_time(tz)
+                sales.append(sale)
+                if len(sales) == chunk_size:
+                    updated += cls.objects.bulk_update(sales, ["local_time"])
+                    sales = []
+            updated += cls.objects.bulk_update(sales, ["local_time"])
+        return updated
+
+
     def delete(self, *args: str, **kwargs: Any) -> None:
-        """Delete the sale."""
-        self.product.quantity += self.quantity
-        super().delete(*args, **kwargs)
-        self.product.save()
+        """Delete the sale, returning the quantity sold to the product's stock and removing it from the product's sales statistics."""
+        with transaction.atomic():
+            SalesDailyRollup.record(self, sign=-1)
+            super().delete(*args, **kwargs)
+            self._take_from_stock(-self.quantity)
+            Product.record_sales([self], sign=-1)
+            columnar.invalidate_sales(self.store_id)
+
+
+    def _take_from_stock(self, quantity: int) -> None:
+        """
+        Takes the given quantity from the stock of the sale's product. 
+        A negative quantity is returned to the stock.
+
+        :raises ValidationError: If the product's stock is less than the quantity.
+        """
+        if quantity == 0:
+            return None
+        products = Product.objects.filter(pk=self.product_id)
+        if quantity > 0:
+            products = products.filter(quantity__gte=quantity)
+
+        if not products.update(quantity=F("quantity") - quantity):
+            available_quantity = Product.objects.filter(pk=self.product_id).values_list("quantity", flat=True).first()
+            raise ValidationError(
+                f"Sale quantity cannot be greater than available product quantity ({available_quantity or 0})"
+            )
+        # Keep the loaded product in sync with the update
+        if self._meta.get_field("product").is_cached(self):
+            self.product.quantity -= quantity
+        return None
+
+
+    @classmethod
+    def get_revenue_per_currency(cls, **filter) -> Dict[str, Decimal]:
+        """
+        Returns the total revenue made from all sales based on the filter, grouped by currency.
+
+        The revenue is computed in the database as a single `SUM(amount)` query
+        grouped by the currency of the sales.
+
+        :param filter: Filter to apply to the sales.
+        :return: A dictionary mapping each currency to the total revenue made in that currency.
+        """
+        totals = (
+            cls.objects.filter(**filter)
+            .order_by() # Clear the default ordering so it does not affect the grouping
+            .values("amount_currency")
+            .annotate(total=Sum("amount"))
+        )
+        return {
+            str(total["amount_currency"]): total["total"] or Decimal(0) 
+            for total in totals
+        }
 
 
     @classmethod
@@ -133,12 +318,19 @@ class Sale(models.Model):
         """
         Returns the total revenue made from all sales based on the filter.
 
+        The revenue for each currency is aggregated in the database, so only 
+        one conversion is made per currency, regardless of the number of sales.
+
         :param currency: Currency to get the revenue in.
         :param filter: Filter to apply to the sales.
         """
-        return sum(
-            map(lambda sale: convert_money(sale.revenue, currency), cls.objects.filter(**filter))
-        ) or Money(0, currency)
+        total = Money(Decimal(0), currency)
+        for revenue_currency, amount in cls.get_revenue_per_currency(**filter).items():
+            revenue = Money(amount, revenue_currency)
+            if revenue_currency != str(currency):
+                revenue = convert_money(revenue, currency)
+            total += revenue
+        return total
 
 
     @classmethod
@@ -149,3 +341,229 @@ class Sale(models.Model):
         :param filter: Filter to apply to the sales.
         """
         return cls.objects.filter(**filters).count()
+
+
+
+class SalesDailyRollup(models.Model):
+    """
+    Summary of the sales made in a store in a day, per product category, payment method and currency.
+
+    The rollups are kept up to date as sales are recorded, updated and deleted, such that
+    aggregations over a date range scan one row per day rather than one row per sale.
+    """
+    store = models.ForeignKey(
+        "stores.Store", on_delete=models.CASCADE, related_name="daily_sales_rollups"
+    )
+    date = models.DateField(help_text="Date of the sales, in the timezone of the store's owner.")
+    category = models.CharField(max_length=50, choices=ProductCategories.choices)
+    payment_method = models.CharField(max_length=20, choices=PaymentMethod.choices)
+    count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = MoneyField(
+        max_digits=18, 
+        decimal_places=2, 
+        default_currency="NGN", 
+        default=Decimal("0.00"),
+    )
+
+    class Meta:
+        verbose_name = "sales daily rollup"
+        verbose_name_plural = "sales daily rollups"
+        ordering = ("-date",)
+        unique_together = ("store", "date", "category", "payment_method", "revenue_currency")
+
+    
+    def __str__(self) -> str:
+        return f"{self.store} - {self.date} - {self.category} - {self.payment_method} - {self.revenue}"
+    
+
+    @staticmethod
+    def get_sale_date(sale: Sale) -> datetime.date:
+        """Returns the date a sale was made, in the timezone of the owner of the sale's store."""
+        return timezone.localtime(sale.made_at, sale.store.owner.timezone).date()
+
+
+    @classmethod
+    def record(cls, sale: Sale, sign: int = 1) -> None:
+        """
+        Adds a sale to (or removes a sale from) the rollup of the day the sale was made.
+
+        :param sale: The sale to record.
+        :param sign: 1 to add the sale to the rollup, -1 to remove the sale from the rollup.
+        """
+        return cls.record_many([sale], sign=sign)
+
+
+    @classmethod
+    def record_many(cls, sales: Iterable[Sale], sign: int = 1) -> None:
+        """
+        Adds sales to (or removes sales from) the rollups of the days the sales were made.
+
+        Sales that belong to the same rollup are combined, so each rollup is updated once.
+
+        :param sales: The sales to record.
+        :param sign: 1 to add the sales to the rollups, -1 to remove the sales from the rollups.
+        """
+        totals: Dict[tuple, tuple[int, int, Decimal]] = {}
+        for sale in sales:
+            key = (
+                sale.store_id, 
+                cls.get_sale_date(sale), 
+                sale.category, 
+                sale.payment_method, 
+                str(sale.amount.currency),
+            )
+            count, quantity, revenue = totals.get(key, (0, 0, Decimal(0)))
+            totals[key] = (count + 1, quantity + sale.quantity, revenue + sale.amount.amount)
+
+        for (store_id, date, category, payment_method, currency), (count, quantity, revenue) in totals.items():
+            key = {
+                "store_id": store_id,
+                "date": date,
+                "category": category,
+                "payment_method": payment_method,
+                "revenue_currency": currency,
+            }
+            updates = {
+                "count": F("count") + sign * count,
+                "quantity": F("quantity") + sign * quantity,
+                "revenue": F("revenue") + sign * revenue,
+            }
+            if cls.objects.filter(**key).update(**updates):
+                if sign < 0:
+                    cls.objects.filter(**key, count__lte=0).delete()
+                continue
+            if sign < 0:
+                continue
+            
+            try:
+                # Use a savepoint so that a concurrent creation of the same rollup
+                # does not break the enclosing transaction
+                with transaction.atomic():
+                    cls.objects.create(**key, count=count, quantity=quantity, revenue=revenue)
+            except IntegrityError:
+                cls.objects.filter(**key).update(**updates)
+        return None
+
+
+    @staticmethod
+    def _summarize_sales(sales: models.QuerySet, store) -> models.QuerySet:
+        """Returns the sales of the store summed per rollup, in the timezone of the store's owner."""
+        return (
+            sales.filter(store=store)
+            .order_by()
+            .annotate(date=TruncDate("made_at", tzinfo=store.owner.timezone))
+            .values("date", "category", "payment_method", "amount_currency")
+            .annotate(sales_count=Count("pk"), total_quantity=Sum("quantity"), total_amount=Sum("amount"))
+        )
+
+
+    @classmethod
+    def remove_sales(cls, sales: models.QuerySet) -> None:
+        """
+        Removes sales from the rollups of the days they were made. 
+        
+        Unlike `record_many`, the sales are summed in the database rather than loaded one by one, 
+        so that all the sales of a product can be removed at once.
+
+        :param sales: The sales to remove.
+        """
+        from stores.models import Store
+
+        stores = Store.all_objects.filter(pk__in=sales.values("store_id")).select_related("owner")
+        for store in stores:
+            for summary in cls._summarize_sales(sales, store):
+                cls.objects.filter(
+                    store=store,
+                    date=summary["date"],
+                    category=summary["category"],
+                    payment_method=summary["payment_method"],
+                    revenue_currency=summary["amount_currency"],
+                ).update(
+                    count=F("count") - summary["sales_count"],
+                    quantity=F("quantity") - summary["total_quantity"],
+                    revenue=F("revenue") - summary["total_amount"],
+                )
+            cls.objects.filter(store=store, count__lte=0).delete()
+        return None
+
+
+    @classmethod
+    def rebuild(cls, stores: models.QuerySet = None) -> int:
+        """
+        Rebuilds the rollups of the given stores from their sales.
+
+        :param stores: The stores whose rollups will be rebuilt. Defaults to all stores.
+        :return: The number of rollups created.
+        """
+        from stores.models import Store
+
+        stores = Store.objects.all() if stores is None else stores
+        created = 0
+        for store in stores.select_related("owner"):
+            # The sales of deleted products are not counted
+            summaries = cls._summarize_sales(Sale.objects.filter(store=store, product__deleted_at__isnull=True), store)
+            rollups = [
+                cls(
+                    store=store,
+                    date=summary["date"],
+                    category=summary["category"],
+                    payment_method=summary["payment_method"],
+                    count=summary["sales_count"],
+                    quantity=summary["total_quantity"],
+                    revenue=Money(summary["total_amount"], summary["amount_currency"]),
+                )
+                for summary in summaries
+            ]
+            with transaction.atomic():
+                cls.objects.filter(store=store).delete()
+                cls.objects.bulk_create(rollups)
+            created += len(rollups)
+        return created
+
+
+    @classmethod
+    def get_revenue_per_currency(cls, **filter) -> Dict[str, Decimal]:
+        """
+        Returns the total revenue from the rollups based on the filter, grouped by currency.
+
+        :param filter: Filter to apply to the rollups.
+        :return: A dictionary mapping each currency to the total revenue made in that currency.
+        """
+        totals = (
+            cls.objects.filter(**filter)
+            .order_by()
+            .values("revenue_currency")
+            .annotate(total=Sum("revenue"))
+        )
+        return {
+            str(total["revenue_currency"]): total["total"] or Decimal(0) 
+            for total in totals
+        }
+    
+
+    @classmethod
+    def get_total_revenue(cls, currency, **filter) -> Money:
+        """
+        Returns the total revenue from the rollups based on the filter.
+
+        :param currency: Currency to get the revenue in.
+        :param filter: Filter to apply to the rollups.
+        """
+        total = Money(Decimal(0), currency)
+        for revenue_currency, amount in cls.get_revenue_per_currency(**filter).items():
+            revenue = Money(amount, revenue_currency)
+            if revenue_currency != str(currency):
+                revenue = convert_money(revenue, currency)
+            total += revenue
+        return total
+
+
+    @classmethod
+    def get_count(cls, **filters) -> int:
+        """
+        Returns the number of sales in the rollups based on the filter.
+
+        :param filter: Filter to apply to the rollups.
+        """
+        return cls.objects.filter(**filters).aggregate(total=Sum("count"))["total"] or 0
@@ -0,0 +1,29 @@
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
+
+from users.models import UserAccount
+from .jobs import queue_timezone_change_update
+
+
+@receiver(pre_save, sender=UserAccount)
+def check_timezone_change(sender, instance: UserAccount, update_fields=None, **kwargs) -> None:
+    """Notes whether the timezone of the user is being changed."""
+    if instance._state.adding or (update_fields is not None and "timezone" not in update_fields):
+        # Saves of other fields, such as `last_login`, do not change the timezone
+        instance._timezone_changed = False
+        return None
+    old_timezone = UserAccount.objects.filter(pk=instance.pk).values_list("timezone", flat=True).first()
+    instance._timezone_changed = old_timezone is not None and str(old_timezone) != str(instance.timezone)
+    return None
+
+
+@receiver(post_save, sender=UserAccount)
+def update_sales_for_timezone_change(sender, instance: UserAccount, **kwargs) -> None:
+    """
+    Queues the update of the local times and daily rollups of the sales of the user's stores 
+    when the user's timezone changes, as both are in the timezone of the store's owner.
+    """
+    if not getattr(instance, "_timezone_changed", False):
+        return None
+    queue_timezone_change_update(instance)
+    return None
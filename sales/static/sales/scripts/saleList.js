@@ -1,6 +1,9 @@
 const addSaleForm = document.querySelector('#add-sale-form');
 const addSaleFormCard = addSaleForm.parentElement;
 const addSaleButton = addSaleForm.querySelector('.submit-btn');
+const productSearchInput = addSaleForm.querySelector('#product-search');
+const productSelect = addSaleForm.querySelector('#product');
+const productSelectOptions = Array.from(productSelect.options);
 
 
 addOnPostAndOnResponseFuncAttr(addSaleButton, 'Recording sale...');
@@ -61,3 +64,31 @@ addSaleForm.onsubmit = function(e) {
     });
 };
 
+
+let productSearchTimeout = null;
+
+productSearchInput.oninput = function() {
+    clearTimeout(productSearchTimeout);
+    const query = this.value.trim();
+    if (!query) {
+        productSelect.replaceChildren(...productSelectOptions);
+        return;
+    }
+
+    // Wait for the user to stop typing before searching
+    productSearchTimeout = setTimeout(() => {
+        const url = `${this.dataset.searchUrl}?q=${encodeURIComponent(query)}`;
+        fetch(url, { headers: { 'Accept': 'application/json' }, mode: 'same-origin' }).then((response) => {
+            response.json().then((data) => {
+                if (!response.ok || query !== this.value.trim()) return;
+
+                const options = [productSelectOptions[0]];
+                for (const product of data.data ?? []) {
+                    options.push(new Option(product.name, product.id));
+                }
+                productSelect.replaceChildren(...options);
+                if (options.length > 1) productSelect.value = options[1].value;
+            });
+        });
+    }, 300);
+};
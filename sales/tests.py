@@ -1,3 +1,587 @@
-from django.test import TestCase
+import datetime
+import importlib
+import tempfile
+import uuid
+from decimal import Decimal
+import unittest
+from unittest import mock
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from djmoney.money import Money
+from djmoney.contrib.exchange.models import ExchangeBackend, get_default_backend_name
 
-# Create your tests here.
+from graphi.testing import QueryPlanTestMixin
+from users.models import UserAccount
+from stores.models import Store
+from stores.exchange import exchange_rates
+from products.models import Product
+from .models import Sale, SalesDailyRollup, Checkout
+from .utils import record_checkout
+from . import analytics, columnar, jobs, signals, utils
+from .views import SaleListView
+
+
+class SalePriceSnapshotTestCase(TestCase):
+    """Checks that the revenue of past sales does not change with the products sold."""
+
+    @classmethod
+    def setUpTestData(cls):
+        backend = ExchangeBackend.objects.create(name=get_default_backend_name(), base_currency="USD")
+        backend.rates.create(currency="NGN", value=1000)
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user, default_currency="NGN")
+        cls.product = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=20, store=cls.store)
+        cls.sale = Sale.objects.create(store=cls.store, product=cls.product, quantity=3)
+
+
+    def setUp(self):
+        exchange_rates.invalidate()
+        self.addCleanup(exchange_rates.invalidate)
+
+
+    def assertRevenueUnchanged(self):
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.unit_price, Money(100, "NGN"))
+        self.assertEqual(self.sale.amount, Money(300, "NGN"))
+        self.assertEqual(Sale.get_total_revenue(currency="NGN", store=self.store), Money(300, "NGN"))
+        self.assertEqual(utils.aggregate_revenue_from_sales(self.user), Money(300, "NGN"))
+        self.assertEqual(utils.aggregate_revenue_from_sales(self.user, from_time="08:00", to_time="23:00"), Money(300, "NGN"))
+
+
+    def test_repricing_the_product(self):
+        self.product.price = Money(250, "NGN")
+        self.product.save()
+        self.assertRevenueUnchanged()
+
+
+    def test_changing_the_store_currency(self):
+        self.store.default_currency = "USD"
+        self.store.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Money("0.1", "USD"))
+        self.assertRevenueUnchanged()
+
+
+
+class SaleRevenueTestCase(TestCase):
+    """Checks that revenue in several currencies is summed per currency in the database, then converted."""
+
+    @classmethod
+    def setUpTestData(cls):
+        backend = ExchangeBackend.objects.create(name=get_default_backend_name(), base_currency="USD")
+        backend.rates.create(currency="NGN", value=1000)
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.rice = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=1000, store=cls.store)
+        cls.beans = Product.objects.create(name="Beans", price=Money("1.50", "USD"), quantity=1000, store=cls.store)
+        Sale.objects.create(store=cls.store, product=cls.rice, quantity=3)
+        Sale.objects.create(store=cls.store, product=cls.beans, quantity=2)
+
+
+    def setUp(self):
+        exchange_rates.invalidate()
+        self.addCleanup(exchange_rates.invalidate)
+        # Load the rates, so that only the queries of the aggregations are counted
+        exchange_rates.get_rates_to("NGN")
+
+
+    def test_revenue_is_converted_per_currency(self):
+        self.assertEqual(Sale.get_revenue_per_currency(store=self.store), {"NGN": 300, "USD": 3})
+        self.assertEqual(Sale.get_total_revenue(currency="NGN", store=self.store), Money(3300, "NGN"))
+        self.assertEqual(Sale.get_total_revenue(currency="USD", store=self.store), Money("3.30", "USD"))
+        self.assertEqual(utils.aggregate_revenue_from_sales(self.user), Money(3300, "NGN"))
+        # With a time range, the sales are aggregated instead of the daily rollups
+        self.assertEqual(utils.aggregate_revenue_from_sales(self.user, from_time="00:00:01"), Money(3300, "NGN"))
+
+
+    def test_number_of_queries_does_not_grow_with_the_sales(self):
+        for sales_count in (2, 50):
+            Sale.objects.bulk_create([
+                Sale(store=self.store, product=product, quantity=1, unit_price=product.price, amount=product.price)
+                for product in (self.rice, self.beans) for _ in range(sales_count // 2)
+            ])
+            with self.subTest(sales_count=sales_count), self.assertNumQueries(1):
+                Sale.get_total_revenue(currency="NGN", store=self.store)
+            with self.subTest(sales_count=sales_count), self.assertNumQueries(2):
+                utils.aggregate_revenue_from_sales(self.user, from_time="00:00:01")
+
+
+
+class SalePriceSnapshotMigrationTestCase(TransactionTestCase):
+    """Checks that the unit prices and amounts of existing sales are backfilled from the prices of their products."""
+    migrate_from = [("sales", "0002_initial"), ("products", "0002_initial")]
+    migrate_to = [("sales", "0003_sale_price_snapshot")]
+
+    def migrate(self, targets):
+        """Migrates the database to the targets, or to the latest migrations, and returns the models of the migrated state."""
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets or executor.loader.graph.leaf_nodes())
+        executor.loader.build_graph()
+        return executor.loader.project_state(list(executor.loader.applied_migrations)).apps
+
+
+    def test_backfill(self):
+        self.addCleanup(self.migrate, None)
+        old_apps = self.migrate(self.migrate_from)
+        UserAccount = old_apps.get_model("users", "UserAccount")
+        Store = old_apps.get_model("stores", "Store")
+        Product = old_apps.get_model("products", "Product")
+        Sale = old_apps.get_model("sales", "Sale")
+
+        user = UserAccount.objects.create(email="owner@example.com", firstname="Store", lastname="Owner")
+        store = Store.objects.create(name="Test Store", owner=user)
+        product = Product.objects.create(name="Rice", price=Decimal("2.50"), price_currency="USD", quantity=20, store=store)
+        sale = Sale.objects.create(store=store, product=product, quantity=4)
+
+        new_apps = self.migrate(self.migrate_to)
+        Sale = new_apps.get_model("sales", "Sale")
+        sale = Sale.objects.get(pk=sale.pk)
+        self.assertEqual(sale.unit_price, Money("2.50", "USD"))
+        self.assertEqual(sale.amount, Money("10.00", "USD"))
+
+        # The schema editor checks foreign keys, so the backfill is run again by itself for a sale whose product is missing
+        backfill = importlib.import_module("sales.migrations.0003_sale_price_snapshot").backfill_sales_price_snapshot
+        with connection.constraint_checks_disabled():
+            orphan_sale = Sale.objects.create(store_id=store.pk, product_id=uuid.uuid4(), quantity=2)
+            try:
+                backfill(new_apps, None)
+                orphan_sale = Sale.objects.get(pk=orphan_sale.pk)
+            finally:
+                Sale.objects.filter(pk=orphan_sale.pk).delete()
+        self.assertEqual(orphan_sale.unit_price, Money(0, "NGN"))
+        self.assertEqual(orphan_sale.amount, Money(0, "NGN"))
+        self.assertEqual(Sale.objects.get(pk=sale.pk).amount, Money("10.00", "USD"))
+
+
+
+class SaleListViewQueryPlanTestCase(QueryPlanTestMixin, TestCase):
+    """Checks that the queries of the sale list view use indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(name="Test Product", price=Money(100, "NGN"), quantity=10, store=cls.store)
+        Sale.objects.create(store=cls.store, product=cls.product, quantity=1)
+
+
+    def get_queryset(self, **params):
+        request = RequestFactory().get("/", params)
+        request.user = self.user
+        view = SaleListView()
+        view.setup(request, store_slug=self.store.slug)
+        return view.get_queryset()
+
+
+    def test_queryset_uses_indexes(self):
+        self.assertNoFullTableScans(self.get_queryset())
+
+
+    def test_filtered_queryset_uses_indexes(self):
+        for params in (
+            {"from_date": "2024-01-01", "to_date": "2024-01-31"},
+            {"categories": "food,books"},
+            {"min_quantity": 1, "max_quantity": 5},
+            {"date": "2024-01-01", "from_time": "08:00", "to_time": "17:00"},
+        ):
+            with self.subTest(params=params):
+                self.assertNoFullTableScans(self.get_queryset(**params))
+
+
+    def test_full_index_scans_are_full_table_scans(self):
+        # Walks the whole (store, made_at, id) index, without searching it for a store's rows
+        queryset = Sale.objects.order_by("store_id", "made_at", "id").values_list("store_id", "made_at", "id")
+        self.assertIn("USING COVERING INDEX", queryset.explain())
+        with self.assertRaises(AssertionError):
+            self.assertNoFullTableScans(queryset)
+
+
+    def test_date_filters_are_ranges_in_user_timezone(self):
+        sql = str(self.get_queryset(date="2024-01-01").query)
+        self.assertNotIn("django_datetime_cast_date", sql)
+        # The user's timezone, Africa/Lagos, is UTC+1
+        self.assertIn("2023-12-31 23:00:00", sql)
+        self.assertIn("2024-01-01 23:00:00", sql)
+
+
+
+class TimezoneChangeTestCase(TestCase):
+    """Checks that the local times and daily rollups of a user's sales follow the user's timezone, in the background."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(
+            name="Rice", price=Money(100, "NGN"), quantity=10, store=cls.store,
+            added_at=datetime.datetime(2024, 1, 1, 23, 30, tzinfo=datetime.timezone.utc),
+        )
+        cls.sale = Sale.objects.create(
+            store=cls.store, product=cls.product, quantity=1, 
+            made_at=datetime.datetime(2024, 1, 1, 23, 30, tzinfo=datetime.timezone.utc),
+        )
+
+
+    def test_saving_other_fields_does_not_check_the_timezone(self):
+        self.user.last_login = timezone.now()
+        with (
+            mock.patch.object(signals, "queue_timezone_change_update") as queue_update, 
+            CaptureQueriesContext(connection) as queries,
+        ):
+            self.user.save(update_fields=["last_login"])
+        queue_update.assert_not_called()
+        self.assertFalse([query for query in queries if query["sql"].startswith('SELECT "users_useraccount"."timezone"')])
+
+
+    def test_timezone_change_is_applied_in_the_background(self):
+        # Africa/Lagos is UTC+1, and Asia/Tokyo is UTC+9
+        self.assertEqual(SalesDailyRollup.objects.get().date, datetime.date(2024, 1, 2))
+        self.user.timezone = "Asia/Tokyo"
+        with mock.patch.object(signals, "queue_timezone_change_update") as queue_update:
+            self.user.save()
+        queue_update.assert_called_once_with(self.user)
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.local_time, datetime.time(0, 30))
+
+        jobs.update_for_timezone_change(self.user.pk, "Asia/Tokyo")
+        self.sale.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.sale.local_time, datetime.time(8, 30))
+        self.assertEqual(self.product.local_time, datetime.time(8, 30))
+        self.assertEqual(SalesDailyRollup.objects.get().date, datetime.date(2024, 1, 2))
+
+        # An update for a timezone the user no longer has is skipped
+        jobs.update_for_timezone_change(self.user.pk, "Africa/Lagos")
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.local_time, datetime.time(8, 30))
+
+
+
+class SalesDailyRollupTestCase(TestCase):
+    """Checks that the daily sales rollups follow the sales recorded, updated and deleted."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.rice = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=20, store=cls.store, category="food")
+        cls.novel = Product.objects.create(name="Novel", price=Money(500, "NGN"), quantity=20, store=cls.store, category="books")
+
+
+    def get_rollups(self):
+        return {
+            (rollup.category, rollup.payment_method): (rollup.count, rollup.quantity, rollup.revenue)
+            for rollup in SalesDailyRollup.objects.filter(store=self.store)
+        }
+
+
+    def test_rollups_follow_sales(self):
+        sale = Sale.objects.create(store=self.store, product=self.rice, quantity=2)
+        Sale.objects.create(store=self.store, product=self.rice, quantity=1, payment_method="card")
+        record_checkout(self.store, [{"product": str(self.novel.pk), "quantity": 1}], idempotency_key="checkout")
+        self.assertEqual(self.get_rollups(), {
+            ("food", "cash"): (1, 2, Money(200, "NGN")),
+            ("food", "card"): (1, 1, Money(100, "NGN")),
+            ("books", "cash"): (1, 1, Money(500, "NGN")),
+        })
+
+        sale.quantity = 3
+        sale.save()
+        self.assertEqual(self.get_rollups()[("food", "cash")], (1, 3, Money(300, "NGN")))
+
+        sale.product = self.novel
+        sale.save()
+        self.assertNotIn(("food", "cash"), self.get_rollups())
+        self.assertEqual(self.get_rollups()[("books", "cash")], (2, 4, Money(2000, "NGN")))
+
+        sale.delete()
+        self.assertEqual(self.get_rollups()[("books", "cash")], (1, 1, Money(500, "NGN")))
+
+
+    def test_rollups_keep_the_category_of_the_product_at_the_time_of_the_sale(self):
+        sale = Sale.objects.create(store=self.store, product=self.rice, quantity=2)
+        self.rice.category = "home"
+        self.rice.save()
+        Sale.objects.create(store=self.store, product=self.rice, quantity=1)
+        self.assertEqual(set(self.get_rollups()), {("food", "cash"), ("home", "cash")})
+
+        # The sale is removed from the rollup it was added to, not from that of the product's new category
+        sale = Sale.objects.get(pk=sale.pk)
+        sale.quantity = 1
+        sale.save()
+        self.assertEqual(self.get_rollups()[("food", "cash")], (1, 1, Money(100, "NGN")))
+        sale.delete()
+        self.assertEqual(self.get_rollups(), {("home", "cash"): (1, 1, Money(100, "NGN"))})
+
+        self.assertEqual(SalesDailyRollup.rebuild(), 1)
+        self.assertEqual(self.get_rollups(), {("home", "cash"): (1, 1, Money(100, "NGN"))})
+
+
+
+class SalesTimeSeriesTestCase(TestCase):
+    """Checks that sales are bucketed by hour, day, week and month in the user's timezone, with empty buckets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        # Asia/Tokyo is UTC+9, so local days start at 15:00 UTC
+        cls.user.timezone = "Asia/Tokyo"
+        cls.user.save()
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        product = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=20, store=cls.store)
+        for made_at in (
+            datetime.datetime(2024, 1, 28, 14, 59, tzinfo=datetime.timezone.utc), # Sunday, 28 January, 23:59 local time
+            datetime.datetime(2024, 1, 31, 14, 59, tzinfo=datetime.timezone.utc), # Wednesday, 31 January, 23:59 local time
+            datetime.datetime(2024, 1, 31, 15, 0, tzinfo=datetime.timezone.utc), # Thursday, 1 February, 00:00 local time
+            datetime.datetime(2024, 2, 5, 0, 0, tzinfo=datetime.timezone.utc), # Monday, 5 February, 09:00 local time
+        ):
+            Sale.objects.create(store=cls.store, product=product, quantity=1, made_at=made_at)
+
+
+    def get_series(self, bucket, from_date="2024-01-29", to_date="2024-02-06"):
+        series = utils.aggregate_sales_time_series(self.user, from_date, to_date, bucket=bucket)
+        for values in series:
+            self.assertEqual(values["bucket"].tzinfo, self.user.timezone)
+        return { values["bucket"].replace(tzinfo=None): values["count"] for values in series }
+
+
+    def test_day_buckets(self):
+        series = self.get_series("day")
+        self.assertEqual(len(series), 9)
+        self.assertEqual(
+            { bucket.date(): count for bucket, count in series.items() if count },
+            { datetime.date(2024, 1, 31): 1, datetime.date(2024, 2, 1): 1, datetime.date(2024, 2, 5): 1 }
+        )
+        # The sale made just before the start of the range is left out
+        self.assertEqual(sum(series.values()), 3)
+
+
+    def test_week_buckets(self):
+        self.assertEqual(self.get_series("week"), {
+            datetime.datetime(2024, 1, 29): 2,
+            datetime.datetime(2024, 2, 5): 1,
+        })
+        self.assertEqual(self.get_series("week", "2024-01-22", "2024-01-28"), { datetime.datetime(2024, 1, 22): 1 })
+
+
+    def test_month_buckets(self):
+        self.assertEqual(self.get_series("month"), {
+            datetime.datetime(2024, 1, 1): 1,
+            datetime.datetime(2024, 2, 1): 2,
+        })
+        self.assertEqual(self.get_series("month", "2024-03-01", "2024-04-30"), {
+            datetime.datetime(2024, 3, 1): 0,
+            datetime.datetime(2024, 4, 1): 0,
+        })
+
+
+    def test_hour_buckets(self):
+        series = self.get_series("hour", "2024-01-31", "2024-02-01")
+        self.assertEqual(len(series), 48)
+        self.assertEqual(series[datetime.datetime(2024, 1, 31, 23)], 1)
+        self.assertEqual(series[datetime.datetime(2024, 2, 1, 0)], 1)
+        self.assertEqual(sum(series.values()), 2)
+
+
+
+class SaleStockTestCase(TestCase):
+    """Checks that sales take from, and return to, the stock of their products, without overselling it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.product = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=10, store=cls.store)
+
+
+    def assertStock(self, quantity):
+        self.product.refresh_from_db(fields=["quantity"])
+        self.assertEqual(self.product.quantity, quantity)
+
+
+    def test_sales_take_from_and_return_to_stock(self):
+        sale = Sale.objects.create(store=self.store, product=self.product, quantity=3)
+        self.assertStock(7)
+        sale.quantity = 5
+        sale.save()
+        self.assertStock(5)
+        sale.delete()
+        self.assertStock(10)
+
+
+    def test_sale_is_not_made_if_stock_is_insufficient(self):
+        with self.assertRaises(ValidationError):
+            Sale.objects.create(store=self.store, product=self.product, quantity=11)
+        self.assertStock(10)
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(SalesDailyRollup.objects.exists())
+
+        # All of the stock can be sold, but no more
+        Sale.objects.create(store=self.store, product=self.product, quantity=10)
+        with self.assertRaises(ValidationError):
+            Sale.objects.create(store=self.store, product=self.product, quantity=1)
+        self.assertStock(0)
+        self.assertEqual(Sale.objects.count(), 1)
+
+
+    def test_sale_is_not_updated_if_stock_is_insufficient(self):
+        sale = Sale.objects.create(store=self.store, product=self.product, quantity=3)
+        sale.quantity = 14
+        with self.assertRaises(ValidationError):
+            sale.save()
+        self.assertStock(7)
+        self.assertEqual(Sale.objects.get(pk=sale.pk).quantity, 3)
+        self.assertEqual(SalesDailyRollup.objects.get().quantity, 3)
+
+
+
+class CheckoutTestCase(TestCase):
+    """Checks that checkouts are recorded in one transaction, once per idempotency key."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.rice = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=10, store=cls.store)
+        cls.beans = Product.objects.create(name="Beans", price=Money(50, "NGN"), quantity=2, store=cls.store)
+
+
+    def get_stock(self):
+        return dict(Product.objects.values_list("name", "quantity"))
+
+
+    def test_replayed_checkout_is_recorded_once(self):
+        items = [{"product": str(self.rice.pk), "quantity": 2}, {"product": str(self.beans.pk), "quantity": 1}]
+        checkout, created = record_checkout(self.store, items, idempotency_key="checkout")
+        self.assertTrue(created)
+        self.assertEqual(checkout.sales.count(), 2)
+
+        replayed_checkout, created = record_checkout(self.store, items, idempotency_key="checkout")
+        self.assertFalse(created)
+        self.assertEqual(replayed_checkout, checkout)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(self.get_stock(), {"Rice": 8, "Beans": 1})
+
+
+    def test_checkout_is_rolled_back_if_a_line_is_out_of_stock(self):
+        items = [{"product": str(self.rice.pk), "quantity": 2}, {"product": str(self.beans.pk), "quantity": 3}]
+        with self.assertRaises(ValidationError) as context:
+            record_checkout(self.store, items, idempotency_key="checkout")
+        self.assertIn("items[1]", context.exception.message_dict)
+
+        # The stock is only found to be insufficient when it is taken, after the items were validated
+        with (
+            mock.patch.object(utils, "_clean_checkout_items", return_value=({self.rice: 2, self.beans: 3}, {})),
+            self.assertRaises(ValidationError),
+        ):
+            record_checkout(self.store, items, idempotency_key="checkout")
+
+        self.assertEqual(self.get_stock(), {"Rice": 10, "Beans": 2})
+        self.assertFalse(Checkout.objects.exists())
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(SalesDailyRollup.objects.exists())
+
+
+    def test_malformed_items(self):
+        for items in (3, {"product": str(self.rice.pk)}, "items", [], [3], [{"quantity": 1}], [{"product": "rice"}]):
+            with self.subTest(items=items), self.assertRaises(ValidationError) as context:
+                record_checkout(self.store, items, idempotency_key="checkout")
+            self.assertIn("items" if not isinstance(items, list) or not items else "items[0]", context.exception.message_dict)
+        self.assertFalse(Checkout.objects.exists())
+
+
+    def test_quantities_must_be_whole_numbers(self):
+        for quantity in (2.7, True, "2.5", "two", None, [2]):
+            items = [{"product": str(self.rice.pk), "quantity": quantity}]
+            with self.subTest(quantity=quantity), self.assertRaises(ValidationError) as context:
+                record_checkout(self.store, items, idempotency_key="checkout")
+            self.assertEqual(context.exception.message_dict["items[0]"], ["Sale quantity must be a whole number."])
+        self.assertFalse(Checkout.objects.exists())
+
+        for index, quantity in enumerate((2.0, "2")):
+            items = [{"product": str(self.rice.pk), "quantity": quantity}]
+            checkout, _ = record_checkout(self.store, items, idempotency_key=f"checkout-{index}")
+            self.assertEqual(checkout.sales.get().quantity, 2)
+
+
+
+@unittest.skipIf(columnar.np is None, "NumPy is not installed")
+class SalesColumnStoreTestCase(TestCase):
+    """Checks that the columnar mirror of a store's sales follows its sales, and the analytics over it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.rice = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=20, store=cls.store)
+        cls.beans = Product.objects.create(name="Beans", price=Money("2.50", "NGN"), quantity=20, store=cls.store)
+        Sale.objects.create(store=cls.store, product=cls.rice, quantity=2)
+
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = self.settings(SALES_COLUMNAR_STORE_ENABLED=True, SALES_COLUMNS_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+    def test_mirror_follows_sales(self):
+        column_store = columnar.SalesColumnStore(self.store.pk)
+        self.assertEqual(len(column_store.load()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(store=self.store, product=self.beans, quantity=4)
+        columns = column_store.load()
+        self.assertEqual(columns.quantity.tolist(), [2, 4])
+        self.assertEqual(columns.unit_amount.tolist(), [10000, 250])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.filter(product=self.rice).first().delete()
+        self.assertEqual(column_store.load().quantity.tolist(), [4])
+
+
+    def test_rows_indexing_unknown_products_are_not_loaded(self):
+        column_store = columnar.SalesColumnStore(self.store.pk)
+        self.assertEqual(len(column_store.load()), 1)
+        # As if a row was appended after its new product was added to the metadata that was read
+        rows = column_store._get_rows(
+            [(timezone.now(), self.beans.pk, 1, self.beans.price.amount, "NGN")], {"products": [str(self.rice.pk)], "currencies": ["NGN"]}
+        )
+        column_store._write_rows(rows)
+        columns = column_store.load()
+        self.assertEqual(len(columns), 1)
+        self.assertEqual(analytics.get_top_products(columns), [(str(self.rice.pk), 200.0)])
+
+
+    def test_analytics(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(store=self.store, product=self.beans, quantity=4)
+        columns = columnar.load_sales_columns([self.store.pk])
+        
+        top_products = analytics.get_top_products(columns, limit=1, value="quantity")
+        self.assertEqual(top_products, [(str(self.beans.pk), 4.0)])
+        self.assertEqual(analytics.get_percentiles(columns, [0, 100], value="revenue"), {0: 10.0, 100: 200.0})
+        self.assertEqual(sum(map(sum, analytics.get_hour_of_week_profile(columns, self.user.timezone))), 2)
+        rolling_average = analytics.get_rolling_average(columns, self.user.timezone, window=1)
+        self.assertEqual(rolling_average[-1]["total"], 210.0)
+
+
+    def test_analytics_leave_out_currencies_with_no_rate(self):
+        exchange_rates.invalidate()
+        self.addCleanup(exchange_rates.invalidate)
+        wine = Product.objects.create(name="Wine", price=Money(10, "EUR"), quantity=20, store=self.store)
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(store=self.store, product=wine, quantity=1)
+        columns = columnar.load_sales_columns([self.store.pk])
+
+        rolling_average = analytics.get_rolling_average(columns, self.user.timezone, window=1)
+        self.assertEqual([point["total"] for point in rolling_average], [200.0])
+        self.assertEqual([point["average"] for point in rolling_average], [200.0])
+        self.assertEqual(analytics.get_percentiles(columns, [0, 100]), {0: 200.0, 100: 200.0})
+        self.assertEqual(analytics.get_percentiles(columns, [50], currency="GBP"), {50: None})
+        self.assertEqual(analytics.get_top_products(columns, limit=1), [(str(self.rice.pk), 200.0)])
@@ -1,11 +1,25 @@
 from typing import Any, List, Dict
 from djmoney.money import Money
 import uuid
+import datetime
+import zoneinfo
 from decimal import Decimal
 
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
+from django.db.models import Q, F, Case, When, Count, Sum
+from django.db.models.functions import TruncHour, TruncDay, TruncWeek, TruncMonth
+from django.utils import timezone
+from dateutil.relativedelta import relativedelta
+
 from users.models import UserAccount
-from .models import Sale
+from users.utils import get_local_date_range_filters
+from .models import Sale, SalesDailyRollup, Checkout, PaymentMethod
+from . import columnar
+from stores.models import Store
 from stores.utils import filter_store_pks_for_user
+from stores.exchange import convert_money
+from products.models import Product
 
 
 def get_aggregation_filters(
@@ -16,10 +30,14 @@ def get_aggregation_filters(
         to_date: str = None,
         from_time: str = None,
         to_time: str = None,
+        tz: zoneinfo.ZoneInfo = None,
     ) -> Dict[str, Any]:
     """
     Returns a dictionary of filters to be used to aggregate sales based on the given parameters.
 
+    Dates are turned into a range on `made_at` in the given timezone, and times are compared 
+    with the local time of the sales, so that the filters can be served by indexes.
+
     :param store_pks: A list of primary keys of the stores whose sales will be used during aggregation.
     If not provided, all the stores owned by the user will be used.
     :param date: If provided, only sales made on the given date will be used during aggregation.
@@ -28,29 +46,89 @@ def get_aggregation_filters(
     :param to_date: If provided, only sales made on or before the given date will be used during aggregation.
     :param from_time: If provided, only sales made on or after the given time will be used during aggregation.
     :param to_time: If provided, only sales made on or before the given time will be used during aggregation.
+    :param tz: The timezone of the dates. Defaults to the current timezone.
     :return: A dictionary of filters that can be used to filter sales.
     """
+    filters = get_local_date_range_filters(
+        "made_at", tz or timezone.get_current_timezone(), date=date, from_date=from_date, to_date=to_date
+    )
+    if from_time:
+        filters["local_time__gte"] = from_time
+    if to_time:
+        filters["local_time__lte"] = to_time
+
+    if store_pks is not None:
+        # An empty list, of stores none of which were the user's, matches no sales
+        filters["store__pk__in"] = store_pks
+    # The sales of deleted stores and products are not aggregated
+    filters["store__deleted_at__isnull"] = True
+    filters["product__deleted_at__isnull"] = True
+
+    if categories:
+        filters["category__in"] = [ category.lower() for category in categories ]
+    return filters
+
+
+
+def get_rollup_filters(
+        store_pks: List[str | uuid.UUID] = None,
+        categories: List[str] = None,
+        date: str = None,
+        from_date: str = None,
+        to_date: str = None,
+    ) -> Dict[str, Any]:
+    """
+    Returns a dictionary of filters to be used to aggregate daily sales rollups based on the given parameters.
+
+    Dates are compared with the local date (in the timezone of the store's owner) of the rollups.
+
+    :param store_pks: A list of primary keys of the stores whose rollups will be used during aggregation.
+    :param categories: A list of product categories whose rollups will be used during aggregation.
+    :param date: If provided, only rollups for the given date will be used during aggregation.
+    If provided, `from_date` and `to_date` will be ignored.
+    :param from_date: If provided, only rollups on or after the given date will be used during aggregation.
+    :param to_date: If provided, only rollups on or before the given date will be used during aggregation.
+    :return: A dictionary of filters that can be used to filter daily sales rollups.
+    """
     filters = {}
     if date:
-        filters["made_at__date"] = date
+        filters["date"] = date
     else:
         if from_date:
-            filters["made_at__date__gte"] = from_date
+            filters["date__gte"] = from_date
         if to_date:
-            filters["made_at__date__lte"] = to_date
-    if from_time:
-        filters["made_at__time__gte"] = from_time
-    if to_time:
-        filters["made_at__time__lte"] = to_time
+            filters["date__lte"] = to_date
 
-    if store_pks:
+    if store_pks is not None:
+        # An empty list, of stores none of which were the user's, matches no sales
         filters["store__pk__in"] = store_pks
 
     if categories:
-        filters["product__category__in"] = [ category.lower() for category in categories ]
+        filters["category__in"] = [ category.lower() for category in categories ]
     return filters
 
 
+def _parse_time(value: str | datetime.time | None) -> datetime.time | None:
+    if not value or isinstance(value, datetime.time):
+        return value
+    return datetime.time.fromisoformat(value)
+
+
+def can_use_rollups(from_time: str = None, to_time: str = None) -> bool:
+    """
+    Returns whether an aggregation can be answered from the daily sales rollups.
+
+    Rollups hold whole days, so they can only be used if no time range is given, 
+    or if the time range covers the whole day.
+    """
+    from_time, to_time = _parse_time(from_time), _parse_time(to_time)
+    if from_time and from_time > datetime.time.min:
+        return False
+    if to_time and to_time < datetime.time(23, 59):
+        return False
+    return True
+
+
 
 def aggregate_revenue_from_sales(
         user: UserAccount,
@@ -67,6 +145,9 @@ def aggregate_revenue_from_sales(
     Calculates and returns the total revenue made from sales by a user
     based on the given parameters.
 
+    If no time range is given (or the time range covers the whole day), the aggregation
+    is answered from the daily sales rollups, with dates in the timezone of the store's owner.
+
     :param user: The user whose sales revenue is to be aggregated.
     :param store_pks: A list of primary keys of the stores whose sales will be used during aggregation.
     If not provided, all the stores owned by the user will be used.
@@ -81,7 +162,12 @@ def aggregate_revenue_from_sales(
     :return: The aggregated total revenue made from sales.
     """
     store_pks = filter_store_pks_for_user(user, store_pks)
-    sales_filters = get_aggregation_filters(store_pks, categories, date, from_date, to_date, from_time, to_time)
+    if can_use_rollups(from_time, to_time):
+        rollup_filters = get_rollup_filters(store_pks, categories, date, from_date, to_date)
+        rollup_filters["store__owner"] = user
+        return SalesDailyRollup.get_total_revenue(currency=user.preferred_currency, **rollup_filters).round(max_decimal_places)
+
+    sales_filters = get_aggregation_filters(store_pks, categories, date, from_date, to_date, from_time, to_time, tz=user.timezone)
     sales_filters["store__owner"] = user
     # If no aggregation filter, return 0 revenue
     if not sales_filters:
@@ -104,6 +190,9 @@ def aggregate_sales_count(
     Calculates and returns the total number of sales made by a user
     based on the given parameters.
 
+    If no time range is given (or the time range covers the whole day), the aggregation
+    is answered from the daily sales rollups, with dates in the timezone of the store's owner.
+
     :param user: The user whose sales count is to be aggregated.
     :param store_pks: A list of primary keys of the stores whose sales will be used during aggregation.
     :param categories: A list of product categories whose sales will be used during aggregation.
@@ -117,10 +206,352 @@ def aggregate_sales_count(
     :return: The aggregated total number of sales made.
     """
     store_pks = filter_store_pks_for_user(user, store_pks)
-    sales_filters = get_aggregation_filters(store_pks, categories, date, from_date, to_date, from_time, to_time)
+    if can_use_rollups(from_time, to_time):
+        rollup_filters = get_rollup_filters(store_pks, categories, date, from_date, to_date)
+        rollup_filters["store__owner"] = user
+        return SalesDailyRollup.get_count(**rollup_filters)
+
+    sales_filters = get_aggregation_filters(store_pks, categories, date, from_date, to_date, from_time, to_time, tz=user.timezone)
     sales_filters["store__owner"] = user
     
     if not sales_filters:
         return 0
     return Sale.get_count(**sales_filters)
 
+
+
+SALES_STATISTICS = ("sales", "revenue", "quantity", "products")
+
+
+def aggregate_sales_statistics(
+        user: UserAccount,
+        statistics: List[str],
+        store_pks: List[str | uuid.UUID] = None,
+        categories: List[str] = None,
+        date: str = None,
+        from_date: str = None,
+        to_date: str = None,
+        from_time: str = None,
+        to_time: str = None,
+        max_decimal_places: int = 2,
+    ) -> Dict[str, int | Money]:
+    """
+    Calculates and returns several statistics on the sales made by a user, that share
+    the same filters, with one aggregation query grouped by currency.
+
+    :param user: The user whose sales statistics are to be aggregated.
+    :param statistics: The statistics to aggregate. Any of "sales" (number of sales), "revenue",
+    "quantity" (quantity of products sold) and "products" (number of distinct products sold).
+    :param store_pks: A list of primary keys of the stores whose sales will be used during aggregation.
+    These are expected to have been filtered with `filter_store_pks_for_user`.
+    If not provided, all the stores owned by the user will be used.
+    :param categories: A list of product categories whose sales will be used during aggregation.
+    :param date: If provided, only sales made on the given date will be used during aggregation.
+    If provided, `from_date` and `to_date` will be ignored.
+    :param from_date: If provided, only sales made on or after the given date will be used during aggregation.
+    :param to_date: If provided, only sales made on or before the given date will be used during aggregation.
+    :param from_time: If provided, only sales made on or after the given time will be used during aggregation.
+    :param to_time: If provided, only sales made on or before the given time will be used during aggregation.
+    :param max_decimal_places: The maximum number of decimal places to round the revenue to.
+    :return: A dictionary mapping each of the requested statistics to its value. 
+    The revenue is in the user's preferred currency.
+    """
+    invalid = set(statistics) - set(SALES_STATISTICS)
+    if invalid:
+        raise ValueError(f"Invalid statistics: {', '.join(invalid)}")
+    
+    if "products" not in statistics and can_use_rollups(from_time, to_time):
+        # The number of distinct products sold cannot be derived from the rollups
+        filters = get_rollup_filters(store_pks, categories, date, from_date, to_date)
+        filters["store__owner"] = user
+        summaries = (
+            SalesDailyRollup.objects.filter(**filters)
+            .order_by()
+            .values(currency=F("revenue_currency"))
+            .annotate(sales_count=Sum("count"), total_quantity=Sum("quantity"), total_amount=Sum("revenue"))
+        )
+        queryset = None
+    else:
+        filters = get_aggregation_filters(store_pks, categories, date, from_date, to_date, from_time, to_time, tz=user.timezone)
+        filters["store__owner"] = user
+        queryset = Sale.objects.filter(**filters).order_by()
+        summaries = queryset.values(currency=F("amount_currency")).annotate(
+            sales_count=Count("pk"), 
+            total_quantity=Sum("quantity"), 
+            total_amount=Sum("amount"),
+            products_count=Count("product", distinct=True),
+        )
+    summaries = list(summaries)
+
+    currency = user.preferred_currency
+    revenue = Money(Decimal(0), currency)
+    for summary in summaries:
+        amount = Money(summary["total_amount"] or Decimal(0), summary["currency"])
+        if str(amount.currency) != str(currency):
+            amount = convert_money(amount, currency)
+        revenue += amount
+    
+    results = {
+        "sales": sum(summary["sales_count"] or 0 for summary in summaries),
+        "revenue": revenue.round(max_decimal_places),
+        "quantity": sum(summary["total_quantity"] or 0 for summary in summaries),
+    }
+    if queryset is not None:
+        if len(summaries) > 1:
+            # The same product may have been sold in more than one currency
+            results["products"] = queryset.aggregate(products_count=Count("product", distinct=True))["products_count"]
+        else:
+            results["products"] = summaries[0]["products_count"] if summaries else 0
+    return { statistic: results[statistic] for statistic in statistics }
+
+
+
+TIME_SERIES_BUCKETS = {
+    "hour": (TruncHour, relativedelta(hours=1)),
+    "day": (TruncDay, relativedelta(days=1)),
+    "week": (TruncWeek, relativedelta(weeks=1)),
+    "month": (TruncMonth, relativedelta(months=1)),
+}
+
+MAX_TIME_SERIES_BUCKETS = 1000
+
+
+def _get_bucket_starts(bucket: str, from_date: datetime.date, to_date: datetime.date) -> List[datetime.datetime]:
+    """Returns the (naive, local) start of every bucket between the given dates, inclusive."""
+    start = datetime.datetime.combine(from_date, datetime.time.min)
+    if bucket == "week":
+        start -= datetime.timedelta(days=start.weekday())
+    elif bucket == "month":
+        start = start.replace(day=1)
+    end = datetime.datetime.combine(to_date + datetime.timedelta(days=1), datetime.time.min)
+
+    step = TIME_SERIES_BUCKETS[bucket][1]
+    bucket_starts = []
+    while start < end:
+        bucket_starts.append(start)
+        if len(bucket_starts) > MAX_TIME_SERIES_BUCKETS:
+            raise ValueError(f"Too many {bucket} buckets in range. Use a larger bucket or a shorter range.")
+        start += step
+    return bucket_starts
+
+
+def aggregate_sales_time_series(
+        user: UserAccount,
+        from_date: str | datetime.date,
+        to_date: str | datetime.date,
+        bucket: str = "day",
+        tz: datetime.tzinfo = None,
+        store_pks: List[str | uuid.UUID] = None,
+        categories: List[str] = None,
+        max_decimal_places: int = 2,
+    ) -> List[Dict[str, Any]]:
+    """
+    Returns the sales count, quantity sold and revenue made by a user, per time bucket,
+    between the given dates.
+
+    All buckets are computed with a single query grouped by the truncated sale time.
+    Buckets without sales are included with zero values.
+
+    :param user: The user whose sales are to be aggregated.
+    :param from_date: The (local) date from which sales will be aggregated.
+    :param to_date: The (local) date up to which sales will be aggregated, inclusive.
+    :param bucket: The size of each bucket. One of "hour", "day", "week" or "month".
+    :param tz: The timezone in which dates and buckets are interpreted. Defaults to the user's timezone.
+    :param store_pks: A list of primary keys of the stores whose sales will be used during aggregation.
+    If not provided, all the stores owned by the user will be used.
+    :param categories: A list of product categories whose sales will be used during aggregation.
+    :param max_decimal_places: The maximum number of decimal places to round the revenue to.
+    :return: A list of buckets, ordered by time, each of the form
+    `{"bucket": <bucket start>, "count": <sales count>, "quantity": <quantity sold>, "revenue": <revenue>}`.
+    The revenue is in the user's preferred currency.
+    """
+    if bucket not in TIME_SERIES_BUCKETS:
+        raise ValueError(f"Invalid bucket: {bucket}. Expected one of {', '.join(TIME_SERIES_BUCKETS)}")
+    tz = tz or user.timezone
+    if isinstance(from_date, str):
+        from_date = datetime.date.fromisoformat(from_date)
+    if isinstance(to_date, str):
+        to_date = datetime.date.fromisoformat(to_date)
+    if from_date > to_date:
+        raise ValueError("from_date cannot be after to_date")
+    bucket_starts = _get_bucket_starts(bucket, from_date, to_date)
+
+    # Filter by a half-open range on `made_at`, so the (store, made_at) index can be used
+    sales_filters = {
+        "store__pk__in": filter_store_pks_for_user(user, store_pks),
+        "made_at__gte": datetime.datetime.combine(from_date, datetime.time.min, tzinfo=tz),
+        "made_at__lt": datetime.datetime.combine(to_date + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz),
+        "product__deleted_at__isnull": True,
+    }
+    if categories:
+        sales_filters["category__in"] = [ category.lower() for category in categories ]
+
+    trunc = TIME_SERIES_BUCKETS[bucket][0]
+    summaries = (
+        Sale.objects.filter(**sales_filters)
+        .order_by()
+        .annotate(bucket=trunc("made_at", tzinfo=tz))
+        .values("bucket", "amount_currency")
+        .annotate(sales_count=Count("pk"), total_quantity=Sum("quantity"), total_amount=Sum("amount"))
+    )
+
+    currency = user.preferred_currency
+    series = {
+        bucket_start: {"count": 0, "quantity": 0, "revenue": Money(Decimal(0), currency)}
+        for bucket_start in bucket_starts
+    }
+    for summary in summaries:
+        bucket_start = summary["bucket"].astimezone(tz).replace(tzinfo=None)
+        values = series.setdefault(bucket_start, {"count": 0, "quantity": 0, "revenue": Money(Decimal(0), currency)})
+        values["count"] += summary["sales_count"]
+        values["quantity"] += summary["total_quantity"] or 0
+        revenue = Money(summary["total_amount"] or Decimal(0), summary["amount_currency"])
+        if str(revenue.currency) != str(currency):
+            revenue = convert_money(revenue, currency)
+        values["revenue"] += revenue
+
+    return [
+        {
+            "bucket": bucket_start.replace(tzinfo=tz),
+            "count": values["count"],
+            "quantity": values["quantity"],
+            "revenue": values["revenue"].round(max_decimal_places),
+        }
+        for bucket_start, values in sorted(series.items())
+    ]
+
+
+
+def _clean_checkout_items(store: Store, items: List[Dict[str, Any]]) -> tuple[Dict[Product, int], Dict[str, List[str]]]:
+    """
+    Internal function that validates the line items of a checkout in one pass.
+
+    Lines for the same product are combined.
+
+    :param store: The store in which the checkout is made.
+    :param items: A list of line items, each of the form `{"product": <product pk>, "quantity": <quantity>}`.
+    :return: A tuple containing a mapping of the products sold to the quantity sold, and a dictionary of errors per line item.
+    """
+    errors = {}
+    quantities: Dict[str, int] = {}
+    for index, item in enumerate(items):
+        try:
+            product_pk = str(uuid.UUID(str(item["product"])))
+            quantity = item.get("quantity", 1)
+        except (TypeError, KeyError, ValueError, AttributeError):
+            errors[f"items[{index}]"] = ["Each item should have a valid product and quantity."]
+            continue
+        # Quantities are not truncated, so that 2.7 is not sold as 2, or true as 1
+        if isinstance(quantity, bool) or (isinstance(quantity, float) and not quantity.is_integer()):
+            errors[f"items[{index}]"] = ["Sale quantity must be a whole number."]
+            continue
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            errors[f"items[{index}]"] = ["Sale quantity must be a whole number."]
+            continue
+        if quantity <= 0:
+            errors[f"items[{index}]"] = ["Sale quantity must be greater than zero."]
+            continue
+        quantities[product_pk] = quantities.get(product_pk, 0) + quantity
+
+    products = { str(product.pk): product for product in Product.objects.filter(store=store, pk__in=quantities) }
+    for index, item in enumerate(items):
+        if f"items[{index}]" in errors:
+            continue
+        product_pk = str(uuid.UUID(str(item["product"])))
+        product = products.get(product_pk)
+        if product is None:
+            errors[f"items[{index}]"] = ["Product does not exist in this store."]
+        elif quantities[product_pk] > product.quantity:
+            errors[f"items[{index}]"] = [f"Sale quantity cannot be greater than available product quantity ({product.quantity})"]
+    
+    if errors:
+        return {}, errors
+    return { products[product_pk]: quantity for product_pk, quantity in quantities.items() }, errors
+
+
+def record_checkout(
+        store: Store,
+        items: List[Dict[str, Any]],
+        idempotency_key: str,
+        payment_method: str = PaymentMethod.CASH,
+    ) -> tuple[Checkout, bool]:
+    """
+    Records a basket of product sales in a store, in one transaction and under one receipt.
+
+    If a checkout with the same idempotency key has already been recorded in the store, 
+    the existing checkout is returned and nothing is recorded.
+
+    :param store: The store in which the checkout is made.
+    :param items: A list of line items, each of the form `{"product": <product pk>, "quantity": <quantity>}`.
+    :param idempotency_key: A key, provided by the client, that identifies the checkout.
+    :param payment_method: The payment method used for the checkout.
+    :return: A tuple containing the checkout and a boolean indicating whether the checkout was recorded.
+    :raises ValidationError: If any of the line items is invalid, or a product does not have enough stock.
+    """
+    if not idempotency_key:
+        raise ValidationError({"idempotency_key": ["An idempotency key is required."]})
+    if payment_method not in PaymentMethod.values:
+        raise ValidationError({"payment_method": [f"Invalid payment method: {payment_method}"]})
+    if not isinstance(items, (list, tuple)):
+        raise ValidationError({"items": ["Items should be a list of products and quantities."]})
+    if not items:
+        raise ValidationError({"items": ["At least one item is required."]})
+    
+    existing_checkout = Checkout.objects.filter(store=store, idempotency_key=idempotency_key).first()
+    if existing_checkout:
+        return existing_checkout, False
+
+    product_quantities, errors = _clean_checkout_items(store, items)
+    if errors:
+        raise ValidationError(errors)
+    
+    try:
+        with transaction.atomic():
+            checkout = Checkout.objects.create(
+                store=store, idempotency_key=idempotency_key, payment_method=payment_method
+            )
+
+            # Take the quantities sold from the stock of all products in one conditional UPDATE.
+            # If any product no longer has enough stock, fewer products are updated and the
+            # whole checkout is rolled back.
+            in_stock = Q()
+            for product, quantity in product_quantities.items():
+                in_stock |= Q(pk=product.pk, quantity__gte=quantity)
+            updated = Product.objects.filter(in_stock).update(
+                quantity=Case(
+                    *(When(pk=product.pk, then=F("quantity") - quantity) for product, quantity in product_quantities.items()),
+                    default=F("quantity"),
+                )
+            )
+            if updated != len(product_quantities):
+                raise ValidationError({"items": ["Some products no longer have enough stock for this checkout."]})
+            
+            made_at = timezone.now()
+            local_time = timezone.localtime(made_at, store.owner.timezone).time()
+            sales = Sale.objects.bulk_create([
+                Sale(
+                    store=store,
+                    product=product,
+                    quantity=quantity,
+                    payment_method=payment_method,
+                    checkout=checkout,
+                    unit_price=product.price,
+                    amount=product.price * quantity,
+                    category=product.category,
+                    made_at=made_at,
+                    local_time=local_time,
+                )
+                for product, quantity in product_quantities.items()
+            ])
+            SalesDailyRollup.record_many(sales)
+            Product.record_sales(sales)
+            columnar.record_sales(sales)
+    except IntegrityError:
+        # The same checkout was recorded concurrently
+        existing_checkout = Checkout.objects.filter(store=store, idempotency_key=idempotency_key).first()
+        if existing_checkout is None:
+            raise
+        return existing_checkout, False
+    return checkout, True
@@ -7,16 +7,21 @@ from django.urls import reverse
 from django.shortcuts import redirect
 import json
 
+from django.core.exceptions import ValidationError
+
 from .models import Sale, PaymentMethod
 from .forms import SaleForm
+from .utils import record_checkout
 from stores.models import Store
-from stores.mixins import StoreQuerySetMixin, SupportsQuerySetFiltering
+from stores.mixins import RequestStoreMixin, StoreQuerySetMixin, SupportsQuerySetFiltering
 from stores.decorators import requires_store_authorization, to_JsonResponse
 from users.decorators import requires_account_verification, requires_password_verification
 from users.mixins import RequestUserQuerySetMixin
+from users.utils import get_local_date_range_filters
 
 
-sale_queryset = Sale.objects.all().select_related("store", "product")
+# The sales of deleted products are hidden until they are purged
+sale_queryset = Sale.objects.filter(product__deleted_at__isnull=True).select_related("store", "product")
 
 
 class SaleListView(
@@ -55,17 +60,19 @@ class SaleListView(
         "date": "made_at__date",
         "from_date": "made_at__date__gte",
         "to_date": "made_at__date__lte",
-        "from_time": "made_at__time__gte",
-        "to_time": "made_at__time__lte",
+        "from_time": "local_time__gte",
+        "to_time": "local_time__lte",
     }
 
     def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
         user = self.request.user
         context["todays_sales"] = self.get_queryset().filter(
-            made_at__date=user.to_local_timezone(timezone.now()).date()
+            **get_local_date_range_filters(
+                "made_at", user.timezone, date=user.to_local_timezone(timezone.now()).date()
+            )
         )
-        context["store"] = Store.objects.get(slug=self.kwargs["store_slug"])
+        context["store"] = self.get_store()
         context["payment_methods"] = PaymentMethod.choices
         context["has_made_sales"] = Sale.objects.filter(store=context["store"]).exists()
         return context
@@ -77,17 +84,21 @@ class SaleListView(
 
 
 
-class SaleAddView(LoginRequiredMixin, generic.CreateView):
+class SaleAddView(RequestStoreMixin, LoginRequiredMixin, generic.CreateView):
     """View for adding a new sale record to a store."""
     model = Sale
     form_class = SaleForm
     http_method_names = ["post"]
 
+    # For the RequestStoreMixin
+    store_identifier = "slug"
+    store_url_kwarg = "store_slug"
+
     @requires_store_authorization(identifier="slug", url_kwarg="store_slug")
     @to_JsonResponse
     @requires_account_verification
     def post(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
-        store = Store.objects.get(slug=kwargs.get("store_slug"))
+        store: Store = request.store
         data: Dict = json.loads(request.body)
         data["store"] = store.pk
 
@@ -126,6 +137,67 @@ class SaleAddView(LoginRequiredMixin, generic.CreateView):
 
 
 
+class SaleCheckoutView(RequestStoreMixin, LoginRequiredMixin, generic.View):
+    """
+    Handles AJAX/Fetch requests to record a basket of product sales in a store, in one transaction.
+
+    Expects a JSON body of the form:
+    ```json
+    {
+        "idempotency_key": "<unique key generated by the client>",
+        "payment_method": "cash",
+        "items": [
+            {"product": "<product pk>", "quantity": 2},
+            ...
+        ]
+    }
+    ```
+    Retrying a request with the same idempotency key does not record the basket again.
+    """
+    http_method_names = ["post"]
+
+    # For the RequestStoreMixin
+    store_identifier = "slug"
+    store_url_kwarg = "store_slug"
+
+    @requires_store_authorization(identifier="slug", url_kwarg="store_slug")
+    @to_JsonResponse
+    @requires_account_verification
+    def post(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        store: Store = request.store
+        data: Dict = json.loads(request.body)
+        try:
+            checkout, created = record_checkout(
+                store,
+                items=data.get("items", []),
+                idempotency_key=data.get("idempotency_key"),
+                payment_method=data.get("payment_method", PaymentMethod.CASH),
+            )
+        except ValidationError as exc:
+            return JsonResponse(
+                data={
+                    "status": "error",
+                    "detail": "An error occurred while recording the sales!",
+                    "errors": exc.message_dict,
+                },
+                status=400
+            )
+        
+        sale_list_url = reverse("stores:sales:sale_list", kwargs={"store_slug": store.slug})
+        redirect_url = f'{sale_list_url}?date={checkout.made_at_utz.date()}'
+        return JsonResponse(
+            data={
+                "status": "success",
+                "detail": "Sales recorded successfully!" if created else "Sales have already been recorded!",
+                "receipt_id": checkout.receipt_id,
+                "sales": list(checkout.sales.values_list("transaction_id", flat=True)),
+                "redirect_url": redirect_url
+            },
+            status=201 if created else 200
+        )
+
+
+
 class SaleUpdateView(StoreQuerySetMixin, LoginRequiredMixin, generic.UpdateView):
     """Handles AJAX/Fetch requests to update a sale record in a store."""
     model = Sale
@@ -213,5 +285,6 @@ class SaleDeleteView(StoreQuerySetMixin, LoginRequiredMixin, generic.DetailView)
 
 sale_list_view = SaleListView.as_view()
 sale_add_view = SaleAddView.as_view()
+sale_checkout_view = SaleCheckoutView.as_view()
 sale_update_view = SaleUpdateView.as_view()
 sale_delete_view = SaleDeleteView.as_view()
@@ -1,12 +1,12 @@
 from typing import Callable
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import Http404, HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.urls import reverse
 from django.views.generic import View
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import redirect
 from django.conf import settings
 import functools
 
-from .models import Store
+from .utils import get_request_store
 
 
 def to_JsonResponse(func: Callable[..., HttpResponse]) -> Callable[..., JsonResponse]:
@@ -62,11 +62,18 @@ def requires_store_authorization(
                     content=f"Store identifier '{url_kwarg}' not found! Expected a URL keyword argument named '{url_kwarg}' but none was found."
                 )
             
-            store = get_object_or_404(Store, **{identifier: identifier_value})
+            # The store is loaded once per request, and reused by the view (see `get_request_store`)
+            store = get_request_store(request, identifier, identifier_value)
+            if store is None:
+                raise Http404("Store not found")
             if store.check_request_is_authorized(request) is False:
                 auth_url = reverse(auth_view)
                 redirect_url = f"{auth_url}?{identifier}={identifier_value}&next={request.path}"
-                return redirect(redirect_url, permanent=False)
+                response = redirect(redirect_url, permanent=False)
+                # Remove stale authorizations, such as those revoked by a change of the store's signature
+                if store.get_authorization_cookie_name() in request.COOKIES:
+                    store.revoke_authorization(response)
+                return response
 
             return view_func(view, request, *args, **kwargs)
         return wrapper
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+from typing import Dict, List
+from decimal import Decimal
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, F, Value, DecimalField
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from djmoney.money import Money
+from djmoney.contrib.exchange.models import ExchangeBackend, Rate, get_default_backend_name
+from djmoney.contrib.exchange.exceptions import MissingRate
+
+
+
+class ExchangeRates:
+    """
+    In-process cache of the exchange rates of an exchange backend.
+
+    The rates of the backend are loaded from the database once, into a dense cross-rate matrix
+    such that `matrix[i][j]` is the rate for converting from the i-th currency to the j-th currency.
+    Conversions are then served from the matrix without any database round trip, until the rates
+    are older than `ttl` seconds or they are invalidated.
+    """
+    def __init__(self, backend: str = None, ttl: float = None) -> None:
+        """
+        Create a new exchange rates cache.
+
+        :param backend: The name of the exchange backend whose rates will be cached.
+        Defaults to the name of the backend set in the EXCHANGE_BACKEND setting.
+        :param ttl: The number of seconds after which the cached rates will be reloaded.
+        Defaults to the value of the EXCHANGE_RATES_CACHE_TTL setting.
+        """
+        self.backend = backend
+        self.ttl = ttl if ttl is not None else getattr(settings, "EXCHANGE_RATES_CACHE_TTL", 3600)
+        # The currencies, mapped to their indices in the matrix, and the matrix.
+        # They are replaced together, so that a conversion never pairs a matrix with the indices of another.
+        self._rates: tuple[Dict[str, int], List[List[Decimal]]] = ({}, [])
+        self._loaded_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        """Whether the cached rates need to be (re)loaded."""
+        return self._loaded_at is None or (time.monotonic() - self._loaded_at) > self.ttl
+
+
+    def invalidate(self) -> None:
+        """Marks the cached rates as stale, so they are reloaded on the next conversion."""
+        self._loaded_at = None
+        return None
+
+
+    def load(self) -> None:
+        """Loads the rates of the exchange backend from the database into the cross-rate matrix."""
+        backend = ExchangeBackend.objects.filter(name=self.backend or get_default_backend_name()).first()
+        rates: Dict[str, Decimal] = {}
+        if backend:
+            rates[backend.base_currency] = Decimal(1)
+            rates.update(
+                (currency, value) for currency, value in backend.rates.values_list("currency", "value") if value
+            )
+
+        values = list(rates.values())
+        matrix = [[target / source for target in values] for source in values]
+        self._rates = ({ currency: index for index, currency in enumerate(rates) }, matrix)
+        self._loaded_at = time.monotonic()
+        return None
+
+
+    def _load_if_stale(self) -> None:
+        if self.is_stale:
+            with self._lock:
+                # Check again, the rates may have been loaded while waiting for the lock
+                if self.is_stale:
+                    self.load()
+        return None
+
+
+    def get_rate(self, source: str, target: str) -> Decimal:
+        """
+        Returns the exchange rate for converting from the source currency to the target currency.
+
+        :param source: The currency to convert from.
+        :param target: The currency to convert to.
+        :raises MissingRate: If there is no rate for either of the currencies.
+        """
+        source, target = str(source), str(target)
+        if source == target:
+            return Decimal(1)
+
+        self._load_if_stale()
+        currencies, matrix = self._rates
+        try:
+            return matrix[currencies[source]][currencies[target]]
+        except KeyError:
+            raise MissingRate(f"Rate {source} -> {target} does not exist")
+
+
+    def get_rates_to(self, currency: str) -> Dict[str, Decimal]:
+        """
+        Returns the rates for converting from each of the known currencies to the given currency.
+
+        :param currency: The currency to convert to.
+        """
+        currency = str(currency)
+        rates = { currency: Decimal(1) }
+        self._load_if_stale()
+        currencies, matrix = self._rates
+        if currency not in currencies:
+            return rates
+        for source, index in currencies.items():
+            rates[source] = matrix[index][currencies[currency]]
+        return rates
+
+
+    def convert(self, value: Money, currency: str) -> Money:
+        """
+        Converts a money value to the given currency.
+
+        :param value: The money value to convert.
+        :param currency: The currency to convert the value to.
+        """
+        return value.__class__(value.amount * self.get_rate(value.currency, currency), currency)
+
+
+
+exchange_rates = ExchangeRates()
+
+
+def convert_money(value: Money, currency: str) -> Money:
+    """
+    Converts a money value to the given currency using the in-process exchange rates cache.
+
+    Drop-in replacement for `djmoney.contrib.exchange.models.convert_money`.
+    """
+    return exchange_rates.convert(value, currency)
+
+
+def get_conversion_expression(field_name: str, currency: str) -> Case:
+    """
+    Returns an expression that converts the values of a money field to the given currency in the database,
+    using the in-process exchange rates cache. Useful for ordering and aggregating money in mixed currencies.
+
+    Values in currencies with no exchange rate are converted to NULL.
+
+    :param field_name: The name of the money field.
+    :param currency: The currency to convert the values to.
+    """
+    return Case(
+        *(
+            When(**{f"{field_name}_currency": source}, then=F(field_name) * Value(rate))
+            for source, rate in exchange_rates.get_rates_to(currency).items()
+        ),
+        default=Value(None),
+        output_field=DecimalField(),
+    )
+
+
+@receiver(post_save, sender=ExchangeBackend)
+@receiver(post_save, sender=Rate)
+@receiver(post_delete, sender=Rate)
+def invalidate_exchange_rates(sender, **kwargs) -> None:
+    """Invalidates the exchange rates cache once changes to the rates are committed."""
+    transaction.on_commit(exchange_rates.invalidate)
+    return None
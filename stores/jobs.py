@@ -0,0 +1,120 @@
+import threading
+import functools
+import logging
+from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, transaction
+from djmoney.contrib.exchange.exceptions import MissingRate
+
+from .models import Store, PurgeJob
+
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+_purge_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the worker pool that products prices updates are run in. The pool is created on first use.
+
+    The pool has a single worker, so that the updates run in the order they were queued.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-job")
+    return _executor
+
+
+def get_purge_executor() -> ThreadPoolExecutor:
+    """
+    Returns the worker pool that purge jobs are run in. The pool is created on first use.
+
+    Purges have their own pool, so that a long purge does not hold up products prices updates.
+    The pool has a single worker, so that purges do not compete with each other for the database.
+    """
+    global _purge_executor
+    if _purge_executor is None:
+        with _executor_lock:
+            if _purge_executor is None:
+                _purge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="purge-job")
+    return _purge_executor
+
+
+def queue_products_prices_update(store: Store, new_currency: str) -> None:
+    """
+    Queues the conversion of the prices of the store's products to the new currency, 
+    once the current transaction is committed.
+    """
+    transaction.on_commit(
+        functools.partial(get_executor().submit, _update_products_prices_in_worker, store.pk, str(new_currency))
+    )
+    return None
+
+
+def update_products_prices(store_pk: str, new_currency: str) -> bool:
+    """
+    Converts the prices of the store's products to the new currency, 
+    if it is still the currency that the store's products are to be converted to.
+
+    The store's `repricing_currency` is cleared once the prices are converted. If they cannot be converted,
+    it is kept, so that the conversion can be retried, and the reason is recorded as the store's `repricing_error`.
+
+    :return: Whether the prices were converted.
+    """
+    store = Store.objects.filter(pk=store_pk).first()
+    # The currency of the store may have changed again since the update was queued
+    if store is None or str(store.repricing_currency) != new_currency or str(store.default_currency) != new_currency:
+        return False
+    stores = Store.objects.filter(pk=store_pk, repricing_currency=new_currency)
+    try:
+        store.update_products_prices(new_currency)
+    except MissingRate as exc:
+        logger.exception("Prices of store %s could not be converted to %s", store_pk, new_currency)
+        stores.update(repricing_error=str(exc))
+        return False
+    stores.update(repricing_currency=None, repricing_error="")
+    return True
+
+
+def resume_products_prices_updates() -> Dict[str, bool]:
+    """
+    Runs the conversions of products prices that were not completed, because the process stopped 
+    before they ran, or because an exchange rate was missing.
+
+    :return: A dictionary mapping the primary keys of the stores to whether their products prices were converted.
+    """
+    stores = Store.objects.exclude(repricing_currency=None).values_list("pk", "repricing_currency")
+    return { str(store_pk): update_products_prices(store_pk, str(currency)) for store_pk, currency in stores }
+
+
+def _update_products_prices_in_worker(store_pk: str, new_currency: str) -> None:
+    try:
+        update_products_prices(store_pk, new_currency)
+    except Exception:
+        logger.exception("Prices of store %s could not be updated", store_pk)
+    finally:
+        # Worker threads do not go through the request cycle that closes connections
+        connection.close()
+    return None
+
+
+def queue_purge_job(job: PurgeJob) -> None:
+    """Queues a purge job, once the current transaction is committed."""
+    transaction.on_commit(functools.partial(get_purge_executor().submit, _run_purge_job_in_worker, job.pk))
+    return None
+
+
+def _run_purge_job_in_worker(job_pk: str) -> None:
+    from .purge import run_purge_job
+
+    try:
+        run_purge_job(job_pk)
+    finally:
+        # Worker threads do not go through the request cycle that closes connections
+        connection.close()
+    return None
@@ -0,0 +1,43 @@
+import json
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from djmoney.contrib.exchange.models import ExchangeBackend, Rate, get_default_backend_name
+
+from stores.exchange import exchange_rates
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads exchange rates from a local JSON fixture, for deployments without access to the exchange backend. "
+        'The fixture should be of the form {"base": "USD", "rates": {"NGN": 1500.0, ...}}.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fixture", help="Path to the JSON fixture containing the exchange rates.")
+        parser.add_argument(
+            "--backend",
+            default=None,
+            help="Name of the exchange backend to load the rates for. Defaults to the backend in the EXCHANGE_BACKEND setting.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["fixture"], "r") as fixture:
+                data = json.load(fixture, parse_float=Decimal)
+            base_currency = data["base"]
+            rates = { currency: Decimal(value) for currency, value in data["rates"].items() }
+        except (OSError, ValueError, KeyError, TypeError, ArithmeticError) as exc:
+            raise CommandError(f"Invalid exchange rates fixture: {exc}")
+
+        backend_name = options["backend"] or get_default_backend_name()
+        with transaction.atomic():
+            backend, _ = ExchangeBackend.objects.update_or_create(
+                name=backend_name, defaults={"base_currency": base_currency}
+            )
+            backend.clear_rates()
+            Rate.objects.bulk_create(
+                [ Rate(currency=currency, value=value, backend=backend) for currency, value in rates.items() ]
+            )
+        exchange_rates.invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(rates)} exchange rates for {backend_name}"))
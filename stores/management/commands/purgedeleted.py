@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from stores.models import PurgeJob, PurgeJobStatus
+from stores.purge import run_purge_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the purge jobs of deleted stores and products that have not completed, resuming interrupted and failed jobs. "
+        "Jobs that are running elsewhere are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="The number of objects deleted at a time. Defaults to the PURGE_BATCH_SIZE setting.",
+        )
+
+    def handle(self, *args, **options):
+        job_pks = list(
+            PurgeJob.objects.exclude(status=PurgeJobStatus.COMPLETED).order_by("created_at").values_list("pk", flat=True)
+        )
+        failed = 0
+        for job_pk in job_pks:
+            job = run_purge_job(job_pk, batch_size=options["batch_size"])
+            if job.status == PurgeJobStatus.RUNNING:
+                self.stdout.write(f"Skipped {job.get_target_display().lower()} {job.object_name}, as it is being purged elsewhere")
+            elif job.status == PurgeJobStatus.FAILED:
+                failed += 1
+                self.stderr.write(self.style.ERROR(f"Purge of {job.get_target_display().lower()} {job.object_name} failed: {job.error}"))
+            else:
+                self.stdout.write(f"Purged {job.get_target_display().lower()} {job.object_name} ({job.deleted_count} objects deleted)")
+        self.stdout.write(self.style.SUCCESS(f"Ran {len(job_pks)} purge jobs, {failed} failed"))
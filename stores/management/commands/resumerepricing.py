@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from stores.jobs import resume_products_prices_updates
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the prices of the products of stores whose default currency changed, "
+        "where the conversion in the background did not complete, because the process stopped or an exchange rate was missing."
+    )
+
+    def handle(self, *args, **options):
+        results = resume_products_prices_updates()
+        failed = list(results.values()).count(False)
+        self.stdout.write(self.style.SUCCESS(f"Converted the products prices of {len(results) - failed} stores, {failed} failed"))
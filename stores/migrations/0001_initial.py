@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:46
+
+import djmoney.models.fields
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Store',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('slug', models.SlugField(editable=False, null=True, unique=True)),
+                ('name', models.CharField(max_length=150)),
+                ('type', models.CharField(choices=[('grocery', 'Grocery'), ('medical', 'Medical'), ('market', 'Market'), ('mart', 'Mart'), ('mall', 'Mall'), ('provision', 'Provision'), ('pharmacy', 'Pharmacy'), ('restaurant', 'Restaurant'), ('clothing', 'Clothing'), ('electronics', 'Electronics'), ('auto', 'Auto'), ('gift', 'Gift'), ('other', 'Other')], default='other', max_length=50)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('passkey', models.CharField(blank=True, default=None, editable=False, max_length=50, null=True)),
+                ('signature', models.CharField(blank=True, default='5060174f6c3d430fa29bb892e6a7691b', editable=False, help_text='A unique string that identifies this store apart from its primary key. It is used in store access authorization.', max_length=50, null=True)),
+                ('default_currency', djmoney.models.fields.CurrencyField(default='NGN', max_length=3)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ('name', '-created_at'),
+            },
+        ),
+    ]
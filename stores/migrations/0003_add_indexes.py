@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stores', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(fields=['owner', 'name', 'created_at'], name='store_owner_name_idx'),
+        ),
+    ]
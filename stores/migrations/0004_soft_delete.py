@@ -0,0 +1,62 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:29
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stores', '0003_add_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurgeJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target', models.CharField(choices=[('store', 'Store'), ('product', 'Product')], max_length=20)),
+                ('object_id', models.UUIDField(help_text='The primary key of the store or product being purged.')),
+                ('object_name', models.CharField(max_length=150)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('progress', models.PositiveSmallIntegerField(default=0, help_text='Percentage of the objects that have been deleted.')),
+                ('total_count', models.PositiveIntegerField(default=0, help_text='The number of objects to delete, including the target.')),
+                ('deleted_counts', models.JSONField(blank=True, default=dict, help_text='The number of objects deleted, per model.')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='When the job last made progress.')),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'purge job',
+                'verbose_name_plural': 'purge jobs',
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='store',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the store was deleted. Deleted stores are hidden, and purged in the background.', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='store',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('name', 'owner'), name='store_owner_name_uniq'),
+        ),
+        migrations.AddField(
+            model_name='purgejob',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purge_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='purgejob',
+            constraint=models.UniqueConstraint(fields=('target', 'object_id'), name='purge_job_target_object_uniq'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:05
+
+import djmoney.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stores', '0004_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='repricing_currency',
+            field=djmoney.models.fields.CurrencyField(blank=True, default=None, editable=False, help_text="The currency that the prices of the store's products are being converted to in the background, if any.", max_length=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='repricing_error',
+            field=models.TextField(blank=True, editable=False, help_text="Why the prices of the store's products could not be converted in the background."),
+        ),
+    ]
@@ -1,30 +1,71 @@
-from django.db.models import QuerySet
+import base64
+import datetime
+import json
+import zoneinfo
+from typing import Any, List
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError
+from django.db.models import Field, Model, QuerySet, Q
+from django.http import Http404, HttpRequest
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from djmoney.money import Money
 from decimal import Decimal
 
 from .models import Store
+from .utils import get_request_store
 from products.models import ProductCategories
+from users.utils import get_local_date_range_filters
 
 
 
-class StoreQuerySetMixin:
+class RequestStoreMixin:
+    """
+    Mixin that sets `request.store` to the store specified in the URL.
+
+    The store is loaded lazily, on first access, and only once per request (see `get_request_store`), 
+    so decorators, mixins and the view share it. Accessing `request.store` raises `Http404` if there is no such store.
+
+    The following attributes allow customization of the mixin:
+    - store_identifier: The name of the field in the store model that holds a unique identifier.
+    - store_url_kwarg: The name of the URL keyword argument that hold the store identifier.
+    """
+    store_url_kwarg = "store_id"
+    store_identifier = "pk"
+
+    def setup(self, request: HttpRequest, *args, **kwargs) -> None:
+        super().setup(request, *args, **kwargs)
+        request.store = SimpleLazyObject(self.get_store)
+    
+
+    def get_store(self) -> Store:
+        """
+        Returns the store specified in the URL.
+
+        :raises Http404: If there is no such store.
+        """
+        store = get_request_store(self.request, self.store_identifier, self.kwargs.get(self.store_url_kwarg))
+        if store is None:
+            raise Http404("Store not found")
+        return store
+
+
+
+class StoreQuerySetMixin(RequestStoreMixin):
     """
     Mixin to get the queryset of the store specified in the URL.
 
+    The queryset is filtered by the primary key of the store, which is loaded once per request (see `RequestStoreMixin`).
+
     The following attributes allow customization of the mixin:
     - store_field: The name of the field in the model that stores the store object.
     - store_identifier: The name of the field in the store model that holds a unique identifier.
     - store_url_kwarg: The name of the URL keyword argument that hold the store identifier.
     """
     store_field = "store"
-    store_url_kwarg = "store_id"
-    store_identifier = "pk"
 
     def get_queryset(self, *args, **kwargs) -> QuerySet:
-        store_identifier_value = self.kwargs.get(self.store_url_kwarg)
-        return super().get_queryset(*args, **kwargs).filter(
-            **{f"{self.store_field}__{self.store_identifier}": store_identifier_value}
-        )
+        return super().get_queryset(*args, **kwargs).filter(**{self.store_field: self.get_store()})
 
 
 
@@ -46,6 +87,13 @@ ALLOWED_FILTER_PARAMS = (
     "to_time",
 )
 
+# Date filter params, mapped to the lookup suffix each is expected to be mapped to in `filter_mappings`
+DATE_FILTERS = {
+    "date": "__date",
+    "from_date": "__date__gte",
+    "to_date": "__date__lte",
+}
+
 LIST_TYPE_FILTERS = (
     "categories",
     "brands",
@@ -78,6 +126,17 @@ class SupportsQuerySetFiltering:
     qs = queryset.filter(added_at__date="2021-10-10")
     ```
 
+    Except that the `date`, `from_date` and `to_date` params, when mapped to `__date`, `__date__gte` and `__date__lte` 
+    lookups, are turned into a range on the datetime field in the timezone of the request user (see `get_filter_timezone`).
+    So `/products/?date=2021-10-10` for a user in the Africa/Lagos timezone actually filters the queryset as follows:
+    ```python
+    qs = queryset.filter(
+        added_at__gte=datetime(2021, 10, 10, tzinfo=ZoneInfo("Africa/Lagos")),
+        added_at__lt=datetime(2021, 10, 11, tzinfo=ZoneInfo("Africa/Lagos")),
+    )
+    ```
+    which, unlike the `__date` lookup, can use an index on the field.
+
     #### Using the filters card in the views template
     Include the filters card in the views template thus;
 
@@ -98,6 +157,7 @@ class SupportsQuerySetFiltering:
     ```
     """
     filter_mappings = {}
+    filter_timezone = None
 
     def get_queryset(self, *args, **kwargs) -> QuerySet:
         self._check_filter_mappings()
@@ -121,7 +181,12 @@ class SupportsQuerySetFiltering:
     
 
     def _get_store(self) -> Store | None:
-        return Store.objects.filter(slug=self.kwargs.get("store_slug")).first()
+        store_slug = self.kwargs.get("store_slug")
+        request = getattr(self, "request", None)
+        if request is None:
+            # Views can be used without a request, to filter querysets in background jobs
+            return Store.objects.filter(slug=store_slug).first()
+        return get_request_store(request, "slug", store_slug)
     
 
     def process_filter_params(self, params: dict) -> dict:
@@ -133,12 +198,19 @@ class SupportsQuerySetFiltering:
         :return: A dictionary of suitable query filters to filter the queryset by.
         """
         query_filters = {}
+        date_range_params = {}
 
         for param_name, query_filter in self.filter_mappings.items():
             param_val = params.get(param_name, None)
             if not param_val:
                 continue
 
+            if param_name in DATE_FILTERS and query_filter.endswith(DATE_FILTERS[param_name]):
+                # Date lookups are turned into indexable datetime range filters, below
+                field = query_filter.removesuffix(DATE_FILTERS[param_name])
+                date_range_params.setdefault(field, {})[param_name] = param_val
+                continue
+
             if param_name in LIST_TYPE_FILTERS:
                 param_val = param_val.split(",")
 
@@ -147,7 +219,24 @@ class SupportsQuerySetFiltering:
                 param_val = Money(Decimal(param_val), store.default_currency) if store else Money(Decimal(param_val), "NGN")
 
             query_filters[query_filter] = param_val
+
+        tz = self.get_filter_timezone()
+        for field, date_params in date_range_params.items():
+            query_filters.update(get_local_date_range_filters(field, tz, **date_params))
         return query_filters
+    
+
+    def get_filter_timezone(self) -> zoneinfo.ZoneInfo:
+        """
+        Returns the timezone date filters are applied in. 
+        Defaults to the `filter_timezone` attribute, then the timezone of the request user.
+        """
+        if self.filter_timezone is not None:
+            return self.filter_timezone
+        request = getattr(self, "request", None)
+        if request is not None and request.user.is_authenticated:
+            return request.user.timezone
+        return timezone.get_current_timezone()
 
 
     def get_context_data(self, *args, **kwargs) -> dict:
@@ -161,3 +250,127 @@ class SupportsQuerySetFiltering:
             context["brands"] = store.product_brands.all()
             context["groups"] = store.product_groups.all()
         return context
+
+
+
+class _CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder for keyset pagination cursors. Datetimes are encoded with their microseconds,
+    which `DjangoJSONEncoder` drops, so that cursors match the rows they were made from exactly.
+    """
+    def default(self, o: Any) -> Any:
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _get_model_field(model: type[Model], field_name: str) -> Field:
+    if field_name == "pk":
+        return model._meta.pk
+    return model._meta.get_field(field_name)
+
+
+class KeysetPaginationMixin:
+    """
+    Mixin to paginate the object list of a list view by keyset (seek) pagination.
+
+    Rather than skipping the rows of previous pages with an OFFSET, each page is fetched
+    by filtering for rows after the last row of the previous page, in `keyset_ordering`. 
+    So fetching any page costs the same, given an index on the ordering fields.
+
+    The following attributes allow customization of the mixin:
+    - keyset_ordering: The fields to order the objects by. The last field must be unique.
+    - keyset_page_size: The number of objects per page.
+    - keyset_cursor_param: The name of the query parameter that holds the cursor of the page.
+
+    The context of the view will contain the page's objects, `next_cursor` (None on the last page),
+    `page_start_index`, the 1-based position of the first object of the page in the object list,
+    and `first_page_query` and `next_page_query`, the query strings of the first and next pages 
+    (None if there is no such page), for use with the keyset paginator template:
+    ```html
+    {% include 'base/keyset_paginator.html' %}
+    ```
+    """
+    keyset_ordering = ("-pk",)
+    keyset_page_size = 50
+    keyset_cursor_param = "cursor"
+
+    def get_context_data(self, *, object_list: QuerySet = None, **kwargs) -> dict:
+        queryset = object_list if object_list is not None else self.object_list
+        page_objects, next_cursor, page_start_index = self.paginate_by_keyset(queryset)
+        context = super().get_context_data(object_list=page_objects, **kwargs)
+        context["next_cursor"] = next_cursor
+        context["page_start_index"] = page_start_index
+
+        # Query strings for the next and first pages, keeping the other query parameters
+        params = self.request.GET.copy()
+        params.pop(self.keyset_cursor_param, None)
+        context["first_page_query"] = params.urlencode() if page_start_index > 1 else None
+        if next_cursor:
+            params[self.keyset_cursor_param] = next_cursor
+            context["next_page_query"] = params.urlencode()
+        else:
+            context["next_page_query"] = None
+        return context
+    
+
+    def paginate_by_keyset(self, queryset: QuerySet) -> tuple[List[Any], str | None, int]:
+        """
+        Returns the objects of the page requested, the cursor of the next page, and
+        the position of the first object of the page in the queryset.
+
+        :raises Http404: If the cursor is invalid.
+        """
+        queryset = queryset.order_by(*self.keyset_ordering)
+        page_index, values = self._decode_cursor(queryset.model, self.request.GET.get(self.keyset_cursor_param))
+        if values is not None:
+            queryset = queryset.filter(self._get_keyset_filter(values))
+
+        # Fetch one extra object to know if there is a next page
+        page_objects = list(queryset[:self.keyset_page_size + 1])
+        next_cursor = None
+        if len(page_objects) > self.keyset_page_size:
+            page_objects = page_objects[:self.keyset_page_size]
+            next_cursor = self._encode_cursor(page_index + 1, page_objects[-1])
+        return page_objects, next_cursor, page_index * self.keyset_page_size + 1
+    
+
+    def _get_keyset_filter(self, values: List[Any]) -> Q:
+        """
+        Returns a filter for the objects after the object with the given keyset values.
+
+        For the ordering `("-made_at", "-id")`, that is 
+        `Q(made_at__lt=made_at) | Q(made_at=made_at, id__lt=id)`.
+        """
+        keyset_filter = Q()
+        for index, field in enumerate(self.keyset_ordering):
+            field_name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition = Q(**{f"{field_name}__{lookup}": values[index]})
+            for previous_field, value in zip(self.keyset_ordering[:index], values):
+                condition &= Q(**{previous_field.lstrip("-"): value})
+            keyset_filter |= condition
+        return keyset_filter
+    
+
+    def _encode_cursor(self, page_index: int, obj: Any) -> str:
+        values = [ getattr(obj, field.lstrip("-")) for field in self.keyset_ordering ]
+        cursor = json.dumps([page_index, *values], cls=_CursorJSONEncoder)
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+    
+
+    def _decode_cursor(self, model: type[Model], cursor: str | None) -> tuple[int, List[Any] | None]:
+        if not cursor:
+            return 0, None
+        
+        try:
+            page_index, *values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.keyset_ordering):
+                raise ValueError("Invalid number of cursor values")
+            values = [
+                _get_model_field(model, field.lstrip("-")).to_python(value)
+                for field, value in zip(self.keyset_ordering, values)
+            ]
+            return int(page_index), values
+        except (ValueError, TypeError, ValidationError) as exc:
+            raise Http404("Invalid page cursor") from exc
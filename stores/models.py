@@ -1,16 +1,21 @@
 from django.db import models
 import uuid
-from django.http import HttpRequest
+from django.core import signing
+from django.utils.crypto import salted_hmac, constant_time_compare
+from django.http import HttpRequest, HttpResponse
 from datetime import timedelta
 from django.utils import timezone
 from django.utils.text import slugify
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Dict
+from django.conf import settings
+from django.db import transaction
 
 from django_utz.decorators import model
 from djmoney.models.fields import CurrencyField
-from djmoney.contrib.exchange.models import convert_money
-from djmoney.contrib.exchange.exceptions import MissingRate
+from djmoney.money import Money
+
+from .exchange import exchange_rates
 
 
 class StoreTypes(models.TextChoices):
@@ -30,6 +35,17 @@ class StoreTypes(models.TextChoices):
     OTHER = "other", "Other"
 
 
+class NotDeletedManager(models.Manager):
+    """
+    Manager that excludes deleted objects, of models with a `deleted_at` field.
+
+    Deleted objects are hidden at once, and purged from the database in the background (see `stores.purge`).
+    """
+    def get_queryset(self) -> models.QuerySet:
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+
 @model
 class Store(models.Model):
     """Model representing a store."""
@@ -45,12 +61,34 @@ class Store(models.Model):
         help_text="A unique string that identifies this store apart from its primary key. It is used in store access authorization."
     )
     default_currency = CurrencyField(default="NGN")
+    repricing_currency = CurrencyField(
+        null=True, blank=True, default=None, editable=False,
+        help_text="The currency that the prices of the store's products are being converted to in the background, if any."
+    )
+    repricing_error = models.TextField(
+        blank=True, editable=False, help_text="Why the prices of the store's products could not be converted in the background."
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(
+        null=True, blank=True, editable=False, 
+        help_text="When the store was deleted. Deleted stores are hidden, and purged in the background."
+    )
+
+    objects = NotDeletedManager()
+    all_objects = models.Manager()
 
     class Meta:
         ordering = ("name", "-created_at")
-        unique_together = ("name", "owner")
+        indexes = [
+            models.Index(fields=("owner", "name", "created_at"), name="store_owner_name_idx"),
+        ]
+        constraints = [
+            # The name of a deleted store can be reused while the store is purged
+            models.UniqueConstraint(
+                fields=("name", "owner"), condition=models.Q(deleted_at__isnull=True), name="store_owner_name_uniq"
+            ),
+        ]
 
     class UTZMeta:
         datetime_fields = "__all__"
@@ -61,7 +99,15 @@ class Store(models.Model):
     
 
     def save(self, *args, **kwargs):
-        """Saves this store to the database."""
+        """
+        Saves this store to the database.
+
+        If the default currency of the store changes, the prices of its products are converted to the new currency.
+        The prices of large catalogs, of more than `STORE_REPRICING_JOB_THRESHOLD` products, are converted in the background,
+        and the new currency is recorded as the store's `repricing_currency` until they are.
+
+        :raises MissingRate: If a price cannot be converted to the new currency. The store is not saved.
+        """
         if not self.pk or not self.slug:
             self.slug = f"{slugify(self.name)}-{self.id.hex[:8]}"
 
@@ -69,35 +115,95 @@ class Store(models.Model):
         if self.pk:
             existing_store = self.__class__.objects.filter(pk=self.pk).first()
             if existing_store and self.default_currency != existing_store.default_currency:
-                self.update_products_prices(self.default_currency)
-                pass
+                # Get the rates first, so that a missing rate prevents the change
+                rates = self.get_products_prices_conversion_rates(self.default_currency)
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                    if self.products.count() > settings.STORE_REPRICING_JOB_THRESHOLD:
+                        from .jobs import queue_products_prices_update
+
+                        # Recorded so that the conversion can be resumed if it is not completed (see `stores.jobs`)
+                        self.repricing_currency, self.repricing_error = self.default_currency, ""
+                        self.__class__.objects.filter(pk=self.pk).update(
+                            repricing_currency=self.repricing_currency, repricing_error=self.repricing_error
+                        )
+                        queue_products_prices_update(self, self.default_currency)
+                    else:
+                        self.update_products_prices(self.default_currency, rates=rates)
+                        if self.repricing_currency:
+                            # A conversion to a previous currency, that is no longer needed
+                            self.repricing_currency, self.repricing_error = None, ""
+                            self.__class__.objects.filter(pk=self.pk).update(repricing_currency=None, repricing_error="")
+                return None
         return super().save(*args, **kwargs)
     
 
-    def update_products_prices(self, new_currency: str) -> None:
+    def get_products_prices_conversion_rates(self, new_currency: str) -> Dict[str, Decimal]:
         """
-        Updates the prices of all products in this store to the new currency.
+        Returns the rates for converting the prices of this store's products to the new currency, 
+        mapped by the currencies they are converted from.
 
-        :param new_currency: The new currency to convert the prices to.
+        :raises MissingRate: If there is no rate for converting from one of the currencies.
         """
-        executor = ThreadPoolExecutor(10)
-        loop = asyncio.new_event_loop()
+        products = self.products.order_by()
+        currencies = set(products.values_list("price_currency", flat=True).distinct())
+        currencies |= set(products.values_list("lifetime_revenue_currency", flat=True).distinct())
+        return { str(currency): exchange_rates.get_rate(currency, new_currency) for currency in currencies }
+    
 
-        async def aupdate_product_prices(product):
-            try:
-                product.price = await loop.run_in_executor(
-                    executor, convert_money, 
-                    product.price, new_currency
-                )
-                await product.asave()
-            except MissingRate:
-                raise asyncio.CancelledError
-            return None
+    def update_products_prices(self, new_currency: str, rates: Dict[str, Decimal] = None, chunk_size: int = 1000) -> int:
+        """
+        Converts the prices, and lifetime revenues, of all products in this store to the new currency,
+        in one transaction.
+
+        The conversion rates are looked up once, before any product is updated. The products
+        are then updated in chunks with `bulk_update`, along with their fingerprints, which include their prices.
+
+        :param new_currency: The new currency to convert the prices to.
+        :param rates: The conversion rates to use, as returned by `get_products_prices_conversion_rates`.
+        :param chunk_size: The number of products updated at a time.
+        :return: The number of products updated.
+        :raises MissingRate: If a price cannot be converted to the new currency. No product is updated.
+        """
+        new_currency = str(new_currency)
+        if rates is None:
+            rates = self.get_products_prices_conversion_rates(new_currency)
         
-        tasks = [loop.create_task(aupdate_product_prices(product)) for product in self.products.all()]
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(asyncio.gather(*tasks))
-        return None
+        updated = 0
+        now = timezone.now()
+        with transaction.atomic():
+            # Lock the products, so prices and sales statistics are not changed while they are converted
+            products = self.products.select_for_update().order_by()
+            product_pks = list(
+                products.exclude(price_currency=new_currency, lifetime_revenue_currency=new_currency).values_list("pk", flat=True)
+            )
+            # Converted prices may round to the price of another product. Such products become copies of the other.
+            fingerprints = set(
+                products.filter(price_currency=new_currency).exclude(pk__in=product_pks)
+                .exclude(fingerprint=None).values_list("fingerprint", flat=True)
+            )
+            for index in range(0, len(product_pks), chunk_size):
+                chunk = list(self.products.filter(pk__in=product_pks[index:index + chunk_size]))
+                for product in chunk:
+                    product.updated_at = now
+                    product.price = Money(
+                        (product.price.amount * rates[str(product.price.currency)]).quantize(Decimal("0.01")), new_currency
+                    )
+                    product.lifetime_revenue = Money(
+                        (product.lifetime_revenue.amount * rates[str(product.lifetime_revenue.currency)]).quantize(Decimal("0.01")), 
+                        new_currency
+                    )
+                    if product.fingerprint is not None:
+                        product.fingerprint = product.get_fingerprint()
+                        if product.fingerprint in fingerprints:
+                            product.fingerprint = None
+                        else:
+                            fingerprints.add(product.fingerprint)
+                
+                updated += self.products.model.objects.bulk_update(
+                    chunk, ["price", "price_currency", "lifetime_revenue", "lifetime_revenue_currency", "fingerprint", "updated_at"]
+                )
+        return updated
     
 
     def change_signature(self) -> None:
@@ -126,15 +232,56 @@ class Store(models.Model):
         return None
     
 
-    def authorize_request(self, request: HttpRequest, passkey: str, authorize_for_days: int = 1) -> bool:
+    def get_authorization_cookie_name(self) -> str:
+        """Returns the name of the cookie that holds the authorization token of a request to access this store."""
+        return f"{settings.STORE_AUTHORIZATION_COOKIE_PREFIX}{self.id.hex}"
+    
+
+    def _get_authorization_salt(self) -> str:
+        # Tokens are signed with the store's signature, so changing the signature invalidates them
+        return f"stores.Store.authorization:{self.signature}"
+    
+
+    def _get_session_hash(self, request: HttpRequest) -> str:
+        # Tokens are bound to the session they were given in, so logging out, which ends the session, revokes them
+        session_key = getattr(getattr(request, "session", None), "session_key", None) or ""
+        return salted_hmac(self._get_authorization_salt(), session_key).hexdigest()
+    
+
+    def get_authorization_token(self, request: HttpRequest, authorize_for_days: int = 1) -> str:
+        """
+        Returns a signed token that authorizes requests by the owner of this store to access it, 
+        in the session of the given request, until it expires, the session ends or the signature of the store is changed.
+
+        :param request: The request in whose session the token is valid.
+        :param authorize_for_days: The number of days for which the token should be valid.
+        """
+        expires_at = timezone.now() + timedelta(days=authorize_for_days)
+        return signing.dumps(
+            {
+                "store": self.id.hex, 
+                "user": str(self.owner_id), 
+                "session": self._get_session_hash(request),
+                "expires_at": int(expires_at.timestamp()),
+            }, 
+            salt=self._get_authorization_salt(),
+            compress=True,
+        )
+    
+
+    def authorize_request(self, request: HttpRequest, passkey: str, response: HttpResponse, authorize_for_days: int = 1) -> bool:
         """
         Authorizes a request to access this store.
 
+        The authorization is kept in a signed cookie set on the response, 
+        so later requests can be checked without database or session access.
+
         :param request: The request to authorize.
         :param passkey: The passkey to use for authorization.
+        :param response: The response to the request, on which the authorization cookie is set.
         :param authorize_for_days: The number of days for which the request authorization should be valid.
         """
-        if not request.user == self.owner:
+        if request.user.pk != self.owner_id:
             return False
         # If the store has no passkey, it is always authorized.
         if not self.passkey:
@@ -142,33 +289,113 @@ class Store(models.Model):
         
         authorized = passkey == self.passkey
         if authorized:
-            expiry_time = timezone.now() + timedelta(days=authorize_for_days)
-            request.session[f'authorization_for_store_{self.signature}_expires_at'] = expiry_time.strftime("%Y-%m-%d %H:%M:%S")
+            response.set_cookie(
+                self.get_authorization_cookie_name(), 
+                self.get_authorization_token(request, authorize_for_days),
+                max_age=timedelta(days=authorize_for_days),
+                secure=request.is_secure(),
+                httponly=True,
+                samesite="Lax",
+            )
         return authorized
 
 
-    def revoke_authorization(self, request: HttpRequest) -> None:
-        """Revokes authorization for a request to access this store."""
-        if not request.user == self.owner:
-            return
-        if not self.passkey:
-            return
-        request.session.pop(f'authorization_for_store_{self.signature}_expires_at', None)
+    def revoke_authorization(self, response: HttpResponse) -> None:
+        """Revokes authorization for a request to access this store, by deleting its authorization cookie."""
+        response.delete_cookie(self.get_authorization_cookie_name(), samesite="Lax")
         return None
 
 
     def check_request_is_authorized(self, request: HttpRequest) -> bool:
-        """Checks if a request is authorized to access this store."""
-        if not request.user == self.owner:
+        """
+        Checks if a request is authorized to access this store, from the signed authorization cookie of the request.
+
+        Does not access the database or the session store, only the session key of the request. 
+        """
+        if request.user.pk != self.owner_id:
             return False
         # If the store has no passkey, it is always authorized.
         if not self.passkey:
             return True
 
-        expiry_time = request.session.get(f'authorization_for_store_{self.signature}_expires_at')
-        if not expiry_time:
-            self.revoke_authorization(request)
+        token = request.COOKIES.get(self.get_authorization_cookie_name())
+        if not token:
             return False
-        
-        expiry_time = timezone.datetime.strptime(expiry_time, "%Y-%m-%d %H:%M:%S")
-        return timezone.now() < timezone.make_aware(expiry_time)
+        try:
+            authorization = signing.loads(token, salt=self._get_authorization_salt())
+        except signing.BadSignature:
+            return False
+        return (
+            authorization.get("store") == self.id.hex 
+            and authorization.get("user") == str(self.owner_id)
+            and constant_time_compare(authorization.get("session", ""), self._get_session_hash(request))
+            and timezone.now().timestamp() < authorization.get("expires_at", 0)
+        )
+
+
+
+class PurgeJobStatus(models.TextChoices):
+    """Choices for the status of a purge job."""
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    COMPLETED = "completed", "Completed"
+    FAILED = "failed", "Failed"
+
+
+
+class PurgeTargets(models.TextChoices):
+    """Choices for the type of object a purge job deletes."""
+    STORE = "store", "Store"
+    PRODUCT = "product", "Product"
+
+
+
+@model
+class PurgeJob(models.Model):
+    """
+    Model for the deletion of a deleted store or product, and of the objects that depend on it,
+    that is run in the background in batches (see `stores.purge`).
+
+    Each batch is deleted in its own transaction, along with the job's progress, so an interrupted job 
+    can be resumed from where it stopped.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey("users.UserAccount", on_delete=models.CASCADE, related_name="purge_jobs")
+    target = models.CharField(max_length=20, choices=PurgeTargets.choices)
+    object_id = models.UUIDField(help_text="The primary key of the store or product being purged.")
+    object_name = models.CharField(max_length=150)
+    status = models.CharField(max_length=20, choices=PurgeJobStatus.choices, default=PurgeJobStatus.PENDING)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percentage of the objects that have been deleted.")
+    total_count = models.PositiveIntegerField(default=0, help_text="The number of objects to delete, including the target.")
+    deleted_counts = models.JSONField(default=dict, blank=True, help_text="The number of objects deleted, per model.")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the job last made progress.")
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "purge job"
+        verbose_name_plural = "purge jobs"
+        ordering = ("-created_at",)
+        constraints = [
+            models.UniqueConstraint(fields=("target", "object_id"), name="purge_job_target_object_uniq"),
+        ]
+
+    class UTZMeta:
+        datetime_fields = "__all__"
+
+
+    def __str__(self) -> str:
+        return f"{self.get_target_display()} {self.object_name} purge ({self.status})"
+    
+
+    @property
+    def deleted_count(self) -> int:
+        """The number of objects deleted so far."""
+        return sum(self.deleted_counts.values())
+    
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (PurgeJobStatus.COMPLETED, PurgeJobStatus.FAILED)
@@ -0,0 +1,197 @@
+import os
+import logging
+from datetime import timedelta
+from typing import Any, Callable, List, Tuple
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from products.models import Product, ProductBrand, ProductGroup
+from products.search import remove_products_from_search
+from sales.models import Sale, SalesDailyRollup, Checkout
+from sales import columnar
+from reports.models import ReportJob
+from .models import Store, PurgeJob, PurgeJobStatus, PurgeTargets
+
+
+logger = logging.getLogger(__name__)
+
+# A step of a purge: a label for the objects deleted, the objects to delete, 
+# and a function called with each batch of objects before it is deleted.
+PurgeStep = Tuple[str, QuerySet, Callable[[QuerySet], None] | None]
+
+
+def delete_store(store: Store) -> PurgeJob:
+    """
+    Deletes a store. 
+    
+    The store is hidden at once, and it is purged from the database, 
+    along with its products, sales and other dependents, by a background job.
+
+    :return: The job that purges the store.
+    """
+    with transaction.atomic():
+        store.deleted_at = timezone.now()
+        store.save(update_fields=["deleted_at"])
+        # The sales of the store leave the aggregations at once
+        SalesDailyRollup.objects.filter(store=store).delete()
+        return _get_or_queue_purge_job(PurgeTargets.STORE, store.pk, store.name, store.owner_id)
+
+
+def delete_product(product: Product) -> PurgeJob:
+    """
+    Deletes a product. 
+    
+    The product is hidden at once, and it is purged from the database, 
+    along with its sales, by a background job.
+
+    :return: The job that purges the product.
+    """
+    with transaction.atomic():
+        product.deleted_at = timezone.now()
+        # The deleted product is not a copy of products added after it
+        product.fingerprint = None
+        product.save(update_fields=["deleted_at", "fingerprint"])
+        # The sales of the product leave the aggregations at once
+        SalesDailyRollup.remove_sales(Sale.objects.filter(product=product))
+        columnar.invalidate_sales(product.store_id)
+        owner_pk = Store.all_objects.filter(pk=product.store_id).values_list("owner_id", flat=True).get()
+        return _get_or_queue_purge_job(PurgeTargets.PRODUCT, product.pk, product.name, owner_pk)
+
+
+def _get_or_queue_purge_job(target: str, object_pk: Any, object_name: str, owner_pk: Any) -> PurgeJob:
+    """Returns the purge job of the object, creating it and queueing it once the current transaction is committed."""
+    from .jobs import queue_purge_job
+
+    job, created = PurgeJob.objects.get_or_create(
+        target=target, object_id=object_pk, defaults={"object_name": object_name, "owner_id": owner_pk}
+    )
+    if created:
+        queue_purge_job(job)
+    return job
+
+
+def _remove_report_files(report_jobs: QuerySet) -> None:
+    for result_path in report_jobs.exclude(result_path="").values_list("result_path", flat=True):
+        if os.path.exists(result_path):
+            os.remove(result_path)
+    return None
+
+
+def _remove_products_from_search(products: QuerySet) -> None:
+    remove_products_from_search(products.values_list("pk", flat=True))
+    return None
+
+
+def get_purge_steps(job: PurgeJob) -> List[PurgeStep]:
+    """
+    Returns the steps of a purge job, in the order they are run, such that 
+    objects are deleted before the objects they depend on.
+    """
+    if job.target == PurgeTargets.PRODUCT:
+        return [
+            # The sales were removed from the rollups when the product was deleted
+            ("sales", Sale.objects.filter(product_id=job.object_id), None),
+        ]
+    
+    store_pk = job.object_id
+    return [
+        # The rollups of the store were deleted with the store, so its sales are not removed from them
+        ("sales", Sale.objects.filter(store_id=store_pk), None),
+        ("sales daily rollups", SalesDailyRollup.objects.filter(store_id=store_pk), None),
+        ("checkouts", Checkout.objects.filter(store_id=store_pk), None),
+        ("report jobs", ReportJob.objects.filter(store_id=store_pk), _remove_report_files),
+        ("products", Product.all_objects.filter(store_id=store_pk), _remove_products_from_search),
+        ("product brands", ProductBrand.objects.filter(store_id=store_pk), None),
+        ("product groups", ProductGroup.objects.filter(store_id=store_pk), None),
+    ]
+
+
+def _delete_batch(queryset: QuerySet, batch_size: int, before_delete: Callable[[QuerySet], None] | None) -> int:
+    """Deletes a batch of the objects of the queryset, by primary key. Returns the number of objects deleted."""
+    pks = list(queryset.order_by().values_list("pk", flat=True)[:batch_size])
+    if not pks:
+        return 0
+    model = queryset.model
+    if before_delete is not None:
+        before_delete(model._base_manager.filter(pk__in=pks))
+    # Delete the batch without loading its objects, or sending signals for each of them, 
+    # as `QuerySet.delete` does. Objects that depend on the batch are deleted in earlier steps.
+    connection = connections[queryset.db]
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote_name(model._meta.db_table)} "
+            f"WHERE {quote_name(model._meta.pk.column)} IN ({', '.join(['%s'] * len(pks))})",
+            [ model._meta.pk.get_db_prep_value(pk, connection) for pk in pks ],
+        )
+        return cursor.rowcount
+
+
+def _claim_purge_job(job_pk: Any) -> bool:
+    """
+    Marks a purge job as running, if it is pending, has failed, or was lost while running. 
+    Returns whether the job was claimed, so that a job is not run by two workers at once.
+    """
+    lost_before = timezone.now() - timedelta(seconds=settings.PURGE_JOB_TIMEOUT)
+    claimable = Q(status__in=(PurgeJobStatus.PENDING, PurgeJobStatus.FAILED)) | Q(
+        status=PurgeJobStatus.RUNNING, updated_at__lt=lost_before
+    )
+    return bool(
+        PurgeJob.objects.filter(claimable, pk=job_pk).update(status=PurgeJobStatus.RUNNING, updated_at=timezone.now())
+    )
+
+
+def run_purge_job(job_pk: Any, batch_size: int = None) -> PurgeJob:
+    """
+    Runs a purge job, deleting the objects that depend on the job's target in batches, then the target.
+
+    A job that was interrupted, or that failed, continues from where it stopped. A job that is
+    completed, or that is running elsewhere, is not run.
+
+    :param job_pk: The primary key of the job.
+    :param batch_size: The number of objects deleted at a time. Defaults to the `PURGE_BATCH_SIZE` setting.
+    :return: The job.
+    """
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    if not _claim_purge_job(job_pk):
+        return PurgeJob.objects.get(pk=job_pk)
+    
+    job = PurgeJob.objects.get(pk=job_pk)
+    model = Store if job.target == PurgeTargets.STORE else Product
+    target = model.all_objects.filter(pk=job.object_id).first()
+    steps = get_purge_steps(job)
+    job.started_at = job.started_at or timezone.now()
+    job.error = ""
+    job.total_count = job.deleted_count + sum(queryset.count() for _, queryset, _ in steps) + int(target is not None)
+    job.save(update_fields=["started_at", "error", "total_count", "updated_at"])
+
+    try:
+        for label, queryset, before_delete in steps:
+            while True:
+                # Each batch is deleted with the job's progress, so the job can be resumed after any batch
+                with transaction.atomic():
+                    deleted = _delete_batch(queryset, batch_size, before_delete)
+                    if not deleted:
+                        break
+                    job.deleted_counts[label] = job.deleted_counts.get(label, 0) + deleted
+                    job.progress = min(99, job.deleted_count * 100 // max(job.total_count, 1))
+                    job.save(update_fields=["deleted_counts", "progress", "updated_at"])
+        
+        if target is not None:
+            with transaction.atomic():
+                # Nothing depends on the target anymore, so this only deletes the target
+                target.delete()
+                columnar.invalidate_sales(target.pk if job.target == PurgeTargets.STORE else target.store_id)
+                job.deleted_counts[job.target] = 1
+        job.status = PurgeJobStatus.COMPLETED
+        job.progress = 100
+    except Exception as exc:
+        logger.exception("Purge job %s failed", job.pk)
+        job.status = PurgeJobStatus.FAILED
+        job.error = str(exc)
+
+    job.completed_at = timezone.now()
+    job.save(update_fields=["status", "progress", "deleted_counts", "error", "completed_at", "updated_at"])
+    return job
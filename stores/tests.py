@@ -1,3 +1,474 @@
-from django.test import TestCase
+import io
+import json
+import tempfile
+from decimal import Decimal
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
+from django.http import Http404, HttpRequest, HttpResponse
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from djmoney.money import Money
+from djmoney.contrib.exchange.models import ExchangeBackend, get_default_backend_name
+from djmoney.contrib.exchange.exceptions import MissingRate
 
-# Create your tests here.
+from users.models import UserAccount
+from products.models import Product
+from products.views import ProductListView
+from sales.models import Sale, SalesDailyRollup
+from sales.utils import aggregate_sales_count
+from sales.views import sale_queryset
+from .models import Store, PurgeJobStatus
+from .exchange import ExchangeRates, exchange_rates, convert_money, get_conversion_expression
+from .utils import get_request_store, annotate_store_summaries
+from .views import StoreListView
+from . import jobs, purge
+
+
+class ExchangeRatesTestCase(TestCase):
+    """Checks the conversions of the in-process exchange rates cache, and when its rates are reloaded."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.backend = ExchangeBackend.objects.create(name=get_default_backend_name(), base_currency="USD")
+        cls.backend.rates.create(currency="NGN", value=1000)
+        cls.backend.rates.create(currency="EUR", value=Decimal("0.5"))
+
+
+    def setUp(self):
+        exchange_rates.invalidate()
+        self.addCleanup(exchange_rates.invalidate)
+
+
+    def test_cross_rates(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(exchange_rates.get_rate("EUR", "NGN"), 2000)
+            self.assertEqual(exchange_rates.get_rate("NGN", "EUR"), Decimal("0.0005"))
+            self.assertEqual(exchange_rates.get_rate("USD", "NGN"), 1000)
+            self.assertEqual(exchange_rates.get_rate("GBP", "GBP"), 1)
+            self.assertEqual(exchange_rates.get_rates_to("NGN"), {"NGN": 1, "USD": 1000, "EUR": 2000})
+            self.assertEqual(convert_money(Money(3, "EUR"), "USD"), Money(6, "USD"))
+        with self.assertRaises(MissingRate):
+            exchange_rates.get_rate("GBP", "NGN")
+        self.assertEqual(exchange_rates.get_rates_to("GBP"), {"GBP": 1})
+
+
+    def test_rates_are_reloaded_once_stale(self):
+        rates = ExchangeRates(ttl=60)
+        with mock.patch("stores.exchange.time.monotonic", return_value=1000):
+            self.assertEqual(rates.get_rate("USD", "NGN"), 1000)
+        # Changes made without saving the rates, which would invalidate the global cache only
+        self.backend.rates.filter(currency="NGN").update(value=1500)
+        self.backend.rates.create(currency="GBP", value=Decimal("0.8"))
+
+        with mock.patch("stores.exchange.time.monotonic", return_value=1060), self.assertNumQueries(0):
+            self.assertEqual(rates.get_rate("USD", "NGN"), 1000)
+        with mock.patch("stores.exchange.time.monotonic", return_value=1061):
+            self.assertEqual(rates.get_rate("USD", "NGN"), 1500)
+            self.assertEqual(rates.get_rate("GBP", "NGN"), 1875)
+
+
+    def test_saving_rates_invalidates_the_rates(self):
+        self.assertEqual(exchange_rates.get_rate("USD", "NGN"), 1000)
+        rate = self.backend.rates.get(currency="NGN")
+        rate.value = 1500
+        with self.captureOnCommitCallbacks(execute=True):
+            rate.save()
+        self.assertEqual(exchange_rates.get_rate("USD", "NGN"), 1500)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rate.delete()
+        with self.assertRaises(MissingRate):
+            exchange_rates.get_rate("USD", "NGN")
+
+
+    def test_conversion_expression(self):
+        user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        store = Store.objects.create(name="Test Store", owner=user)
+        Product.objects.create(name="Rice", price=Money(2000, "NGN"), store=store)
+        Product.objects.create(name="Beans", price=Money(3, "EUR"), store=store)
+        Product.objects.create(name="Yam", price=Money(5, "GBP"), store=store)
+
+        prices = dict(
+            Product.objects.annotate(converted_price=get_conversion_expression("price", "USD")).values_list("name", "converted_price")
+        )
+        self.assertEqual(prices, {"Rice": 2, "Beans": 6, "Yam": None})
+
+
+    def test_loadrates_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as fixture:
+            json.dump({"base": "EUR", "rates": {"NGN": 1600.5, "USD": 2}}, fixture)
+            fixture.flush()
+            self.assertEqual(exchange_rates.get_rate("EUR", "NGN"), 2000)
+            call_command("loadrates", fixture.name, stdout=io.StringIO())
+
+        self.backend.refresh_from_db()
+        self.assertEqual(self.backend.base_currency, "EUR")
+        self.assertEqual(dict(self.backend.rates.values_list("currency", "value")), {"NGN": Decimal("1600.5"), "USD": 2})
+        self.assertEqual(exchange_rates.get_rate("EUR", "NGN"), Decimal("1600.5"))
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as fixture:
+            json.dump({"rates": {"NGN": 1000}}, fixture)
+            fixture.flush()
+            with self.assertRaises(CommandError):
+                call_command("loadrates", fixture.name, stdout=io.StringIO())
+
+
+
+class StoreProductsPricesUpdateTestCase(TestCase):
+    """Checks that the prices of a store's products are converted when the store's default currency changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        backend = ExchangeBackend.objects.create(name=get_default_backend_name(), base_currency="USD")
+        backend.rates.create(currency="USD", value=1)
+        backend.rates.create(currency="NGN", value=1000)
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user, default_currency="NGN")
+        cls.rice = Product.objects.create(name="Rice", price=Money(2000, "NGN"), quantity=10, store=cls.store)
+        cls.beans = Product.objects.create(name="Beans", price=Money(3, "USD"), quantity=10, store=cls.store)
+
+
+    def setUp(self):
+        exchange_rates.invalidate()
+        self.addCleanup(exchange_rates.invalidate)
+
+
+    def test_prices_are_converted(self):
+        self.store.default_currency = "USD"
+        self.store.save()
+
+        self.rice.refresh_from_db()
+        self.beans.refresh_from_db()
+        self.assertEqual(self.rice.price, Money(2, "USD"))
+        self.assertEqual(self.rice.lifetime_revenue, Money(0, "USD"))
+        self.assertEqual(self.rice.fingerprint, self.rice.get_fingerprint())
+        self.assertEqual(self.beans.price, Money(3, "USD"))
+
+
+    def test_converted_copies_are_not_fingerprinted(self):
+        copy = Product.objects.create(name="Rice", price=Money(2, "USD"), quantity=5, store=self.store)
+        self.store.default_currency = "USD"
+        self.store.save()
+
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.price, copy.price)
+        self.assertIsNone(self.rice.fingerprint)
+        self.assertEqual(Product.objects.get(pk=copy.pk).fingerprint, copy.fingerprint)
+
+
+    def test_missing_rate_prevents_the_change(self):
+        self.store.default_currency = "EUR"
+        with self.assertRaises(MissingRate):
+            self.store.save()
+
+        self.assertEqual(Store.objects.get(pk=self.store.pk).default_currency, "NGN")
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.price, Money(2000, "NGN"))
+
+
+    def test_large_catalogs_are_updated_in_the_background(self):
+        self.store.default_currency = "USD"
+        with self.settings(STORE_REPRICING_JOB_THRESHOLD=1), self.captureOnCommitCallbacks() as callbacks:
+            self.store.save()
+        self.assertTrue(callbacks)
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.price, Money(2000, "NGN"))
+
+        self.assertEqual(Store.objects.get(pk=self.store.pk).repricing_currency, "USD")
+
+        self.assertTrue(jobs.update_products_prices(self.store.pk, "USD"))
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.price, Money(2, "USD"))
+        self.assertIsNone(Store.objects.get(pk=self.store.pk).repricing_currency)
+
+
+    def test_background_updates_are_resumed_after_a_missing_rate(self):
+        self.store.default_currency = "USD"
+        with self.settings(STORE_REPRICING_JOB_THRESHOLD=1), self.captureOnCommitCallbacks():
+            self.store.save()
+        # The rate is removed after the change, but before the prices are converted
+        ExchangeBackend.objects.get().rates.filter(currency="NGN").delete()
+        exchange_rates.invalidate()
+
+        with self.assertLogs("stores.jobs", "ERROR"):
+            self.assertFalse(jobs.update_products_prices(self.store.pk, "USD"))
+        store = Store.objects.get(pk=self.store.pk)
+        self.assertEqual(store.repricing_currency, "USD")
+        self.assertTrue(store.repricing_error)
+        request = RequestFactory().get("/")
+        request.user = self.user
+        response = StoreListView.as_view()(request)
+        self.assertContains(response, "Product prices could not be converted to USD")
+
+        ExchangeBackend.objects.get().rates.create(currency="NGN", value=1000)
+        exchange_rates.invalidate()
+        stdout = io.StringIO()
+        call_command("resumerepricing", stdout=stdout)
+        self.assertIn("Converted the products prices of 1 stores, 0 failed", stdout.getvalue())
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.price, Money(2, "USD"))
+        store.refresh_from_db()
+        self.assertEqual((store.repricing_currency, store.repricing_error), (None, ""))
+
+
+
+class RequestStoreTestCase(TestCase):
+    """Checks that the store of a store-scoped request is loaded once, and shared by the view's mixins."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=10, store=cls.store)
+
+
+    def test_store_is_loaded_once(self):
+        request = RequestFactory().get("/", {"min_price": 10, "max_price": 500})
+        request.user = self.user
+        view = ProductListView()
+        view.setup(request, store_slug=self.store.slug)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(request.store, self.store)
+            view.object_list = view.get_queryset()
+            view.get_context_data()
+        store_queries = [ query["sql"] for query in context.captured_queries if 'FROM "stores_store"' in query["sql"] ]
+        self.assertEqual(len(store_queries), 1)
+        self.assertIn('"products_product"."store_id" =', str(view.object_list.query))
+        self.assertNotIn('"stores_store"."slug" =', str(view.object_list.query))
+        self.assertIs(view.get_store(), get_request_store(request, "pk", self.store.pk))
+
+
+    def test_missing_store(self):
+        request = RequestFactory().get("/")
+        ProductListView().setup(request, store_slug="missing")
+        with self.assertRaises(Http404):
+            request.store.pk
+
+
+
+class StoreListViewTestCase(TestCase):
+    """Checks that the store list view summarizes the products and sales of each store in one query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        backend = ExchangeBackend.objects.create(name=get_default_backend_name(), base_currency="USD")
+        backend.rates.create(currency="USD", value=1)
+        backend.rates.create(currency="NGN", value=1000)
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user, default_currency="NGN")
+        cls.empty_store = Store.objects.create(name="Empty Store", owner=cls.user, default_currency="USD")
+        rice = Product.objects.create(name="Rice", price=Money(1000, "NGN"), quantity=10, store=cls.store)
+        beans = Product.objects.create(name="Beans", price=Money(2, "USD"), quantity=5, store=cls.store)
+        Sale.objects.create(store=cls.store, product=rice, quantity=2)
+        cls.last_sale = Sale.objects.create(store=cls.store, product=beans, quantity=1)
+
+
+    def setUp(self):
+        exchange_rates.invalidate()
+        self.addCleanup(exchange_rates.invalidate)
+
+
+    def test_store_summaries(self):
+        request = RequestFactory().get("/")
+        request.user = self.user
+        view = StoreListView()
+        view.setup(request)
+        view.object_list = view.get_queryset()
+
+        with self.assertNumQueries(3):
+            context = view.get_context_data()
+            stores = { store.pk: store for store in context["stores"] }
+        self.assertEqual(context["stores_count"], 2)
+        self.assertEqual(context["types_count"], 1)
+
+        store = stores[self.store.pk]
+        self.assertEqual(store.products_count, 2)
+        # 8 Rice and 4 Beans are left in stock
+        self.assertEqual(store.stock_value, Decimal("16000"))
+        self.assertEqual(store.todays_sales_count, 2)
+        self.assertEqual(store.todays_revenue, Decimal("4000"))
+        self.assertEqual(store.last_sale_at, Sale.objects.get(pk=self.last_sale.pk).made_at)
+        self.assertEqual(store.unconverted_products_count, 0)
+        self.assertEqual(store.unconverted_todays_sales_count, 0)
+
+        empty_store = stores[self.empty_store.pk]
+        self.assertEqual(empty_store.products_count, 0)
+        self.assertIsNone(empty_store.stock_value)
+        self.assertEqual(empty_store.todays_sales_count, 0)
+        self.assertIsNone(empty_store.last_sale_at)
+
+
+    def test_store_summaries_flag_amounts_with_no_rate(self):
+        # There is no exchange rate for GBP
+        tea = Product.objects.create(name="Tea", price=Money(3, "GBP"), quantity=4, store=self.store)
+        Sale.objects.create(store=self.store, product=tea, quantity=1)
+        request = RequestFactory().get("/")
+        request.user = self.user
+
+        response = StoreListView.as_view()(request)
+        response.render()
+        store = next(store for store in response.context_data["stores"] if store.pk == self.store.pk)
+        self.assertEqual(store.stock_value, Decimal("16000"))
+        self.assertEqual(store.todays_revenue, Decimal("4000"))
+        self.assertEqual(store.todays_sales_count, 3)
+        self.assertEqual(store.unconverted_products_count, 1)
+        self.assertEqual(store.unconverted_todays_sales_count, 1)
+        self.assertContains(
+            response, "Amounts with no exchange rate to NGN are left out of the stock value (1 product) and the revenue (1 sale)."
+        )
+
+
+
+class StoreAuthorizationTestCase(TestCase):
+    """Checks that store authorizations are kept in signed, expiring cookies that are revoked with the store's signature."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.store.set_passkey("1234")
+        cls.store.save()
+        cls.other_store = Store.objects.create(name="Other Store", owner=cls.user)
+        cls.other_store.set_passkey("1234")
+        cls.other_store.save()
+
+
+    def setUp(self):
+        self.session = SessionStore()
+        self.session.create()
+
+
+    def authorize(self, passkey: str, **kwargs) -> HttpResponse:
+        request = RequestFactory().post("/")
+        request.user = self.user
+        request.session = self.session
+        response = HttpResponse()
+        self.assertEqual(self.store.authorize_request(request, passkey, response, **kwargs), passkey == "1234")
+        return response
+
+
+    def get_request(self, response: HttpResponse, cookie_name: str = None, session=None) -> HttpRequest:
+        request = RequestFactory().get("/")
+        request.user = self.user
+        request.session = session or SessionStore(self.session.session_key)
+        for name, cookie in response.cookies.items():
+            request.COOKIES[cookie_name or name] = cookie.value
+        return request
+
+
+    def test_authorized_request(self):
+        request = self.get_request(self.authorize("1234"))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.store.check_request_is_authorized(request))
+        
+        self.assertFalse(self.store.check_request_is_authorized(self.get_request(self.authorize("wrong"))))
+        # The authorization of one store does not authorize another
+        request = self.get_request(self.authorize("1234"), self.other_store.get_authorization_cookie_name())
+        self.assertFalse(self.other_store.check_request_is_authorized(request))
+
+
+    def test_expired_authorization(self):
+        request = self.get_request(self.authorize("1234", authorize_for_days=0))
+        self.assertFalse(self.store.check_request_is_authorized(request))
+
+
+    def test_authorization_is_bound_to_the_session(self):
+        response = self.authorize("1234")
+        other_session = SessionStore()
+        other_session.create()
+        self.assertFalse(self.store.check_request_is_authorized(self.get_request(response, session=other_session)))
+
+
+    def test_logging_out_revokes_authorizations(self):
+        self.client.force_login(self.user)
+        request = RequestFactory().post("/")
+        request.user = self.user
+        request.session = self.client.session
+        response = HttpResponse()
+        self.assertTrue(self.store.authorize_request(request, "1234", response))
+        cookie_name = self.store.get_authorization_cookie_name()
+        self.client.cookies[cookie_name] = response.cookies[cookie_name].value
+
+        logout_response = self.client.get(reverse("users:signout"))
+        self.assertEqual(logout_response.cookies[cookie_name].value, "")
+        # A kept copy of the cookie does not authorize the sessions of later logins
+        self.client.force_login(self.user)
+        request = self.get_request(response, session=self.client.session)
+        self.assertFalse(self.store.check_request_is_authorized(request))
+
+
+    def test_changing_the_signature_revokes_authorizations(self):
+        request = self.get_request(self.authorize("1234"))
+        self.store.change_signature()
+        self.assertFalse(self.store.check_request_is_authorized(request))
+
+
+
+class PurgeTestCase(TestCase):
+    """Checks that deleted stores and products are hidden at once, then purged in batches by resumable jobs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserAccount.objects.create_user("owner@example.com", "password", firstname="Store", lastname="Owner")
+        cls.store = Store.objects.create(name="Test Store", owner=cls.user)
+        cls.rice = Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=20, store=cls.store)
+        cls.beans = Product.objects.create(name="Beans", price=Money(50, "NGN"), quantity=20, store=cls.store)
+        for _ in range(3):
+            Sale.objects.create(store=cls.store, product=cls.rice, quantity=1)
+        Sale.objects.create(store=cls.store, product=cls.beans, quantity=2)
+
+
+    def test_delete_product(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = purge.delete_product(self.rice)
+        self.assertTrue(callbacks)
+        self.assertFalse(Product.objects.filter(pk=self.rice.pk).exists())
+        self.assertFalse(self.store.products.filter(pk=self.rice.pk).exists())
+        # The sales of the product leave the aggregations at once
+        self.assertEqual(SalesDailyRollup.objects.filter(store=self.store).get().count, 1)
+        self.assertEqual(aggregate_sales_count(self.user, from_time="00:00:01"), 1)
+        self.assertEqual(annotate_store_summaries(Store.objects.all(), self.user.timezone).get().todays_sales_count, 1)
+        self.assertEqual(sale_queryset.filter(store=self.store).count(), 1)
+        # The product can be added again while it is purged
+        Product.objects.create(name="Rice", price=Money(100, "NGN"), quantity=5, store=self.store)
+
+        job = purge.run_purge_job(job.pk, batch_size=2)
+        self.assertEqual(job.status, PurgeJobStatus.COMPLETED)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.deleted_counts, {"sales": 3, "product": 1})
+        self.assertFalse(Product.all_objects.filter(pk=self.rice.pk).exists())
+        self.assertEqual(Sale.objects.filter(store=self.store).count(), 1)
+        self.assertEqual(SalesDailyRollup.objects.filter(store=self.store).get().count, 1)
+
+
+    def test_delete_store(self):
+        job = purge.delete_store(self.store)
+        self.assertFalse(Store.objects.filter(pk=self.store.pk).exists())
+        self.assertFalse(SalesDailyRollup.objects.filter(store_id=self.store.pk).exists())
+        self.assertEqual(aggregate_sales_count(self.user, from_time="00:00:01"), 0)
+        # The name of the store can be reused while it is purged
+        Store.objects.create(name="Test Store", owner=self.user)
+
+        with (
+            mock.patch.object(purge, "remove_products_from_search", side_effect=RuntimeError("Interrupted")),
+            self.assertLogs("stores.purge", "ERROR"),
+        ):
+            job = purge.run_purge_job(job.pk, batch_size=3)
+        self.assertEqual(job.status, PurgeJobStatus.FAILED)
+        self.assertEqual(job.deleted_counts["sales"], 4)
+        self.assertEqual(Product.all_objects.filter(store=self.store).count(), 2)
+
+        # The job is resumed from where it stopped
+        job = purge.run_purge_job(job.pk, batch_size=3)
+        self.assertEqual(job.status, PurgeJobStatus.COMPLETED)
+        self.assertEqual(job.deleted_counts["sales"], 4)
+        self.assertEqual(job.deleted_counts["products"], 2)
+        self.assertEqual(job.deleted_counts["store"], 1)
+        self.assertEqual(job.total_count, job.deleted_count)
+        self.assertFalse(Store.all_objects.filter(pk=self.store.pk).exists())
+        self.assertFalse(SalesDailyRollup.objects.filter(store_id=self.store.pk).exists())
@@ -1,7 +1,16 @@
-from typing import List
+from typing import Any, Dict, List
+import zoneinfo
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Max, OuterRef, QuerySet, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.http import HttpRequest
+from django.utils import timezone
 
 from users.models import UserAccount
+from users.utils import get_local_date_range_filters
 from stores.models import Store
+from stores.exchange import exchange_rates, get_conversion_expression
+from products.models import Product
+from sales.models import Sale
 import uuid
 
 
@@ -29,3 +38,111 @@ def filter_store_pks_for_user(user: UserAccount, store_pks: List[str | uuid.UUID
         return list(Store.objects.filter(owner=user).values_list("pk", flat=True))
     return list(Store.objects.filter(owner=user, pk__in=store_pks).values_list("pk", flat=True))
 
+
+
+def get_request_store(request: HttpRequest, identifier: str, value: Any) -> Store | None:
+    """
+    Returns the store whose `identifier` field has the given value, 
+    loading it from the database only once per request.
+
+    The store is cached on the request, by both its primary key and slug, so that
+    decorators, mixins and views resolving the same store during a request share it.
+
+    :param request: The request the store is resolved for.
+    :param identifier: The name of the store field holding the value. "pk" or "slug".
+    :param value: The value of the store's identifier.
+    :return: The store, or None if there is no such store.
+    """
+    if value is None:
+        return None
+    cache: Dict[tuple, Store | None] = request.__dict__.setdefault("_stores_cache", {})
+    key = (identifier, str(value))
+    if key not in cache:
+        store = Store.objects.filter(**{identifier: value}).first()
+        cache[key] = store
+        if store is not None:
+            cache[("pk", str(store.pk))] = cache[("slug", store.slug)] = store
+    return cache[key]
+
+
+def _get_store_subquery(queryset: QuerySet, value: Any, output_field: Any) -> Subquery:
+    """Returns a subquery of the `value` aggregate of the queryset, for the store in the outer query."""
+    return Subquery(
+        queryset.filter(store=OuterRef("pk")).order_by().values("store").annotate(value=value).values("value"),
+        output_field=output_field,
+    )
+
+
+def annotate_store_summaries(stores: QuerySet, tz: zoneinfo.ZoneInfo) -> QuerySet:
+    """
+    Annotates a queryset of stores with a summary of their products and sales, computed in the database
+    with correlated subqueries, so the stores' products and sales are never loaded.
+
+    Each store is annotated with:
+    - `products_count`: The number of products in the store.
+    - `stock_value`: The value of the products in stock, in the store's default currency.
+    - `todays_sales_count`: The number of sales made today, in the given timezone.
+    - `todays_revenue`: The revenue made today, in the store's default currency.
+    - `last_sale_at`: When the last sale was made, or None if no sale has been made.
+    - `unconverted_products_count`: The number of products in stock whose value is left out of `stock_value`.
+    - `unconverted_todays_sales_count`: The number of sales made today whose amount is left out of `todays_revenue`.
+
+    Amounts are converted to the default currency of each store with the in-process exchange rates cache.
+    Amounts in currencies with no exchange rate are left out, and counted in the `unconverted_*` annotations.
+
+    :param stores: The stores to annotate.
+    :param tz: The timezone that decides what "today" is.
+    """
+    decimal_field = DecimalField(max_digits=24, decimal_places=2)
+    # The sales of deleted products are left out
+    sales = Sale.objects.filter(product__deleted_at__isnull=True)
+    todays_sales = sales.filter(
+        **get_local_date_range_filters("made_at", tz, date=timezone.now().astimezone(tz).date())
+    )
+    # Money is converted in the query, to each default currency of the stores
+    currencies = list(stores.order_by().values_list("default_currency", flat=True).distinct())
+
+    def in_default_currency(queryset: QuerySet, field_name: str, multiplier: Any = 1) -> Case:
+        return Case(
+            *(
+                When(
+                    default_currency=currency, 
+                    then=_get_store_subquery(
+                        queryset, Sum(get_conversion_expression(field_name, currency) * multiplier), decimal_field
+                    )
+                )
+                for currency in currencies
+            ),
+            default=None,
+            output_field=decimal_field,
+        )
+
+    def count_unconverted(queryset: QuerySet, field_name: str) -> Coalesce:
+        return Coalesce(
+            Case(
+                *(
+                    When(
+                        default_currency=currency,
+                        then=_get_store_subquery(
+                            queryset.exclude(**{f"{field_name}_currency__in": list(exchange_rates.get_rates_to(currency))}),
+                            Count("pk"),
+                            IntegerField(),
+                        )
+                    )
+                    for currency in currencies
+                ),
+                default=None,
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+
+    return stores.annotate(
+        products_count=Coalesce(_get_store_subquery(Product.objects.all(), Count("pk"), IntegerField()), 0),
+        stock_value=in_default_currency(Product.objects.all(), "price", F("quantity")),
+        todays_sales_count=Coalesce(_get_store_subquery(todays_sales, Count("pk"), IntegerField()), 0),
+        todays_revenue=in_default_currency(todays_sales, "amount"),
+        last_sale_at=_get_store_subquery(sales, Max("made_at"), Sale._meta.get_field("made_at")),
+        unconverted_products_count=count_unconverted(Product.objects.filter(quantity__gt=0), "price"),
+        unconverted_todays_sales_count=count_unconverted(todays_sales, "amount"),
+    )
@@ -2,22 +2,26 @@ import json
 from typing import Any, Dict
 from django.http.response import HttpResponse
 from django.views import generic
+from django.db.models import Count, QuerySet
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import HttpResponse, JsonResponse
 from django.urls import reverse
 from django.shortcuts import get_object_or_404, redirect
 from djmoney.settings import CURRENCY_CHOICES
+from djmoney.contrib.exchange.exceptions import MissingRate
 
 
 from .models import Store, StoreTypes
 from .forms import StoreForm
+from .utils import annotate_store_summaries
+from .purge import delete_store
 from .decorators import to_JsonResponse
 from users.utils import parse_query_params_from_request
 from users.decorators import requires_password_verification, requires_account_verification
 from users.mixins import RequestUserQuerySetMixin
 
 
-stores_global_queryset = Store.objects.all().prefetch_related("products").select_related("owner")
+stores_global_queryset = Store.objects.all().select_related("owner")
 
 
 class StoreAuthorizationView(LoginRequiredMixin, generic.TemplateView):
@@ -65,15 +69,7 @@ class StoreAuthorizationView(LoginRequiredMixin, generic.TemplateView):
         store_passkey = data.get("passkey", None)
         store = get_object_or_404(Store, **query_params)
 
-        if not store.authorize_request(request, store_passkey):
-            return JsonResponse(
-                data={
-                    "status": "error",
-                    "detail": "Invalid Passkey"
-                },
-                status=401
-            )
-        return JsonResponse(
+        response = JsonResponse(
             data={
                 "status": "success",
                 "detail": "Authorization successful!",
@@ -81,6 +77,15 @@ class StoreAuthorizationView(LoginRequiredMixin, generic.TemplateView):
             },
             status=200
         )
+        if not store.authorize_request(request, store_passkey, response):
+            return JsonResponse(
+                data={
+                    "status": "error",
+                    "detail": "Invalid Passkey"
+                },
+                status=401
+            )
+        return response
 
 
 
@@ -108,9 +113,17 @@ class StoreListView(
     form_class = StoreForm
     user_field = "owner"
 
+    def get_queryset(self) -> QuerySet[Store]:
+        # Each store card shows a summary of the store's products and sales
+        return annotate_store_summaries(super().get_queryset(), self.request.user.timezone)
+    
+
     def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        context["types_count"] = self.get_queryset().values("type").distinct().count()
+        counts = super().get_queryset().order_by().aggregate(
+            stores_count=Count("pk"), types_count=Count("type", distinct=True)
+        )
+        context.update(counts)
         return context
 
 
@@ -201,7 +214,16 @@ class StoreUpdateView(
                         },
                         status=400
                     )
-            store.save()
+            try:
+                store.save()
+            except MissingRate:
+                return JsonResponse(
+                    data={
+                        "status": "error",
+                        "detail": f"Product prices cannot be converted to {store.default_currency} at the moment. Please try again later.",
+                    },
+                    status=400
+                )
 
             return JsonResponse(
                 data={
@@ -231,7 +253,8 @@ class StoreDeleteView(LoginRequiredMixin, generic.DetailView):
     @requires_password_verification
     def get(self, request, *args, **kwargs):
         store = self.get_object()
-        store.delete()
+        # The store is hidden at once, and purged in the background
+        delete_store(store)
         return redirect("stores:store_list")
     
 
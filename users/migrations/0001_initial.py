@@ -0,0 +1,51 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:46
+
+import django_utz.decorators.models.decorators
+import djmoney.models.fields
+import timezone_field.fields
+import users.managers
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAccount',
+            fields=[
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('username', models.CharField(blank=True, max_length=100, unique=True)),
+                ('firstname', models.CharField(max_length=50)),
+                ('lastname', models.CharField(max_length=50)),
+                ('email', models.EmailField(max_length=254, unique=True, verbose_name='email address')),
+                ('timezone', timezone_field.fields.TimeZoneField(default='Africa/Lagos', help_text='Choose your timezone.', verbose_name='timezone')),
+                ('preferred_currency', djmoney.models.fields.CurrencyField(default='NGN', max_length=3)),
+                ('is_active', models.BooleanField(default=True, verbose_name='active')),
+                ('is_admin', models.BooleanField(default=False, verbose_name='admin')),
+                ('is_staff', models.BooleanField(default=False, verbose_name='staff')),
+                ('is_superuser', models.BooleanField(default=False, verbose_name='superuser')),
+                ('is_verified', models.BooleanField(default=False, verbose_name='verified')),
+                ('registered_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'verbose_name': 'user account',
+                'verbose_name_plural': 'user accounts',
+            },
+            bases=(django_utz.decorators.models.decorators.UserModelUTZMixin, models.Model),
+            managers=[
+                ('objects', users.managers.UserAccountManager()),
+            ],
+        ),
+    ]
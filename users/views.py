@@ -149,7 +149,12 @@ class UserLogoutView(generic.RedirectView):
     def get(self, request: HttpRequest, *args: str, **kwargs: Any) -> None:
         if request.user.is_authenticated:
             logout(request)
-        return super().get(request, *args, **kwargs)
+        response = super().get(request, *args, **kwargs)
+        # Store authorizations are bound to the session that has ended, so their cookies are of no further use
+        for cookie_name in request.COOKIES:
+            if cookie_name.startswith(settings.STORE_AUTHORIZATION_COOKIE_PREFIX):
+                response.delete_cookie(cookie_name, samesite="Lax")
+        return response
 
 
 